@@ -7,6 +7,7 @@
 # Gunicorn configuration file
 # https://docs.gunicorn.org/en/stable/configure.html#configuration-file
 # https://docs.gunicorn.org/en/stable/settings.html
+from os import environ
 
 # needs ip set or will be unreachable from host
 # regardless of docker-run port mappings
@@ -17,3 +18,35 @@ timeout = 120
 
 # to prevent any memory leaks:
 max_requests = 1000
+
+# UPLOAD_API_SERVE_MODE picks a profile:
+#  - sync (default): a worker process serves one request at a time,
+#    so a slow upload (or a blocking graphql/celery call) holds a whole worker
+#  - evented: gevent workers, each serving up to UPLOAD_API_WORKER_CONNECTIONS
+#    requests at a time, a request waiting on the network yields to the others
+serve_mode = (environ.get("UPLOAD_API_SERVE_MODE") or "sync").lower()
+if serve_mode == "evented":
+    worker_class = "gevent"
+    # connections past this wait in the listen backlog
+    worker_connections = int(environ.get("UPLOAD_API_WORKER_CONNECTIONS") or 200)
+    # gevent workers heartbeat while requests are in flight, so timeout
+    # only restarts a worker whose event loop is stuck (e.g. by cpu bound work)
+elif serve_mode != "sync":
+    raise ValueError(f"unsupported UPLOAD_API_SERVE_MODE {serve_mode}")
+
+workers = int(environ.get("UPLOAD_API_WORKERS") or 1)
+# connections the kernel queues while every worker (or connection slot) is busy
+backlog = int(environ.get("UPLOAD_API_BACKLOG") or 2048)
+
+# a worker stopped or recycled (after max_requests) waits this long
+# for its requests and background upload jobs (e.g. a trim) before it's killed,
+# the jobs of a killed worker are recovered by the others
+graceful_timeout = int(environ.get("UPLOAD_API_GRACEFUL_TIMEOUT") or timeout)
+
+
+def post_worker_init(worker):
+    from mentor_upload_api.blueprints.upload.answer_queue import (
+        start_upload_job_recovery,
+    )
+
+    start_upload_job_recovery()
@@ -79,7 +79,7 @@ def upload_task_req_gql(req: UploadTaskRequest) -> GQLQueryBody:
     status["transcribeTask"] = req.transcribe_task
     if req.transcript:
         status["transcript"] = req.transcript
-    if req.originalMedia:
+    if req.original_media:
         status["originalMedia"] = req.original_media
 
     return {
@@ -164,7 +164,7 @@ def is_upload_in_progress(req: FetchUploadTaskReq) -> bool:
     res = requests.post(get_graphql_endpoint(), json=body, headers=headers)
     res.raise_for_status()
     tdjson = res.json()
-    validate_json(tdjson, fetch_upload_task_schema)
+    validate_json(tdjson, fetch_upload_task_schema, fast=True)
     if "errors" in tdjson:
         raise Exception(json.dumps(tdjson.get("errors")))
     return bool(tdjson["data"]["uploadTask"])
@@ -310,6 +310,12 @@ def fetch_answer_transcript_and_media(mentor: str, question: str):
     return (answer_data["transcript"], media)
 
 
+def fetch_text_from_url(url: str) -> str:
+    res = requests.get(url)
+    res.raise_for_status()
+    return res.text
+
+
 @dataclass
 class ImportTaskCreateGraphQLUpdate:
     status: str
@@ -76,6 +76,23 @@ authorize_edit_mentor_payload_schema = {
 }
 
 
+def verify_can_edit_mentor(mentor_being_edited: str) -> None:
+    """Aborts unless the JWT's issuer is the mentor being edited or an admin/content manager"""
+    jwt_payload = parse_payload_from_auth_header_jwt(request)
+
+    # Check if the requester is either editing their own mentor, or has permissions to edit other mentors
+    requester_mentorids = jwt_payload["mentorIds"]
+    requester_can_manage_content = (
+        jwt_payload["role"] == "CONTENT_MANAGER" or jwt_payload["role"] == "ADMIN"
+    )
+
+    if (
+        mentor_being_edited not in requester_mentorids
+        and not requester_can_manage_content
+    ):
+        abort(401)
+
+
 def authorize_to_edit_mentor(f):
     """Crosschecks JWTs mentorId with the mentor being edited, or validates that the editor is an admin/content manager"""
 
@@ -94,21 +111,7 @@ def authorize_to_edit_mentor(f):
             raise Exception("missing required param body")
 
         validate_json(json_body, authorize_edit_mentor_payload_schema)
-        mentor_being_edited = json_body["mentor"]
-
-        jwt_payload = parse_payload_from_auth_header_jwt(request)
-
-        # Check if the requester is either editing their own mentor, or has permissions to edit other mentors
-        requester_mentorids = jwt_payload["mentorIds"]
-        requester_can_manage_content = (
-            jwt_payload["role"] == "CONTENT_MANAGER" or jwt_payload["role"] == "ADMIN"
-        )
-
-        if (
-            mentor_being_edited not in requester_mentorids
-            and not requester_can_manage_content
-        ):
-            abort(401)
+        verify_can_edit_mentor(json_body["mentor"])
         return f(*args, **kws)
 
     return authorized_endpoint
@@ -0,0 +1,63 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+"""
+Runs slow work (e.g. trimming an upload) after the request
+that started it was answered, so it neither ties up a gunicorn worker
+nor runs into gunicorn's timeout.
+
+Work runs on a pool of UPLOAD_BACKGROUND_WORKERS threads per api process.
+The pool is joined when the process exits,
+so a gracefully stopped worker finishes the work it accepted.
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
+import logging
+from os import environ, register_at_fork
+import threading
+from typing import Callable, Optional
+
+log = logging.getLogger()
+
+_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_background_workers() -> int:
+    return int(environ.get("UPLOAD_BACKGROUND_WORKERS") or 2)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=get_background_workers(),
+                    thread_name_prefix="upload-background",
+                )
+    return _executor
+
+
+def _log_exceptions(fn: Callable, *args, **kwargs):
+    try:
+        return fn(*args, **kwargs)
+    except Exception as x:
+        log.exception(x)
+        raise
+
+
+def run_in_background(fn: Callable, *args, **kwargs) -> Future:
+    return _get_executor().submit(_log_exceptions, fn, *args, **kwargs)
+
+
+def reset_background_executor() -> None:
+    global _lock, _executor
+    _lock = threading.Lock()
+    _executor = None
+
+
+# threads don't survive a fork (e.g. gunicorn --preload)
+register_at_fork(after_in_child=reset_background_executor)
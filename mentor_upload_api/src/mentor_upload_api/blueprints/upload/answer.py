@@ -11,6 +11,8 @@ from datetime import datetime
 from dateutil import tz
 from flask import Blueprint, jsonify, request, send_from_directory
 from celery import group, chord
+from celery.exceptions import TimeoutError as TaskTimeoutError
+from werkzeug.exceptions import BadRequest
 
 
 from flask_wtf import FlaskForm
@@ -33,7 +35,10 @@ from mentor_upload_api.helpers import (
     validate_json_payload_decorator,
     validate_form_payload_decorator,
     ValidateFormJsonBody,
+    hash_file,
+    save_file_and_hash,
 )
+from mentor_upload_api.blueprints.upload.sessions import add_upload_session_routes
 
 log = logging.getLogger()
 req_log = logging.getLogger("request")
@@ -48,6 +53,47 @@ def get_upload_root() -> str:
     return environ.get("UPLOAD_ROOT") or "./uploads"
 
 
+def get_long_poll_max_seconds() -> float:
+    return float(environ.get("UPLOAD_LONG_POLL_MAX_SECONDS") or 20)
+
+
+def _long_poll_seconds() -> float:
+    """
+    How long a request asked (?wait=seconds) to wait for its task,
+    capped so a stuck worker can't hold api workers
+    """
+    try:
+        wait = float(request.args.get("wait") or 0)
+    except ValueError:
+        raise BadRequest("wait must be a number of seconds")
+    return min(max(wait, 0), get_long_poll_max_seconds())
+
+
+def _wait_for_task(t, wait: float) -> None:
+    if wait <= 0 or t.ready():
+        return
+    try:
+        # the redis result backend publishes a task's result on a channel
+        # of its own when it's done, so this sleeps until then (or the timeout)
+        t.get(timeout=wait, propagate=False, interval=0.5)
+    except TaskTimeoutError:
+        # stop listening for a result no one is waiting for anymore
+        t.backend.remove_pending_result(t)
+
+
+def _task_status_json(task_id: str, t) -> dict:
+    return {
+        "id": task_id,
+        "state": t.state or "NONE",
+        "status": t.status,
+        "info": None
+        if not t.info
+        else t.info
+        if isinstance(t.info, dict) or isinstance(t.info, list)
+        else str(t.info),
+    }
+
+
 def begin_tasks_in_parallel(req):
     parallel_group = group(
         mentor_upload_tasks.tasks.transcode_stage.s(req=req).set(
@@ -153,6 +199,7 @@ video_upload_json_schema = {
             "required": ["start", "end"],
         },
         "hasEditedTranscript": {"type": "boolean"},
+        "chunkedEncode": {"type": "boolean"},
     },
     "required": ["mentor", "question"],
     "additionalProperties": False,
@@ -200,12 +247,23 @@ def upload(body):
         },
     )
     makedirs(get_upload_root(), exist_ok=True)
-    upload_file.save(file_path)
+    content_hash = save_file_and_hash(upload_file, file_path)
+    return start_upload(body, file_path, content_hash)
+
+
+def start_upload(body: dict, file_path: str, content_hash: str):
+    """
+    Starts processing an upload saved to file_path in the upload root
+    """
+    mentor = body.get("mentor")
+    question = body.get("question")
     req = {
         "mentor": mentor,
         "question": question,
-        "video_path": file_name,
-        "trim": trim,
+        "video_path": path.basename(file_path),
+        "trim": body.get("trim"),
+        "chunked_encode": body.get("chunkedEncode"),
+        "content_hash": content_hash,
     }
     my_chord = begin_tasks_in_parallel(req)
 
@@ -257,10 +315,20 @@ def upload(body):
     )
 
 
+add_upload_session_routes(
+    answer_blueprint,
+    video_upload_json_schema,
+    lambda body, file_path: start_upload(body, file_path, hash_file(file_path)),
+)
+
+
 def list_files_from_directory(file_directory: str):
     files = []
     cali_tz = tz.gettz("America/Los_Angeles")
     for entry in scandir(file_directory):
+        if entry.name.startswith("."):
+            # e.g. the videos of upload sessions still in progress
+            continue
         files.append(
             {
                 "fileName": entry.name,
@@ -325,6 +393,8 @@ def full_video_file_name_from_directory(
 ):
     files = listdir(file_directory)
     for file_name in files:
+        if file_name.startswith("."):
+            continue
         # video file name format: uuid1-mentorID-questionID.mp4
         file_name_split = file_name.split("-")
         file_mentor = file_name_split[-2]
@@ -398,24 +468,13 @@ def task_status(task_name: str, task_id: str):
         t = mentor_upload_tasks.tasks.trim_upload_stage.AsyncResult(task_id)
     elif task_name == "finalization":
         t = mentor_upload_tasks.tasks.finalization_stage.AsyncResult(task_id)
+    elif task_name == "regen_vtt":
+        t = mentor_upload_tasks.tasks.regen_vtt.AsyncResult(task_id)
     else:
         logging.error(f"unrecognized task_name: {task_name}, id: {task_id}")
         raise Exception(f"unrecognized task_name: {task_name}")
-
-    return jsonify(
-        {
-            "data": {
-                "id": task_id,
-                "state": t.state or "NONE",
-                "status": t.status,
-                "info": None
-                if not t.info
-                else t.info
-                if isinstance(t.info, dict) or isinstance(t.info, list)
-                else str(t.info),
-            }
-        }
-    )
+    _wait_for_task(t, _long_poll_seconds())
+    return jsonify({"data": _task_status_json(task_id, t)})
 
 
 regen_vtt_json_schema = {
@@ -434,6 +493,11 @@ regen_vtt_json_schema = {
 @validate_json_payload_decorator(json_schema=regen_vtt_json_schema)
 @authorize_to_edit_mentor
 def regen_vtt(body):
+    """
+    Starts regenerating the vtt of an answer and returns its task,
+    with ?wait=seconds the request waits (a little) for it to be done,
+    otherwise poll (or long-poll) its statusUrl
+    """
     mentor = body.get("mentor")
     question = body.get("question")
     req = {
@@ -443,6 +507,12 @@ def regen_vtt(body):
     task = mentor_upload_tasks.tasks.regen_vtt.apply_async(
         queue=mentor_upload_tasks.get_queue_trim_upload_stage(), args=[req]
     )
-    result = task.wait(timeout=None, interval=0.5)
-
-    return jsonify({"data": result})
+    _wait_for_task(task, _long_poll_seconds())
+    return jsonify(
+        {
+            "data": {
+                **_task_status_json(task.id, task),
+                "statusUrl": _to_status_url(request.url_root, f"regen_vtt/{task.id}"),
+            }
+        }
+    )
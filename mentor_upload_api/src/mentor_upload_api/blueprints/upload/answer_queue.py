@@ -9,10 +9,13 @@ import tempfile
 from dateutil import tz
 import json
 import logging
+import math
 import uuid
 import boto3
 import os
 import ffmpy
+import threading
+import time
 from typing import Tuple, Union
 from os import environ, path, makedirs, remove, scandir
 from flask import Blueprint, jsonify, request, send_from_directory
@@ -21,10 +24,20 @@ from mentor_upload_api.api import (
     FetchUploadTaskReq,
     UploadTaskRequest,
     is_upload_in_progress,
+    upload_task_update,
     upload_answer_and_task_update,
     fetch_answer_transcript_and_media,
+    fetch_text_from_url,
 )
+from mentor_upload_api.background import run_in_background
 from mentor_upload_api.blueprints.upload.answer import video_upload_json_schema
+from mentor_upload_api.blueprints.upload.jobs import (
+    UploadJob,
+    get_upload_job_max_attempts,
+    get_upload_job_recovery_interval,
+    get_upload_job_store,
+)
+from mentor_upload_api.blueprints.upload.sessions import add_upload_session_routes
 from mentor_upload_api.helpers import (
     validate_form_payload_decorator,
     validate_json_payload_decorator,
@@ -35,7 +48,7 @@ from mentor_upload_api.authorization_decorator import (
     authorize_to_edit_mentor,
 )
 from pymediainfo import MediaInfo
-from werkzeug.exceptions import BadRequest
+from werkzeug.exceptions import BadRequest, HTTPException, NotFound
 from flask_wtf import FlaskForm
 from wtforms import StringField
 from wtforms.validators import DataRequired
@@ -150,7 +163,7 @@ def create_task_list(trim, has_edited_transcript):
         {
             "task_name": "trim-upload",
             "task_id": str(uuid.uuid4()),
-            "status": "DONE",  # should this even be a task because it's done here anyways
+            "status": "QUEUED",
         }
         if trim
         else None
@@ -159,8 +172,7 @@ def create_task_list(trim, has_edited_transcript):
     return transcode_web_task, transcode_mobile_task, transcribe_task, trim_upload_task
 
 
-def upload_to_s3(file_path, s3_path):
-    log.info("uploading %s to %s", file_path, s3_path)
+def delete_artifacts(s3_path):
     # to prevent data inconsistency by partial failures (new web.mp3 - old transcript...)
     all_artifacts = ["original.mp4", "web.mp4", "mobile.mp4", "en.vtt"]
     s3_client.delete_objects(
@@ -168,6 +180,10 @@ def upload_to_s3(file_path, s3_path):
         Delete={"Objects": [{"Key": f"{s3_path}/{name}"} for name in all_artifacts]},
     )
 
+
+def upload_to_s3(file_path, s3_path):
+    log.info("uploading %s to %s", file_path, s3_path)
+    delete_artifacts(s3_path)
     s3_client.upload_file(
         file_path,
         static_s3_bucket,
@@ -176,6 +192,16 @@ def upload_to_s3(file_path, s3_path):
     )
 
 
+def verify_video(minfo: MediaInfo) -> None:
+    if len(minfo.video_tracks) == 0:
+        raise BadRequest("No video tracks found!")
+    try:
+        if minfo.video_tracks[0].duration < 1000:  # 1sec
+            raise BadRequest("Video too short!")
+    except Exception as e:
+        log.info(f"Failed to check video duration: {e}")
+
+
 def verify_no_upload_in_progress(mentor, question):
     upload_in_progress = is_upload_in_progress(FetchUploadTaskReq(mentor, question))
     if upload_in_progress:
@@ -208,7 +234,6 @@ def upload(body):
 
     mentor = body.get("mentor")
     question = body.get("question")
-    has_edited_transcript = body.get("hasEditedTranscript")
     verify_no_upload_in_progress(mentor, question)
     trim = body.get("trim")
     upload_file = request.files["video"]
@@ -227,52 +252,32 @@ def upload(body):
     )
     makedirs(get_upload_root(), exist_ok=True)
     upload_file.save(file_path)
-    minfo = MediaInfo.parse(file_path)
-    if len(minfo.video_tracks) == 0:
-        raise BadRequest("No video tracks found!")
-    try:
-        if minfo.video_tracks[0].duration < 1000:  # 1sec
-            raise BadRequest("Video too short!")
-    except Exception as e:
-        log.info(f"Failed to check video duration: {e}")
+    return start_upload(body, file_path)
 
-    if trim:
-        log.info("trimming file %s", trim)
-        trim_file = f"{file_path}-trim.mp4"
-        video_trim(
-            file_path,
-            trim_file,
-            trim["start"],
-            trim["end"],
-        )
-        file_path = trim_file  # from now on work with the trimmed file
 
-    s3_path = f"videos/{mentor}/{question}"
-    upload_to_s3(file_path, s3_path)
+def start_upload(body: dict, file_path: str):
+    """
+    Starts processing an upload saved to file_path
+    """
+    return queue_upload(body, {"file": file_path})
 
+
+def queue_upload(body: dict, source: dict):
+    """
+    Registers the tasks of an upload and answers with them right away,
+    the upload (source, see UploadJob) is prepared and submitted
+    by a job in the background
+    """
+    mentor = body.get("mentor")
+    question = body.get("question")
+    tasks = create_task_list(body.get("trim"), body.get("hasEditedTranscript"))
     (
         transcode_web_task,
         transcode_mobile_task,
         transcribe_task,
         trim_upload_task,
-    ) = create_task_list(trim, has_edited_transcript)
-    task_list = [transcode_web_task, transcode_mobile_task]
-    if transcribe_task is not None:
-        task_list.append(transcribe_task)
-    if trim_upload_task is not None:
-        task_list.append(trim_upload_task)
-
-    req = {
-        "request": {
-            "mentor": mentor,
-            "question": question,
-            "video": f"{s3_path}/original.mp4",
-            "transcodeWebTask": transcode_web_task,
-            "transcodeMobileTask": transcode_mobile_task,
-            "trimUploadTask": trim_upload_task,
-            "transcribeTask": transcribe_task,
-        }
-    }
+    ) = tasks
+    task_list = [task for task in tasks if task is not None]
 
     original_video_url = get_original_video_url(mentor, question)
     # we risk here overriding values, perhaps processing was already done, so status is DONE
@@ -294,18 +299,445 @@ def upload(body):
             },
         ),
     )
-    submit_job(req)
+    job = UploadJob(
+        id=uuid.uuid4().hex, body=body, tasks=list(tasks), source=source, attempts=1
+    )
+    store = get_upload_job_store()
+    # claimed before it's recorded, so no other worker recovers it meanwhile
+    store.claim(job.id)
+    store.put(job)
+    run_in_background(run_upload_job, job)
 
     return jsonify(
         {
             "data": {
                 "taskList": task_list,
-                "statusUrl": _to_status_url(request.url_root, str(uuid.uuid4())),
+                "statusUrl": _to_status_url(request.url_root, job.id),
+            }
+        }
+    )
+
+
+@answer_queue_blueprint.route("/status/<job_id>/", methods=["GET"])
+@answer_queue_blueprint.route("/status/<job_id>", methods=["GET"])
+def upload_job_status(job_id: str):
+    job = get_upload_job_store().get(job_id)
+    if job is None:
+        raise NotFound(f"upload job {job_id} not found or expired")
+    return jsonify(
+        {
+            "data": {
+                "id": job.id,
+                "status": job.status,
+                "attempts": job.attempts,
+                "error": job.error,
+                "taskList": [task for task in job.tasks if task is not None],
             }
         }
     )
 
 
+def run_upload_job(job: UploadJob) -> None:
+    """
+    Runs a claimed job, recording how it finished
+    """
+    store = get_upload_job_store()
+    job.status = "IN_PROGRESS"
+    store.put(job)
+    try:
+        process_upload(job)
+    finally:
+        job.status = "FAILED" if job.error else "DONE"
+        store.put(job)
+        store.release(job.id)
+
+
+def fail_upload_job(job: UploadJob, error: str) -> None:
+    log.error(f"upload job {job.id} failed: {error}")
+    job.error = error
+    job.status = "FAILED"
+    for task in job.tasks:
+        if task is not None:
+            task["status"] = "FAILED"
+    try:
+        update_upload_tasks(job.body, job.tasks)
+    finally:
+        get_upload_job_store().put(job)
+
+
+def recover_upload_jobs() -> None:
+    """
+    Runs again the jobs of workers that died (their claims expired),
+    jobs interrupted too many times fail
+    """
+    store = get_upload_job_store()
+    for job_id in store.pending_ids():
+        job = store.get(job_id)
+        if job is None:
+            store.forget(job_id)
+            continue
+        if not store.claim(job_id):
+            # a live worker is running it
+            continue
+        if job.attempts >= get_upload_job_max_attempts():
+            try:
+                fail_upload_job(
+                    job, f"interrupted {job.attempts} times, e.g. by a worker restart"
+                )
+            finally:
+                store.release(job_id)
+            continue
+        log.info(f"recovering upload job {job_id} (attempt {job.attempts + 1})")
+        job.attempts += 1
+        job.status = "QUEUED"
+        store.put(job)
+        run_in_background(run_upload_job, job)
+
+
+def _recover_upload_jobs_forever() -> None:
+    while True:
+        try:
+            recover_upload_jobs()
+        except Exception as x:
+            log.exception(x)
+        time.sleep(get_upload_job_recovery_interval())
+
+
+def start_upload_job_recovery() -> None:
+    """
+    Recovers the jobs of dead workers now and every
+    UPLOAD_JOB_RECOVERY_INTERVAL seconds (see gunicorn.conf.py)
+    """
+    threading.Thread(
+        target=_recover_upload_jobs_forever, name="upload-job-recovery", daemon=True
+    ).start()
+
+
+def update_upload_tasks(body: dict, tasks: list) -> None:
+    (
+        transcode_web_task,
+        transcode_mobile_task,
+        transcribe_task,
+        trim_upload_task,
+    ) = tasks
+    upload_task_update(
+        UploadTaskRequest(
+            mentor=body.get("mentor"),
+            question=body.get("question"),
+            transcode_web_task=transcode_web_task,
+            transcode_mobile_task=transcode_mobile_task,
+            trim_upload_task=trim_upload_task,
+            transcribe_task=transcribe_task,
+        )
+    )
+
+
+def process_upload(job: UploadJob) -> None:
+    """
+    Runs in the background: prepares the job's upload (verifies it
+    and makes it the answer's original.mp4, trimmed),
+    then the processing job is submitted.
+    Reports through the upload's tasks (trim-upload, or all of them failing),
+    why it failed is the job's error
+    """
+    body = job.body
+    tasks = job.tasks
+    (
+        transcode_web_task,
+        transcode_mobile_task,
+        transcribe_task,
+        trim_upload_task,
+    ) = tasks
+    try:
+        if trim_upload_task:
+            trim_upload_task["status"] = "IN_PROGRESS"
+            update_upload_tasks(body, tasks)
+        if "key" in job.source:
+            prepare_multipart_upload(job.source["key"], body)
+        else:
+            prepare_local_upload(job.source["file"], body)
+        if trim_upload_task:
+            trim_upload_task["status"] = "DONE"
+            update_upload_tasks(body, tasks)
+        submit_job(
+            {
+                "request": {
+                    "mentor": body.get("mentor"),
+                    "question": body.get("question"),
+                    "video": f"videos/{body.get('mentor')}/{body.get('question')}/original.mp4",
+                    "transcodeWebTask": transcode_web_task,
+                    "transcodeMobileTask": transcode_mobile_task,
+                    "trimUploadTask": trim_upload_task,
+                    "transcribeTask": transcribe_task,
+                }
+            }
+        )
+    except Exception as x:
+        log.error(f"failed to process upload {body}")
+        log.exception(x)
+        job.error = x.description if isinstance(x, HTTPException) else str(x)
+        for task in tasks:
+            if task is not None:
+                task["status"] = "FAILED"
+        update_upload_tasks(body, tasks)
+
+
+def prepare_local_upload(file_path: str, body: dict) -> None:
+    verify_video(MediaInfo.parse(file_path))
+    trim = body.get("trim")
+    if trim:
+        log.info("trimming file %s", trim)
+        trim_file = f"{file_path}-trim.mp4"
+        video_trim(
+            file_path,
+            trim_file,
+            trim["start"],
+            trim["end"],
+        )
+        file_path = trim_file  # from now on work with the trimmed file
+    upload_to_s3(file_path, f"videos/{body.get('mentor')}/{body.get('question')}")
+
+
+add_upload_session_routes(
+    answer_queue_blueprint,
+    video_upload_json_schema,
+    start_upload,
+    verify_upload=lambda body: verify_no_upload_in_progress(
+        body.get("mentor"), body.get("question")
+    ),
+)
+
+
+# s3 limits of multipart uploads
+MULTIPART_MIN_PART_SIZE = 5 * 1024 * 1024
+MULTIPART_MAX_PARTS = 10000
+
+
+def get_multipart_part_size() -> int:
+    return int(environ.get("UPLOAD_MULTIPART_PART_SIZE") or 64 * 1024 * 1024)
+
+
+def get_multipart_url_expires() -> int:
+    return int(environ.get("UPLOAD_MULTIPART_URL_EXPIRES") or 6 * 60 * 60)
+
+
+def get_upload_max_bytes() -> int:
+    return int(environ.get("UPLOAD_MAX_BYTES") or 5 * 1024**3)
+
+
+def get_upload_probe_bytes() -> int:
+    return int(environ.get("UPLOAD_PROBE_BYTES") or 4 * 1024 * 1024)
+
+
+def multipart_upload_key(mentor: str, question: str, upload_id: str = "") -> str:
+    # uploads are staged next to the answer's media until they're verified
+    return f"videos/{mentor}/{question}/uploads/{upload_id}"
+
+
+def probe_s3_video(key: str, size: int) -> MediaInfo:
+    """
+    Probes a video in s3 without downloading all of it:
+    only its head and tail (where an mp4 without faststart has its metadata)
+    are fetched, into a sparse file the size of the video
+    """
+    probe_bytes = get_upload_probe_bytes()
+    ranges = [(0, min(size, probe_bytes) - 1)]
+    if size > probe_bytes:
+        ranges.append((max(probe_bytes, size - probe_bytes), size - 1))
+    with tempfile.NamedTemporaryFile(suffix=".mp4") as f:
+        f.truncate(size)
+        for start, end in ranges:
+            res = s3_client.get_object(
+                Bucket=static_s3_bucket, Key=key, Range=f"bytes={start}-{end}"
+            )
+            f.seek(start)
+            f.write(res["Body"].read())
+        f.flush()
+        return MediaInfo.parse(f.name)
+
+
+def copy_to_original(key: str, s3_path: str) -> None:
+    log.info("copying %s to %s", key, s3_path)
+    delete_artifacts(s3_path)
+    s3_client.copy(
+        {"Bucket": static_s3_bucket, "Key": key},
+        static_s3_bucket,
+        f"{s3_path}/original.mp4",
+        ExtraArgs={"ContentType": "video/mp4"},
+    )
+
+
+create_multipart_upload_json_schema = {
+    **video_upload_json_schema,
+    "properties": {
+        **video_upload_json_schema["properties"],
+        "size": {"type": "integer", "minimum": 1},
+    },
+    "required": video_upload_json_schema["required"] + ["size"],
+}
+
+
+@answer_queue_blueprint.route("/multipart/", methods=["POST"])
+@answer_queue_blueprint.route("/multipart", methods=["POST"])
+@validate_json_payload_decorator(json_schema=create_multipart_upload_json_schema)
+@authorize_to_edit_mentor
+def create_multipart_upload(body):
+    """
+    Starts a multipart upload of a video straight to s3,
+    the client PUTs every part to its presigned url
+    and then completes the upload with complete_multipart_upload
+    """
+    mentor = body.get("mentor")
+    question = body.get("question")
+    size = body.get("size")
+    verify_no_upload_in_progress(mentor, question)
+    if size > get_upload_max_bytes():
+        raise BadRequest(f"Video too large, max {get_upload_max_bytes()} bytes")
+    part_size = max(
+        get_multipart_part_size(),
+        MULTIPART_MIN_PART_SIZE,
+        math.ceil(size / MULTIPART_MAX_PARTS),
+    )
+    key = f"{multipart_upload_key(mentor, question, str(uuid.uuid4()))}.mp4"
+    upload = s3_client.create_multipart_upload(
+        Bucket=static_s3_bucket, Key=key, ContentType="video/mp4"
+    )
+    parts = [
+        {
+            "partNumber": part_number,
+            "url": s3_client.generate_presigned_url(
+                "upload_part",
+                Params={
+                    "Bucket": static_s3_bucket,
+                    "Key": key,
+                    "UploadId": upload["UploadId"],
+                    "PartNumber": part_number,
+                },
+                ExpiresIn=get_multipart_url_expires(),
+            ),
+        }
+        for part_number in range(1, math.ceil(size / part_size) + 1)
+    ]
+    log.info("%s", {"multipart_upload": key, "size": size, "parts": len(parts)})
+    return jsonify(
+        {
+            "data": {
+                "uploadId": upload["UploadId"],
+                "key": key,
+                "partSize": part_size,
+                "parts": parts,
+            }
+        }
+    )
+
+
+multipart_upload_ref_json_schema = {
+    **video_upload_json_schema,
+    "properties": {
+        **video_upload_json_schema["properties"],
+        "uploadId": {"type": "string", "minLength": 1},
+        "key": {"type": "string", "minLength": 1},
+    },
+    "required": video_upload_json_schema["required"] + ["uploadId", "key"],
+}
+
+complete_multipart_upload_json_schema = {
+    **multipart_upload_ref_json_schema,
+    "properties": {
+        **multipart_upload_ref_json_schema["properties"],
+        "size": {"type": "integer", "minimum": 1},
+        "parts": {
+            "type": "array",
+            "minItems": 1,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "partNumber": {"type": "integer", "minimum": 1},
+                    "etag": {"type": "string"},
+                },
+                "required": ["partNumber", "etag"],
+            },
+        },
+    },
+    "required": multipart_upload_ref_json_schema["required"] + ["size", "parts"],
+}
+
+
+def _verify_multipart_upload_key(body: dict) -> str:
+    key = body.get("key")
+    if not key.startswith(
+        multipart_upload_key(body.get("mentor"), body.get("question"))
+    ):
+        raise BadRequest(f"{key} is not an upload of this answer")
+    return key
+
+
+@answer_queue_blueprint.route("/multipart/complete/", methods=["POST"])
+@answer_queue_blueprint.route("/multipart/complete", methods=["POST"])
+@validate_json_payload_decorator(json_schema=complete_multipart_upload_json_schema)
+@authorize_to_edit_mentor
+def complete_multipart_upload(body):
+    """
+    Completes a multipart upload and starts processing it like upload does,
+    the video is verified in the background
+    """
+    key = _verify_multipart_upload_key(body)
+    s3_client.complete_multipart_upload(
+        Bucket=static_s3_bucket,
+        Key=key,
+        UploadId=body.get("uploadId"),
+        MultipartUpload={
+            "Parts": [
+                {"PartNumber": p["partNumber"], "ETag": p["etag"]}
+                for p in sorted(body.get("parts"), key=lambda p: p["partNumber"])
+            ]
+        },
+    )
+    return queue_upload(body, {"key": key})
+
+
+def prepare_multipart_upload(key: str, body: dict) -> None:
+    trim = body.get("trim")
+    try:
+        size = s3_client.head_object(Bucket=static_s3_bucket, Key=key)["ContentLength"]
+        if size != body.get("size"):
+            raise BadRequest(f"Expected {body.get('size')} bytes, received {size}")
+        verify_video(probe_s3_video(key, size))
+        s3_path = f"videos/{body.get('mentor')}/{body.get('question')}"
+        if trim:
+            log.info("trimming %s %s", key, trim)
+            with tempfile.TemporaryDirectory() as work_dir:
+                trim_file = path.join(work_dir, "trim.mp4")
+                # ffmpeg only reads the parts of the video it needs over http
+                video_trim(
+                    s3_client.generate_presigned_url(
+                        "get_object",
+                        Params={"Bucket": static_s3_bucket, "Key": key},
+                        ExpiresIn=get_multipart_url_expires(),
+                    ),
+                    trim_file,
+                    trim["start"],
+                    trim["end"],
+                )
+                upload_to_s3(trim_file, s3_path)
+        else:
+            copy_to_original(key, s3_path)
+    finally:
+        s3_client.delete_object(Bucket=static_s3_bucket, Key=key)
+
+
+@answer_queue_blueprint.route("/multipart/abort/", methods=["POST"])
+@answer_queue_blueprint.route("/multipart/abort", methods=["POST"])
+@validate_json_payload_decorator(json_schema=multipart_upload_ref_json_schema)
+@authorize_to_edit_mentor
+def abort_multipart_upload(body):
+    key = _verify_multipart_upload_key(body)
+    s3_client.abort_multipart_upload(
+        Bucket=static_s3_bucket, Key=key, UploadId=body.get("uploadId")
+    )
+    return jsonify({"data": {"key": key, "aborted": True}})
+
+
 def get_original_video_url(mentor: str, question: str) -> str:
     base_url = os.environ.get("STATIC_URL_BASE", "")
     return f"{base_url}/videos/{mentor}/{question}/original.mp4"
@@ -315,6 +747,9 @@ def list_files_from_directory(file_directory: str):
     files = []
     cali_tz = tz.gettz("America/Los_Angeles")
     for entry in scandir(file_directory):
+        if entry.name.startswith("."):
+            # e.g. the videos of upload sessions still in progress
+            continue
         files.append(
             {
                 "fileName": entry.name,
@@ -409,7 +844,22 @@ def _regen_vtt(mentor: str, question: str):
                     f"no answer media for mentor: {mentor} and question: {question}"
                 )
                 return {"regen_vtt": False}
-            transcript_to_vtt(web_media["url"], vtt_file_path, transcript)
+            vtt_media = next(
+                (x for x in answer_media if x["type"] == "subtitles"), None
+            )
+            previous_vtt = None
+            if vtt_media:
+                try:
+                    previous_vtt = fetch_text_from_url(vtt_media["url"])
+                except Exception as x:
+                    # without it the subtitles are timed uniformly
+                    logging.warning(f"failed to fetch previous vtt: {x}")
+            transcript_to_vtt(
+                web_media["url"],
+                vtt_file_path,
+                transcript,
+                previous_vtt=previous_vtt,
+            )
             video_path_base = f"videos/{mentor}/{question}/"
             if path.isfile(vtt_file_path):
                 item_path = f"{video_path_base}en.vtt"
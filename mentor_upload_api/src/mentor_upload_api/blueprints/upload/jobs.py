@@ -0,0 +1,168 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+"""
+Upload jobs queued to run in the background of an api worker (see background.py),
+recorded in redis so they outlive the worker:
+
+ - a job is claimed by the worker running it, a claim is a lease in redis
+   the worker keeps renewing while it's alive
+ - a job whose claim expired (its worker was killed or recycled) is claimed
+   and run again by another worker, up to UPLOAD_JOB_MAX_ATTEMPTS times
+ - a job that finished is kept (with why it failed) until it expires
+"""
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+import json
+import logging
+from os import environ, register_at_fork
+import threading
+import time
+from typing import List, Optional
+import uuid
+
+from mentor_upload_api.blueprints.upload.sessions import get_upload_session_redis_url
+
+log = logging.getLogger()
+
+
+@dataclass
+class UploadJob:
+    id: str
+    # the body of the upload (mentor, question, trim...)
+    body: dict
+    # transcoding-web, transcoding-mobile, transcribing, trim-upload (or None)
+    tasks: list
+    # where the video is: {"file": path in the upload root} or {"key": s3 key}
+    source: dict
+    status: str = "QUEUED"
+    attempts: int = 0
+    error: str = ""
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("DONE", "FAILED")
+
+
+class UploadJobStore:
+    def __init__(self, redis_client, prefix: str, ttl: int, lease: int):
+        self.redis = redis_client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.lease = lease
+        # identifies the claims of this process
+        self.owner = str(uuid.uuid4())
+        self._claimed = set()
+        self._lock = threading.Lock()
+        self._keeper: Optional[threading.Thread] = None
+
+    def _pending_key(self) -> str:
+        return f"{self.prefix}pending"
+
+    def _claim_key(self, job_id: str) -> str:
+        return f"{self.prefix}{job_id}:claim"
+
+    def get(self, job_id: str) -> Optional[UploadJob]:
+        value = self.redis.get(f"{self.prefix}{job_id}")
+        return UploadJob(**json.loads(value)) if value is not None else None
+
+    def put(self, job: UploadJob) -> None:
+        self.redis.setex(f"{self.prefix}{job.id}", self.ttl, json.dumps(asdict(job)))
+        if job.finished:
+            self.redis.srem(self._pending_key(), job.id)
+        else:
+            self.redis.sadd(self._pending_key(), job.id)
+
+    def pending_ids(self) -> List[str]:
+        return [
+            i.decode("utf-8") if isinstance(i, bytes) else i
+            for i in self.redis.smembers(self._pending_key())
+        ]
+
+    def forget(self, job_id: str) -> None:
+        # e.g. a pending job that expired
+        self.redis.srem(self._pending_key(), job_id)
+
+    def claim(self, job_id: str) -> bool:
+        """
+        Claims a job for this process, false when another one holds it
+        """
+        if not self.redis.set(
+            self._claim_key(job_id), self.owner, nx=True, ex=self.lease
+        ):
+            return False
+        with self._lock:
+            self._claimed.add(job_id)
+        self._start_keeper()
+        return True
+
+    def release(self, job_id: str) -> None:
+        with self._lock:
+            self._claimed.discard(job_id)
+        if self.redis.get(self._claim_key(job_id)) == self.owner.encode("utf-8"):
+            self.redis.delete(self._claim_key(job_id))
+
+    def renew_claims(self) -> None:
+        with self._lock:
+            claimed = list(self._claimed)
+        for job_id in claimed:
+            if self.redis.get(self._claim_key(job_id)) == self.owner.encode("utf-8"):
+                self.redis.expire(self._claim_key(job_id), self.lease)
+
+    def _keep_claims(self) -> None:
+        while True:
+            time.sleep(self.lease / 3)
+            try:
+                self.renew_claims()
+            except Exception as x:
+                log.warning(f"failed to renew upload job claims: {x}")
+
+    def _start_keeper(self) -> None:
+        if self._keeper is None:
+            with self._lock:
+                if self._keeper is None:
+                    self._keeper = threading.Thread(
+                        target=self._keep_claims,
+                        name="upload-job-claims",
+                        daemon=True,
+                    )
+                    self._keeper.start()
+
+
+def get_upload_job_redis_url() -> str:
+    return environ.get("UPLOAD_JOB_REDIS_URL") or get_upload_session_redis_url()
+
+
+def get_upload_job_ttl() -> int:
+    return int(environ.get("UPLOAD_JOB_TTL") or 24 * 60 * 60)
+
+
+def get_upload_job_lease() -> int:
+    return int(environ.get("UPLOAD_JOB_LEASE") or 60)
+
+
+def get_upload_job_max_attempts() -> int:
+    return int(environ.get("UPLOAD_JOB_MAX_ATTEMPTS") or 3)
+
+
+def get_upload_job_recovery_interval() -> int:
+    return int(environ.get("UPLOAD_JOB_RECOVERY_INTERVAL") or 60)
+
+
+@lru_cache(maxsize=1)
+def get_upload_job_store() -> UploadJobStore:
+    import redis
+
+    return UploadJobStore(
+        redis.Redis.from_url(get_upload_job_redis_url()),
+        "mentor-upload:job:",
+        get_upload_job_ttl(),
+        get_upload_job_lease(),
+    )
+
+
+# the claims of a forked process are its own (and so is the thread renewing them)
+register_at_fork(after_in_child=get_upload_job_store.cache_clear)
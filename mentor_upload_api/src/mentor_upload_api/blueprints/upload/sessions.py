@@ -0,0 +1,308 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+"""
+Resumable chunked uploads of answer videos, added to an upload blueprint with
+add_upload_session_routes:
+
+ - POST   sessions                  starts a session for a video of a given size
+ - GET    sessions/<id>             how much of the video was received
+ - PUT    sessions/<id>             appends a chunk (Content-Range: bytes start-end/size)
+ - POST   sessions/<id>/finalize    starts the blueprint's pipeline for the video
+ - DELETE sessions/<id>             abandons the session
+
+Chunks are written to a file on the uploads volume and the offset of each session
+is tracked in redis, so a dropped connection only loses the chunk in flight
+and any api worker can take the next chunk.
+"""
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+import json
+import logging
+from os import environ, makedirs, path, remove, replace, scandir
+import re
+import time
+from typing import Callable, Optional, Tuple
+import uuid
+
+from flask import Blueprint, Response, jsonify, request
+from werkzeug.exceptions import BadRequest, Conflict, NotFound
+
+from mentor_upload_api.authorization_decorator import (
+    authorize_to_edit_mentor,
+    verify_can_edit_mentor,
+)
+from mentor_upload_api.helpers import validate_json_payload_decorator
+
+log = logging.getLogger()
+
+_CONTENT_RANGE = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+_COPY_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class UploadSession:
+    id: str
+    # the body of the upload (mentor, question, trim...)
+    body: dict
+    # the name of the video in the upload root once finalized
+    file_name: str
+    size: int
+    offset: int = 0
+
+
+class UploadSessionStore:
+    def __init__(self, redis_client, prefix: str, ttl: int, lock_timeout: int):
+        self.redis = redis_client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+
+    def get(self, session_id: str) -> Optional[UploadSession]:
+        value = self.redis.get(f"{self.prefix}{session_id}")
+        return UploadSession(**json.loads(value)) if value is not None else None
+
+    def put(self, session: UploadSession) -> None:
+        # every write extends the session, only abandoned sessions expire
+        self.redis.setex(
+            f"{self.prefix}{session.id}", self.ttl, json.dumps(asdict(session))
+        )
+
+    def delete(self, session_id: str) -> None:
+        self.redis.delete(f"{self.prefix}{session_id}")
+
+    @contextmanager
+    def locked(self, session_id: str):
+        """
+        Only one request at a time may write a session,
+        raises Conflict when another one is
+        """
+        lock_key = f"{self.prefix}{session_id}:lock"
+        token = str(uuid.uuid4())
+        if not self.redis.set(lock_key, token, nx=True, ex=self.lock_timeout):
+            raise Conflict(f"upload session {session_id} is busy")
+        try:
+            yield
+        finally:
+            if self.redis.get(lock_key) == token.encode("utf-8"):
+                self.redis.delete(lock_key)
+
+
+def get_upload_session_redis_url() -> str:
+    return (
+        environ.get("UPLOAD_SESSION_REDIS_URL")
+        or environ.get("UPLOAD_CELERY_BROKER_URL")
+        or environ.get("CELERY_BROKER_URL")
+        or "redis://redis:6379/0"
+    )
+
+
+def get_upload_session_ttl() -> int:
+    return int(environ.get("UPLOAD_SESSION_TTL") or 24 * 60 * 60)
+
+
+@lru_cache(maxsize=1)
+def get_upload_session_store() -> UploadSessionStore:
+    import redis
+
+    return UploadSessionStore(
+        redis.Redis.from_url(get_upload_session_redis_url()),
+        "mentor-upload:session:",
+        get_upload_session_ttl(),
+        int(environ.get("UPLOAD_SESSION_LOCK_TIMEOUT") or 10 * 60),
+    )
+
+
+def get_upload_root() -> str:
+    return environ.get("UPLOAD_ROOT") or "./uploads"
+
+
+def get_session_root() -> str:
+    # a hidden dir in the upload root, so partial videos are never
+    # listed as uploads and finalizing one is a rename on the same volume
+    return path.join(get_upload_root(), ".sessions")
+
+
+def _session_file(session_id: str) -> str:
+    return path.join(get_session_root(), session_id)
+
+
+def _prune_abandoned_session_files(max_age: float) -> None:
+    if not path.isdir(get_session_root()):
+        return
+    expired = time.time() - max_age
+    for entry in scandir(get_session_root()):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < expired:
+                remove(entry.path)
+        except OSError as x:
+            log.warning(f"failed to remove abandoned upload {entry.path}: {x}")
+
+
+def parse_content_range(content_range: str) -> Tuple[int, int, int]:
+    """
+    Parses a Content-Range header (bytes start-end/size)
+    to (start, end exclusive, size)
+    """
+    m = _CONTENT_RANGE.match((content_range or "").strip())
+    if not m:
+        raise BadRequest("Content-Range: bytes start-end/size required")
+    start, last, size = (int(g) for g in m.groups())
+    if last < start or last >= size:
+        raise BadRequest(f"invalid Content-Range {content_range}")
+    return start, last + 1, size
+
+
+def _session_json(session: UploadSession, status: int = 200) -> Response:
+    res = jsonify(
+        {
+            "data": {
+                "sessionId": session.id,
+                "offset": session.offset,
+                "size": session.size,
+            }
+        }
+    )
+    res.status_code = status
+    return res
+
+
+def _get_session(store: UploadSessionStore, session_id: str) -> UploadSession:
+    session = store.get(session_id)
+    if session is None:
+        raise NotFound(f"upload session {session_id} not found or expired")
+    return session
+
+
+def _find_session(session_id: str) -> UploadSession:
+    session = _get_session(get_upload_session_store(), session_id)
+    verify_can_edit_mentor(session.body["mentor"])
+    return session
+
+
+def upload_session_json_schema(upload_json_schema: dict) -> dict:
+    """
+    The schema of an upload's body plus the name and size of the video
+    """
+    return {
+        **upload_json_schema,
+        "properties": {
+            **upload_json_schema["properties"],
+            "fileName": {
+                "type": "string",
+                "maxLength": 256,
+                "pattern": r"(?i)\.(mp3|mp4)$",
+            },
+            "size": {"type": "integer", "minimum": 1},
+        },
+        "required": upload_json_schema["required"] + ["fileName", "size"],
+    }
+
+
+def add_upload_session_routes(
+    blueprint: Blueprint,
+    upload_json_schema: dict,
+    start_upload: Callable[[dict, str], Response],
+    verify_upload: Callable[[dict], None] = None,
+) -> None:
+    """
+    Adds the upload session routes to an upload blueprint,
+    start_upload(body, file_path) is what the blueprint does
+    with an uploaded video (and its response),
+    verify_upload(body) can reject an upload before it's started
+    """
+
+    @blueprint.route("/sessions/", methods=["POST"])
+    @blueprint.route("/sessions", methods=["POST"])
+    @validate_json_payload_decorator(
+        json_schema=upload_session_json_schema(upload_json_schema)
+    )
+    @authorize_to_edit_mentor
+    def create_upload_session(body):
+        if verify_upload:
+            verify_upload(body)
+        mentor = body.get("mentor")
+        question = body.get("question")
+        ext = path.splitext(body["fileName"])[1].lower()
+        session = UploadSession(
+            id=uuid.uuid4().hex,
+            body={k: v for k, v in body.items() if k not in ("fileName", "size")},
+            file_name=f"{uuid.uuid4()}-{mentor}-{question}{ext}",
+            size=body["size"],
+        )
+        _prune_abandoned_session_files(get_upload_session_ttl())
+        makedirs(get_session_root(), exist_ok=True)
+        open(_session_file(session.id), "wb").close()
+        get_upload_session_store().put(session)
+        log.info("%s", {"upload_session": asdict(session)})
+        return _session_json(session)
+
+    @blueprint.route("/sessions/<session_id>/", methods=["GET"])
+    @blueprint.route("/sessions/<session_id>", methods=["GET"])
+    def get_upload_session(session_id: str):
+        return _session_json(_find_session(session_id))
+
+    @blueprint.route("/sessions/<session_id>/", methods=["PUT"])
+    @blueprint.route("/sessions/<session_id>", methods=["PUT"])
+    def put_upload_session_chunk(session_id: str):
+        _find_session(session_id)
+        start, end, size = parse_content_range(request.headers.get("Content-Range"))
+        store = get_upload_session_store()
+        with store.locked(session_id):
+            # e.g. finalized or deleted since it was found
+            session = _get_session(store, session_id)
+            if size != session.size:
+                raise BadRequest(f"size {size} doesn't match session {session.size}")
+            if start != session.offset:
+                # e.g. the response to the previous chunk was lost,
+                # the client resumes from offset
+                return _session_json(session, 409)
+            written = 0
+            try:
+                with open(_session_file(session_id), "r+b") as f:
+                    f.seek(start)
+                    while written < end - start:
+                        chunk = request.stream.read(
+                            min(_COPY_CHUNK_SIZE, end - start - written)
+                        )
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                        written += len(chunk)
+                    # drop whatever an interrupted chunk left past its end
+                    f.truncate()
+            finally:
+                session.offset = start + written
+                store.put(session)
+        return _session_json(session)
+
+    @blueprint.route("/sessions/<session_id>/finalize/", methods=["POST"])
+    @blueprint.route("/sessions/<session_id>/finalize", methods=["POST"])
+    def finalize_upload_session(session_id: str):
+        _find_session(session_id)
+        store = get_upload_session_store()
+        with store.locked(session_id):
+            # e.g. finalized or deleted since it was found
+            session = _get_session(store, session_id)
+            if session.offset != session.size:
+                return _session_json(session, 409)
+            file_path = path.join(get_upload_root(), session.file_name)
+            replace(_session_file(session_id), file_path)
+            store.delete(session_id)
+        log.info("%s", {"upload_session_finalized": asdict(session)})
+        return start_upload(session.body, file_path)
+
+    @blueprint.route("/sessions/<session_id>/", methods=["DELETE"])
+    @blueprint.route("/sessions/<session_id>", methods=["DELETE"])
+    def delete_upload_session(session_id: str):
+        _find_session(session_id)
+        store = get_upload_session_store()
+        with store.locked(session_id):
+            store.delete(session_id)
+            if path.isfile(_session_file(session_id)):
+                remove(_session_file(session_id))
+        return jsonify({"data": {"sessionId": session_id, "deleted": True}})
@@ -4,10 +4,13 @@
 #
 # The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
 #
+import hashlib
 import json
 from json import JSONDecodeError
 from functools import wraps
-from jsonschema import validate, ValidationError
+from jsonschema import ValidationError
+from jsonschema.exceptions import best_match
+from jsonschema.validators import validator_for
 from flask import request
 from werkzeug.exceptions import BadRequest
 import requests
@@ -19,6 +22,9 @@ from flask_wtf import FlaskForm
 
 log = logging.getLogger()
 
+# id(schema) -> (schema, validator)
+_validators = {}
+
 
 def get_graphql_endpoint() -> str:
     return environ.get("GRAPHQL_ENDPOINT") or "http://graphql:3001/graphql"
@@ -30,13 +36,36 @@ def exec_graphql_with_json_validation(request_query, json_schema, **req_kwargs):
     tdjson = res.json()
     if "errors" in tdjson:
         raise Exception(json.dumps(tdjson.get("errors")))
-    validate_json(tdjson, json_schema)
+    validate_json(tdjson, json_schema, fast=True)
     return tdjson
 
 
-def validate_json(json_data, json_schema):
+def get_json_validator(json_schema):
+    """
+    Returns a validator for json_schema.
+    The schema is checked and its validator built only the first time it's seen,
+    so schemas must not be mutated after they're first used
+    """
+    cached = _validators.get(id(json_schema))
+    if cached is None or cached[0] is not json_schema:
+        cls = validator_for(json_schema)
+        cls.check_schema(json_schema)
+        cached = (json_schema, cls(json_schema))
+        _validators[id(json_schema)] = cached
+    return cached[1]
+
+
+def _validate(json_data, json_schema, fast=False):
+    errors = get_json_validator(json_schema).iter_errors(json_data)
+    # fast mode stops at the first error instead of looking for the most relevant one
+    error = next(errors, None) if fast else best_match(errors)
+    if error is not None:
+        raise error
+
+
+def validate_json(json_data, json_schema, fast=False):
     try:
-        validate(instance=json_data, schema=json_schema)
+        _validate(json_data, json_schema, fast=fast)
     except ValidationError as err:
         log.error(err)
         raise err
@@ -59,7 +88,7 @@ def validate_json_payload_decorator(json_schema):
             if not json_body:
                 raise BadRequest("missing required param body")
             try:
-                validate(instance=json_body, schema=json_schema)
+                _validate(json_body, json_schema)
                 return f(json_body, *args, **kwargs)
             except ValidationError as err:
                 log.error(err)
@@ -107,3 +136,30 @@ def validate_form_payload_decorator(flask_form: FlaskForm):
         return form_validated_function
 
     return validate_form_wrapper
+
+
+def save_file_and_hash(
+    file_storage, file_path: str, chunk_size: int = 1024 * 1024
+) -> str:
+    """
+    Saves an uploaded file (a werkzeug FileStorage) to file_path
+    and returns the sha256 of its content,
+    hashed as it's written so the file is only read once
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "wb") as f:
+        for chunk in iter(lambda: file_storage.stream.read(chunk_size), b""):
+            digest.update(chunk)
+            f.write(chunk)
+    return digest.hexdigest()
+
+
+def hash_file(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """
+    The sha256 of a file's content, like save_file_and_hash returns
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -7,9 +7,16 @@
 import logging
 import os
 import re
-import math
 from pymediainfo import MediaInfo
 
+from mentor_upload_api.captions import (
+    DEFAULT_CUE_LENGTH,
+    TimingStrategy,
+    cues_to_vtt,
+    transcript_to_cues,
+    word_timings_from_vtt,
+)
+
 log = logging.getLogger()
 
 
@@ -33,8 +40,19 @@ def find(
 
 
 def transcript_to_vtt(
-    audio_or_video_file_or_url: str, vtt_file: str, transcript: str
+    audio_or_video_file_or_url: str,
+    vtt_file: str,
+    transcript: str,
+    cue_length: int = DEFAULT_CUE_LENGTH,
+    timing: TimingStrategy = None,
+    previous_vtt: str = None,
 ) -> str:
+    """
+    Writes subtitles for the transcript to vtt_file.
+    When given the vtt of the transcript this one was edited from,
+    only the edited words are re-timed (falling back to uniform timing
+    when the edit changed most of the transcript)
+    """
     log.info("%s, %s, %s", audio_or_video_file_or_url, vtt_file, transcript)
 
     if not os.path.exists(audio_or_video_file_or_url) and not re.search(
@@ -48,34 +66,17 @@ def transcript_to_vtt(
     if duration <= 0:
         log.warning(f"video duration for {audio_or_video_file_or_url} returned 0")
         return ""
-    piece_length = 68
-    word_indexes = find(transcript, " ")
-    split_index = [0]
-    for k in range(1, len(word_indexes)):
-        for el in range(1, len(word_indexes)):
-            if word_indexes[el] > piece_length * k:
-                split_index.append(word_indexes[el])
-                break
-    split_index.append(len(transcript))
-    log.debug(split_index)
-    amount_of_chunks = math.ceil(len(transcript) / piece_length)
-    log.debug(amount_of_chunks)
-    vtt_str = "WEBVTT FILE:\n\n"
-    for j in range(len(split_index) - 1):  # this uses a constant piece length
-        seconds_start = round((duration / amount_of_chunks) * j, 2) + 0.85
-        seconds_end = round((duration / amount_of_chunks) * (j + 1), 2) + 0.85
-        output_start = (
-            str(math.floor(seconds_start / 60)).zfill(2)
-            + ":"
-            + ("%.3f" % (seconds_start % 60)).zfill(6)
-        )
-        output_end = (
-            str(math.floor(seconds_end / 60)).zfill(2)
-            + ":"
-            + ("%.3f" % (seconds_end % 60)).zfill(6)
+    vtt_str = cues_to_vtt(
+        transcript_to_cues(
+            transcript,
+            duration,
+            cue_length=cue_length,
+            timing=timing,
+            previous_words=word_timings_from_vtt(previous_vtt)
+            if previous_vtt
+            else None,
         )
-        vtt_str += f"00:{output_start} --> 00:{output_end}\n"
-        vtt_str += f"{transcript[split_index[j] : split_index[j + 1]]}\n\n"
+    )
     os.makedirs(os.path.dirname(vtt_file), exist_ok=True)
     with open(vtt_file, "w") as f:
         f.write(vtt_str)
@@ -40,6 +40,10 @@ class ProcessAnswerRequest(TypedDict):
     question: str
     video_path: str
     trim: TrimRequest
+    # encode in chunks across cores, decided by duration when missing
+    chunked_encode: bool
+    # sha256 of the upload, identical uploads reuse what it produced
+    content_hash: str
 
 
 class Media:
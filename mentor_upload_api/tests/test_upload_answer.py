@@ -644,3 +644,85 @@ def test_it_returns_status_for_a_upload_job(
             "info": expected_info,
         }
     }
+
+
+def _mock_regen_vtt_task(ready: bool) -> Mock:
+    task = Mock(id="fake-regen-vtt-task-id", state="PENDING", status="PENDING")
+    task.info = None
+    task.ready.return_value = ready
+    if ready:
+        task.state = task.status = "SUCCESS"
+        task.info = {"mentor": "mentor1", "question": "question1"}
+    return task
+
+
+@pytest.mark.parametrize(
+    "query,ready,expected_wait",
+    [
+        ("", False, None),
+        ("?wait=5", False, 5),
+        # never longer than UPLOAD_LONG_POLL_MAX_SECONDS
+        ("?wait=3600", False, 20),
+        # nothing to wait for
+        ("?wait=5", True, None),
+    ],
+)
+@patch("mentor_upload_tasks.tasks.regen_vtt")
+@patch("mentor_upload_api.authorization_decorator.jwt.decode")
+def test_regen_vtt_returns_its_task_without_blocking(
+    mock_jwt_decode, mock_regen_vtt, query, ready, expected_wait, client
+):
+    mock_jwt_decode.return_value = {
+        "id": "mentor1",
+        "role": "USER",
+        "mentorIds": ["mentor1"],
+    }
+    task = _mock_regen_vtt_task(ready)
+    mock_regen_vtt.apply_async.return_value = task
+    res = client.post(
+        f"/upload/answer/regen_vtt{query}",
+        json={"mentor": "mentor1", "question": "question1"},
+        headers={"Authorization": "bearer abcdefg1234567"},
+    )
+    assert res.status_code == 200
+    data = res.json["data"]
+    assert data["id"] == "fake-regen-vtt-task-id"
+    assert data["state"] == task.state
+    assert data["info"] == task.info
+    assert data["statusUrl"] == (
+        "http://localhost/upload/answer/status/regen_vtt/fake-regen-vtt-task-id"
+    )
+    if expected_wait is None:
+        task.get.assert_not_called()
+    else:
+        task.get.assert_called_once_with(
+            timeout=expected_wait, propagate=False, interval=0.5
+        )
+
+
+@patch("mentor_upload_tasks.tasks.regen_vtt")
+def test_status_long_polls_a_regen_vtt_task(mock_regen_vtt, client):
+    task = _mock_regen_vtt_task(False)
+
+    def finish(**kwargs):
+        task.state = task.status = "SUCCESS"
+        task.info = {"mentor": "mentor1", "question": "question1"}
+
+    task.get.side_effect = finish
+    mock_regen_vtt.AsyncResult.return_value = task
+    res = client.get("/upload/answer/status/regen_vtt/fake-regen-vtt-task-id?wait=10")
+    assert res.status_code == 200
+    assert res.json == {
+        "data": {
+            "id": "fake-regen-vtt-task-id",
+            "state": "SUCCESS",
+            "status": "SUCCESS",
+            "info": {"mentor": "mentor1", "question": "question1"},
+        }
+    }
+    mock_regen_vtt.AsyncResult.assert_called_once_with("fake-regen-vtt-task-id")
+
+
+def test_status_rejects_a_wait_that_isnt_seconds(client):
+    res = client.get("/upload/answer/status/regen_vtt/fake-regen-vtt-task-id?wait=x")
+    assert res.status_code == 400
@@ -0,0 +1,336 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+from io import BytesIO
+import re
+from os import path
+from unittest.mock import Mock, patch
+
+import pytest
+
+from mentor_upload_api.blueprints.upload.jobs import UploadJob, UploadJobStore
+
+from .utils import FakeRedis, fixture_path
+
+MENTOR = "mentor1-fake-mongoose-id"
+QUESTION = "question1-fakemongooseid"
+AUTH = {"Authorization": "bearer abcdefg1234567"}
+ANSWER_QUEUE = "mentor_upload_api.blueprints.upload.answer_queue"
+
+
+def _video() -> bytes:
+    with open(path.join(fixture_path("input_videos"), "video.mp4"), "rb") as f:
+        return f.read()
+
+
+def _mock_s3(video: bytes) -> Mock:
+    s3 = Mock()
+    s3.create_multipart_upload.return_value = {"UploadId": "u1"}
+    s3.generate_presigned_url.side_effect = (
+        lambda op, **kwargs: f"https://s3/{op}/{kwargs['Params'].get('PartNumber')}"
+    )
+    s3.head_object.return_value = {"ContentLength": len(video)}
+
+    def get_object(**kwargs):
+        start, end = (
+            int(x) for x in re.match(r"bytes=(\d+)-(\d+)", kwargs["Range"]).groups()
+        )
+        return {"Body": BytesIO(video[start : end + 1])}
+
+    s3.get_object.side_effect = get_object
+    return s3
+
+
+@pytest.fixture(autouse=True)
+def upload_env(monkeypatch):
+    # small probes, so the metadata at the end of the fixture needs the tail probe
+    monkeypatch.setenv("UPLOAD_PROBE_BYTES", str(64 * 1024))
+    store = UploadJobStore(FakeRedis(), "j:", 60, 60)
+    with patch(f"{ANSWER_QUEUE}.get_upload_job_store", return_value=store), patch(
+        "mentor_upload_api.authorization_decorator.jwt.decode"
+    ) as jwt_decode, patch(
+        f"{ANSWER_QUEUE}.is_upload_in_progress"
+    ) as in_progress, patch(
+        f"{ANSWER_QUEUE}.run_in_background"
+    ) as run_in_background:
+        jwt_decode.return_value = {
+            "id": MENTOR,
+            "role": "USER",
+            "mentorIds": [MENTOR],
+        }
+        in_progress.return_value = False
+        # verify and trim in the request, so the tests see their outcome
+        run_in_background.side_effect = lambda fn, *args, **kwargs: fn(*args, **kwargs)
+        yield store
+
+
+def test_issues_presigned_urls_for_every_part(client, monkeypatch):
+    monkeypatch.setenv("UPLOAD_MULTIPART_PART_SIZE", str(5 * 1024 * 1024))
+    s3 = _mock_s3(b"")
+    with patch(f"{ANSWER_QUEUE}.s3_client", s3):
+        res = client.post(
+            "/upload/answer-queue/multipart",
+            json={"mentor": MENTOR, "question": QUESTION, "size": 12 * 1024 * 1024},
+            headers=AUTH,
+        )
+    assert res.status_code == 200
+    data = res.json["data"]
+    assert data["uploadId"] == "u1"
+    assert data["key"].startswith(f"videos/{MENTOR}/{QUESTION}/uploads/")
+    assert data["partSize"] == 5 * 1024 * 1024
+    assert data["parts"] == [
+        {"partNumber": n, "url": f"https://s3/upload_part/{n}"} for n in (1, 2, 3)
+    ]
+
+
+def test_rejects_videos_too_large(client, monkeypatch):
+    monkeypatch.setenv("UPLOAD_MAX_BYTES", "100")
+    with patch(f"{ANSWER_QUEUE}.s3_client", _mock_s3(b"")) as s3:
+        res = client.post(
+            "/upload/answer-queue/multipart",
+            json={"mentor": MENTOR, "question": QUESTION, "size": 101},
+            headers=AUTH,
+        )
+    assert res.status_code == 400
+    s3.create_multipart_upload.assert_not_called()
+
+
+def _complete(client, size: int, key: str = None):
+    return client.post(
+        "/upload/answer-queue/multipart/complete",
+        json={
+            "mentor": MENTOR,
+            "question": QUESTION,
+            "uploadId": "u1",
+            "key": key or f"videos/{MENTOR}/{QUESTION}/uploads/x.mp4",
+            "size": size,
+            "parts": [{"partNumber": 2, "etag": "e2"}, {"partNumber": 1, "etag": "e1"}],
+        },
+        headers=AUTH,
+    )
+
+
+def _record_statuses(mock_task_update: Mock) -> list:
+    """
+    The statuses of every task update, as of the update
+    (the tasks are updated in place)
+    """
+    statuses = []
+    mock_task_update.side_effect = lambda req: statuses.append(
+        {
+            t["task_name"]: t["status"]
+            for t in (
+                req.transcode_web_task,
+                req.transcode_mobile_task,
+                req.transcribe_task,
+                req.trim_upload_task,
+            )
+            if t
+        }
+    )
+    return statuses
+
+
+@patch(f"{ANSWER_QUEUE}.submit_job")
+@patch(f"{ANSWER_QUEUE}.upload_task_update")
+@patch(f"{ANSWER_QUEUE}.upload_answer_and_task_update")
+def test_completes_verifies_and_submits_the_upload(
+    mock_update: Mock, mock_task_update: Mock, mock_submit_job: Mock, client
+):
+    video = _video()
+    s3 = _mock_s3(video)
+    with patch(f"{ANSWER_QUEUE}.s3_client", s3):
+        res = _complete(client, len(video))
+    assert res.status_code == 200
+    key = f"videos/{MENTOR}/{QUESTION}/uploads/x.mp4"
+    s3.complete_multipart_upload.assert_called_once_with(
+        Bucket="upload-test-bucket",
+        Key=key,
+        UploadId="u1",
+        MultipartUpload={
+            "Parts": [{"PartNumber": 1, "ETag": "e1"}, {"PartNumber": 2, "ETag": "e2"}]
+        },
+    )
+    # only the head and tail of the video were read
+    assert s3.get_object.call_count == 2
+    s3.copy.assert_called_once_with(
+        {"Bucket": "upload-test-bucket", "Key": key},
+        "upload-test-bucket",
+        f"videos/{MENTOR}/{QUESTION}/original.mp4",
+        ExtraArgs={"ContentType": "video/mp4"},
+    )
+    s3.delete_object.assert_called_once_with(Bucket="upload-test-bucket", Key=key)
+    mock_update.assert_called_once()
+    # no trim-upload task reports progress when there's nothing to trim
+    mock_task_update.assert_not_called()
+    job = mock_submit_job.call_args[0][0]["request"]
+    assert job["video"] == f"videos/{MENTOR}/{QUESTION}/original.mp4"
+
+
+@patch(f"{ANSWER_QUEUE}.submit_job")
+@patch(f"{ANSWER_QUEUE}.upload_task_update")
+@patch(f"{ANSWER_QUEUE}.upload_answer_and_task_update")
+def test_fails_an_upload_of_another_size(
+    mock_update: Mock, mock_task_update: Mock, mock_submit_job: Mock, client
+):
+    video = _video()
+    s3 = _mock_s3(video)
+    statuses = _record_statuses(mock_task_update)
+    with patch(f"{ANSWER_QUEUE}.s3_client", s3):
+        res = _complete(client, len(video) + 1)
+    # the upload is verified after the response, its tasks report the failure
+    assert res.status_code == 200
+    assert set(statuses[-1].values()) == {"FAILED"}
+    s3.copy.assert_not_called()
+    s3.delete_object.assert_called_once()
+    mock_submit_job.assert_not_called()
+    # the job records why
+    job_id = res.json["data"]["statusUrl"].rsplit("/", 1)[1]
+    status = client.get(f"/upload/answer-queue/status/{job_id}").json["data"]
+    assert status["status"] == "FAILED"
+    assert status["error"] == f"Expected {len(video) + 1} bytes, received {len(video)}"
+
+
+@patch(f"{ANSWER_QUEUE}.submit_job")
+@patch(f"{ANSWER_QUEUE}.upload_task_update")
+@patch(f"{ANSWER_QUEUE}.upload_answer_and_task_update")
+def test_fails_an_upload_that_isnt_a_video(
+    mock_update: Mock, mock_task_update: Mock, mock_submit_job: Mock, client
+):
+    s3 = _mock_s3(b"not a video" * 100)
+    statuses = _record_statuses(mock_task_update)
+    with patch(f"{ANSWER_QUEUE}.s3_client", s3):
+        res = _complete(client, 1100)
+    assert res.status_code == 200
+    assert set(statuses[-1].values()) == {"FAILED"}
+    s3.delete_object.assert_called_once()
+    s3.copy.assert_not_called()
+    mock_submit_job.assert_not_called()
+
+
+def test_rejects_keys_of_other_answers(client):
+    with patch(f"{ANSWER_QUEUE}.s3_client", _mock_s3(b"")) as s3:
+        res = _complete(client, 1, key="videos/another-mentor/q/uploads/x.mp4")
+    assert res.status_code == 400
+    s3.complete_multipart_upload.assert_not_called()
+
+
+@patch(f"{ANSWER_QUEUE}.video_trim")
+@patch(f"{ANSWER_QUEUE}.upload_to_s3")
+@patch(f"{ANSWER_QUEUE}.submit_job")
+@patch(f"{ANSWER_QUEUE}.upload_task_update")
+@patch(f"{ANSWER_QUEUE}.upload_answer_and_task_update")
+def test_trims_the_upload_in_the_background(
+    mock_update: Mock,
+    mock_task_update: Mock,
+    mock_submit_job: Mock,
+    mock_upload_to_s3: Mock,
+    mock_video_trim: Mock,
+    client,
+):
+    video = _video()
+    s3 = _mock_s3(video)
+    statuses = _record_statuses(mock_task_update)
+    with patch(f"{ANSWER_QUEUE}.s3_client", s3):
+        res = client.post(
+            "/upload/answer-queue/multipart/complete",
+            json={
+                "mentor": MENTOR,
+                "question": QUESTION,
+                "uploadId": "u1",
+                "key": f"videos/{MENTOR}/{QUESTION}/uploads/x.mp4",
+                "size": len(video),
+                "parts": [{"partNumber": 1, "etag": "e1"}],
+                "trim": {"start": 0, "end": 1},
+            },
+            headers=AUTH,
+        )
+    assert res.status_code == 200
+    # registered as queued, the request doesn't wait for the trim
+    queued = mock_update.call_args[0][1].trim_upload_task
+    assert queued["task_name"] == "trim-upload"
+    assert [s["trim-upload"] for s in statuses] == [
+        "IN_PROGRESS",
+        "DONE",
+    ]
+    mock_video_trim.assert_called_once()
+    mock_upload_to_s3.assert_called_once()
+    assert mock_upload_to_s3.call_args[0][1] == f"videos/{MENTOR}/{QUESTION}"
+    job = mock_submit_job.call_args[0][0]["request"]
+    assert job["trimUploadTask"]["status"] == "DONE"
+
+
+def _job(store: UploadJobStore, attempts: int) -> UploadJob:
+    job = UploadJob(
+        id="job1",
+        body={"mentor": MENTOR, "question": QUESTION, "size": 1},
+        tasks=[
+            {"task_name": "transcoding-web", "task_id": "t1", "status": "QUEUED"},
+            {"task_name": "transcoding-mobile", "task_id": "t2", "status": "QUEUED"},
+            None,
+            None,
+        ],
+        source={"key": f"videos/{MENTOR}/{QUESTION}/uploads/x.mp4"},
+        status="IN_PROGRESS",
+        attempts=attempts,
+    )
+    store.put(job)
+    return job
+
+
+@patch(f"{ANSWER_QUEUE}.submit_job")
+@patch(f"{ANSWER_QUEUE}.upload_task_update")
+def test_reruns_the_jobs_of_dead_workers(
+    mock_task_update: Mock, mock_submit_job: Mock, upload_env
+):
+    from mentor_upload_api.blueprints.upload.answer_queue import recover_upload_jobs
+
+    store = upload_env
+    _job(store, attempts=1)
+    video = _video()
+    with patch(f"{ANSWER_QUEUE}.s3_client", _mock_s3(video)):
+        recover_upload_jobs()
+    job = store.get("job1")
+    assert job.attempts == 2
+    # reran, and failed on its upload this time
+    assert job.status == "FAILED"
+    assert job.error == f"Expected 1 bytes, received {len(video)}"
+    assert store.pending_ids() == []
+
+
+@patch(f"{ANSWER_QUEUE}.process_upload")
+def test_leaves_the_jobs_of_live_workers(mock_process_upload: Mock, upload_env):
+    from mentor_upload_api.blueprints.upload.answer_queue import recover_upload_jobs
+
+    store = upload_env
+    _job(store, attempts=1)
+    store.claim("job1")
+    recover_upload_jobs()
+    mock_process_upload.assert_not_called()
+    assert store.pending_ids() == ["job1"]
+
+
+@patch(f"{ANSWER_QUEUE}.process_upload")
+@patch(f"{ANSWER_QUEUE}.upload_task_update")
+def test_fails_jobs_interrupted_too_many_times(
+    mock_task_update: Mock, mock_process_upload: Mock, upload_env, monkeypatch
+):
+    from mentor_upload_api.blueprints.upload.answer_queue import recover_upload_jobs
+
+    monkeypatch.setenv("UPLOAD_JOB_MAX_ATTEMPTS", "2")
+    store = upload_env
+    _job(store, attempts=2)
+    recover_upload_jobs()
+    mock_process_upload.assert_not_called()
+    job = store.get("job1")
+    assert job.status == "FAILED"
+    assert "interrupted" in job.error
+    req = mock_task_update.call_args[0][0]
+    assert req.transcode_web_task["status"] == "FAILED"
+    assert req.transcode_mobile_task["status"] == "FAILED"
+    assert store.pending_ids() == []
+    # and its claim is let go
+    assert store.claim("job1")
@@ -0,0 +1,184 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+from contextlib import contextmanager
+import hashlib
+import json
+from os import listdir, path
+from unittest.mock import patch
+
+import pytest
+
+from mentor_upload_api.blueprints.upload.sessions import (
+    UploadSessionStore,
+    get_session_root,
+    parse_content_range,
+)
+
+from .utils import FakeRedis
+
+MENTOR = "mentor1-fake-mongoose-id"
+QUESTION = "question1-fakemongooseid"
+VIDEO = b"0123456789"
+AUTH = {"Authorization": "bearer abcdefg1234567"}
+
+
+@pytest.fixture(autouse=True)
+def upload_env(monkeypatch, tmpdir):
+    monkeypatch.setenv("UPLOAD_ROOT", path.abspath(tmpdir.join("uploads")))
+    store = UploadSessionStore(FakeRedis(), "s:", 60, 60)
+    with patch(
+        "mentor_upload_api.blueprints.upload.sessions.get_upload_session_store",
+        return_value=store,
+    ), patch("mentor_upload_api.authorization_decorator.jwt.decode") as jwt_decode:
+        jwt_decode.return_value = {
+            "id": MENTOR,
+            "role": "USER",
+            "mentorIds": [MENTOR],
+        }
+        yield store
+
+
+def _create_session(client, **body) -> str:
+    res = client.post(
+        "/upload/answer/sessions",
+        json={
+            "mentor": MENTOR,
+            "question": QUESTION,
+            "fileName": "video.mp4",
+            "size": len(VIDEO),
+            **body,
+        },
+        headers=AUTH,
+    )
+    assert res.status_code == 200
+    assert res.json["data"]["offset"] == 0
+    return res.json["data"]["sessionId"]
+
+
+def _put(client, session_id: str, start: int, end: int):
+    return client.put(
+        f"/upload/answer/sessions/{session_id}",
+        data=VIDEO[start:end],
+        headers={
+            **AUTH,
+            "Content-Range": f"bytes {start}-{end - 1}/{len(VIDEO)}",
+        },
+    )
+
+
+@pytest.mark.parametrize(
+    "content_range,expected",
+    [("bytes 0-3/10", (0, 4, 10)), ("bytes 4-9/10", (4, 10, 10))],
+)
+def test_parses_content_range(content_range, expected):
+    assert parse_content_range(content_range) == expected
+
+
+@pytest.mark.parametrize("content_range", [None, "bytes 4-3/10", "bytes 0-10/10"])
+def test_rejects_invalid_content_range(content_range):
+    with pytest.raises(Exception):
+        parse_content_range(content_range)
+
+
+@patch("mentor_upload_api.blueprints.upload.answer.start_upload")
+def test_uploads_a_video_in_chunks_and_starts_its_processing(mock_start_upload, client):
+    mock_start_upload.return_value = {"data": {"taskList": []}}
+    session_id = _create_session(client, trim={"start": 1, "end": 2})
+    assert _put(client, session_id, 0, 4).json["data"]["offset"] == 4
+    # a retried chunk that was already received is refused with the offset to resume from
+    res = _put(client, session_id, 0, 4)
+    assert res.status_code == 409
+    assert res.json["data"]["offset"] == 4
+    # finalizing before the whole video was received too
+    res = client.post(f"/upload/answer/sessions/{session_id}/finalize", headers=AUTH)
+    assert res.status_code == 409
+    assert (
+        client.get(f"/upload/answer/sessions/{session_id}", headers=AUTH).json["data"][
+            "offset"
+        ]
+        == 4
+    )
+    assert _put(client, session_id, 4, 10).json["data"]["offset"] == 10
+
+    res = client.post(f"/upload/answer/sessions/{session_id}/finalize", headers=AUTH)
+    assert res.status_code == 200
+    assert res.json == {"data": {"taskList": []}}
+    body, file_path, content_hash = mock_start_upload.call_args[0]
+    assert body == {
+        "mentor": MENTOR,
+        "question": QUESTION,
+        "trim": {"start": 1, "end": 2},
+    }
+    assert path.basename(file_path).endswith(f"-{MENTOR}-{QUESTION}.mp4")
+    with open(file_path, "rb") as f:
+        assert f.read() == VIDEO
+    assert content_hash == hashlib.sha256(VIDEO).hexdigest()
+    assert listdir(get_session_root()) == []
+    res = client.get(f"/upload/answer/sessions/{session_id}", headers=AUTH)
+    assert res.status_code == 404
+
+
+def test_only_the_mentors_editors_can_write_a_session(client, upload_env):
+    session_id = _create_session(client)
+    with patch("mentor_upload_api.authorization_decorator.jwt.decode") as jwt_decode:
+        jwt_decode.return_value = {
+            "id": "another-mentor-id",
+            "role": "USER",
+            "mentorIds": ["another-mentor-id"],
+        }
+        assert _put(client, session_id, 0, 4).status_code == 401
+
+
+def test_a_busy_session_refuses_concurrent_chunks(client, upload_env):
+    session_id = _create_session(client)
+    with upload_env.locked(session_id):
+        assert _put(client, session_id, 0, 4).status_code == 409
+    assert _put(client, session_id, 0, 4).status_code == 200
+
+
+@pytest.mark.parametrize("finalize", [False, True])
+def test_a_session_gone_by_the_time_its_locked_is_not_found(
+    finalize, client, upload_env
+):
+    session_id = _create_session(client)
+    _put(client, session_id, 0, len(VIDEO))
+    locked = upload_env.locked
+
+    @contextmanager
+    def deleted_then_locked(session_id: str):
+        # e.g. a concurrent request deleted or finalized it
+        upload_env.delete(session_id)
+        with locked(session_id):
+            yield
+
+    with patch.object(upload_env, "locked", deleted_then_locked):
+        res = (
+            client.post(f"/upload/answer/sessions/{session_id}/finalize", headers=AUTH)
+            if finalize
+            else _put(client, session_id, 0, 4)
+        )
+    assert res.status_code == 404
+
+
+def test_deletes_an_abandoned_session(client):
+    session_id = _create_session(client)
+    _put(client, session_id, 0, 4)
+    res = client.delete(f"/upload/answer/sessions/{session_id}", headers=AUTH)
+    assert res.status_code == 200
+    assert listdir(get_session_root()) == []
+
+
+def test_rejects_sessions_for_unsupported_files(client):
+    res = client.post(
+        "/upload/answer/sessions",
+        data=json.dumps(
+            {"mentor": MENTOR, "question": QUESTION, "fileName": "v.exe", "size": 1}
+        ),
+        content_type="application/json",
+        headers=AUTH,
+    )
+    assert res.status_code == 400
@@ -46,3 +46,40 @@ def mock_s3_client(mock_boto3_client: Mock) -> Mock:
 
     mock_boto3_client.side_effect = return_clients
     return mock_s3_client
+
+
+class FakeRedis:
+    """
+    The parts of a redis client the upload stores use
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.sets = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.values:
+            return None
+        self.values[key] = str(value).encode("utf-8")
+        return True
+
+    def setex(self, key, ttl, value):
+        self.values[key] = value.encode("utf-8")
+
+    def expire(self, key, ttl):
+        return key in self.values
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+    def sadd(self, key, member):
+        self.sets.setdefault(key, set()).add(str(member).encode("utf-8"))
+
+    def srem(self, key, member):
+        self.sets.get(key, set()).discard(str(member).encode("utf-8"))
+
+    def smembers(self, key):
+        return set(self.sets.get(key, set()))
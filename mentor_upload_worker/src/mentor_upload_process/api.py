@@ -6,25 +6,29 @@
 #
 # flake8: noqa
 from dataclasses import dataclass
+from functools import lru_cache
 import json
 from os import environ
+import re
 from typing import List, TypedDict
 
 import requests
 
+from mentor_upload_process.cache import RedisCacheTier, TieredCache, TTLCache
+from mentor_upload_process.graphql import get_graphql_client, get_graphql_endpoint
 from mentor_upload_process.helpers import exec_graphql_with_json_validation
 
 from . import MentorExportJson, ReplacedMentorDataChanges
 
 
-def get_graphql_endpoint() -> str:
-    return environ.get("GRAPHQL_ENDPOINT") or "http://graphql/graphql"
-
-
 def get_api_key() -> str:
     return environ.get("API_SECRET") or ""
 
 
+def get_auth_headers() -> dict:
+    return {"mentor-graphql-req": "true", "Authorization": f"bearer {get_api_key()}"}
+
+
 @dataclass
 class Media:
     type: str
@@ -191,23 +195,15 @@ def fetch_answer(mentor: str, question: str) -> dict:
 
 
 def upload_update_answer(req: AnswerUpdateRequest) -> None:
-    headers = {"mentor-graphql-req": "true", "Authorization": f"bearer {get_api_key()}"}
-    body = answer_upload_update_gql(req)
-    res = requests.post(get_graphql_endpoint(), json=body, headers=headers)
-    res.raise_for_status()
-    tdjson = res.json()
-    if "errors" in tdjson:
-        raise Exception(json.dumps(tdjson.get("errors")))
+    get_graphql_client().execute(
+        answer_upload_update_gql(req), headers=get_auth_headers()
+    )
 
 
 def upload_task_update(req: UploadTaskRequest) -> None:
-    headers = {"mentor-graphql-req": "true", "Authorization": f"bearer {get_api_key()}"}
-    body = upload_task_req_gql(req)
-    res = requests.post(get_graphql_endpoint(), json=body, headers=headers)
-    res.raise_for_status()
-    tdjson = res.json()
-    if "errors" in tdjson:
-        raise Exception(json.dumps(tdjson.get("errors")))
+    get_graphql_client().execute(
+        upload_task_req_gql(req), headers=get_auth_headers(), idempotent=True
+    )
 
 
 def upload_task_status_req_gql(req: UpdateTaskStatusRequest) -> GQLQueryBody:
@@ -231,20 +227,91 @@ def upload_task_status_req_gql(req: UpdateTaskStatusRequest) -> GQLQueryBody:
 
 
 def upload_task_status_update(req: UpdateTaskStatusRequest) -> None:
-    headers = {"mentor-graphql-req": "true", "Authorization": f"bearer {get_api_key()}"}
-    body = upload_task_status_req_gql(req)
-    res = requests.post(get_graphql_endpoint(), json=body, headers=headers)
-    res.raise_for_status()
-    tdjson = res.json()
-    if "errors" in tdjson:
-        raise Exception(json.dumps(tdjson.get("errors")))
+    get_graphql_client().execute(
+        upload_task_status_req_gql(req), headers=get_auth_headers(), idempotent=True
+    )
+
+
+def upload_task_status_batch_req_gql(
+    reqs: List[UpdateTaskStatusRequest],
+) -> GQLQueryBody:
+    """
+    Builds one mutation that updates the status of many tasks,
+    each update gets its own alias (u0, u1, ...) and variables ($mentorId0, ...)
+    """
+    params = []
+    fields = []
+    variables = {}
+    for i, req in enumerate(reqs):
+        params.append(
+            f"$mentorId{i}: ID!, $questionId{i}: ID!, $taskId{i}: String!, $newStatus{i}: String!, $transcript{i}: String, $media{i}: [AnswerMediaInputType]"
+        )
+        fields.append(
+            f"u{i}: uploadTaskStatusUpdate(mentorId: $mentorId{i}, questionId: $questionId{i}, taskId: $taskId{i}, newStatus: $newStatus{i}, transcript: $transcript{i}, media: $media{i})"
+        )
+        for k, v in upload_task_status_req_gql(req)["variables"].items():
+            variables[f"{k}{i}"] = v
+    return {
+        "query": f"""mutation BatchUpdateUploadTaskStatus({", ".join(params)}) {{
+            api {{
+                {" ".join(fields)}
+            }}
+        }}""",
+        "variables": variables,
+    }
 
 
-def fetch_question_name_gql(question_id: str) -> GQLQueryBody:
+class TaskStatusBatchError(Exception):
+    """
+    Some updates of a batch failed, the others were applied
+    """
+
+    def __init__(self, failed: List[UpdateTaskStatusRequest], errors: list):
+        super().__init__(json.dumps(errors))
+        self.failed = failed
+
+
+_BATCH_ALIAS = re.compile(r"^u(\d+)$")
+
+
+def upload_task_status_batch_update(reqs: List[UpdateTaskStatusRequest]) -> None:
+    """
+    Raises TaskStatusBatchError with the updates that failed
+    when graphql rejected only some of them
+    """
+    if len(reqs) == 1:
+        upload_task_status_update(reqs[0])
+        return
+    tdjson = get_graphql_client().execute(
+        upload_task_status_batch_req_gql(reqs),
+        headers=get_auth_headers(),
+        idempotent=True,
+        raise_errors=False,
+    )
+    errors = tdjson.get("errors")
+    if not errors:
+        return
+    failed = set()
+    for error in errors:
+        aliases = [
+            m
+            for m in (_BATCH_ALIAS.match(str(p)) for p in error.get("path") or [])
+            if m
+        ]
+        if not aliases:
+            # not the error of an update (e.g. the request was invalid)
+            raise Exception(json.dumps(errors))
+        failed.add(int(aliases[0].group(1)))
+    raise TaskStatusBatchError([reqs[i] for i in sorted(failed)], errors)
+
+
+def fetch_question_gql(question_id: str) -> GQLQueryBody:
     return {
         "query": """query Question($id: ID!) {
             question(id: $id){
                 name
+                type
+                minVideoLength
             }
         }""",
         "variables": {
@@ -253,7 +320,7 @@ def fetch_question_name_gql(question_id: str) -> GQLQueryBody:
     }
 
 
-fetch_question_name_schema = {
+fetch_question_schema = {
     "type": "object",
     "properties": {
         "data": {
@@ -261,7 +328,11 @@ fetch_question_name_schema = {
             "properties": {
                 "question": {
                     "type": "object",
-                    "properties": {"name": {"type": "string"}},
+                    "properties": {
+                        "name": {"type": "string"},
+                        "type": {"type": ["string", "null"]},
+                        "minVideoLength": {"type": ["number", "null"]},
+                    },
                     "required": ["name"],
                 },
             },
@@ -272,13 +343,77 @@ fetch_question_name_schema = {
 }
 
 
-def fetch_question_name(question_id: str) -> str:
-    headers = {"mentor-graphql-req": "true", "Authorization": f"bearer {get_api_key()}"}
-    gql_query = fetch_question_name_gql(question_id)
+@dataclass
+class QuestionMetadata:
+    name: str
+    type: str = None
+    min_video_length: float = None
+
+
+def get_question_cache_ttl() -> int:
+    return int(environ.get("QUESTION_CACHE_TTL") or 300)
+
+
+def get_question_cache_redis_url() -> str:
+    """
+    Redis for the question cache tier shared by all workers:
+    QUESTION_CACHE_REDIS_URL, or the celery broker when QUESTION_CACHE_REDIS=true
+    """
+    if environ.get("QUESTION_CACHE_REDIS_URL"):
+        return environ.get("QUESTION_CACHE_REDIS_URL")
+    if environ.get("QUESTION_CACHE_REDIS", "") == "true":
+        broker_url = environ.get("UPLOAD_CELERY_BROKER_URL") or environ.get(
+            "CELERY_BROKER_URL"
+        )
+        if broker_url and broker_url.startswith("redis"):
+            return broker_url
+    return ""
+
+
+@lru_cache(maxsize=1)
+def get_question_cache() -> TieredCache:
+    ttl = get_question_cache_ttl()
+    redis_url = get_question_cache_redis_url()
+    shared = None
+    if redis_url:
+        import redis
+
+        shared = RedisCacheTier(
+            redis.Redis.from_url(redis_url, socket_timeout=1),
+            "mentor-upload:question:",
+            ttl,
+        )
+    return TieredCache(
+        TTLCache(ttl, int(environ.get("QUESTION_CACHE_MAX_SIZE") or 1024)), shared
+    )
+
+
+def _fetch_question(question_id: str) -> dict:
     json_res = exec_graphql_with_json_validation(
-        gql_query, fetch_question_name_schema, headers=headers
+        fetch_question_gql(question_id),
+        fetch_question_schema,
+        headers=get_auth_headers(),
+    )
+    return json_res["data"]["question"]
+
+
+def fetch_question(question_id: str) -> QuestionMetadata:
+    """
+    Questions almost never change,
+    so their metadata is cached for QUESTION_CACHE_TTL seconds
+    """
+    question = get_question_cache().get(
+        question_id, lambda: _fetch_question(question_id)
+    )
+    return QuestionMetadata(
+        name=question["name"],
+        type=question.get("type"),
+        min_video_length=question.get("minVideoLength"),
     )
-    return json_res["data"]["question"]["name"]
+
+
+def fetch_question_name(question_id: str) -> str:
+    return fetch_question(question_id).name
 
 
 def fetch_answer_transcript_and_media_gql(mentor: str, question: str) -> GQLQueryBody:
@@ -333,7 +468,7 @@ fetch_answer_transcript_media_json_schema = {
 
 
 def fetch_answer_transcript_and_media(mentor: str, question: str):
-    headers = {"mentor-graphql-req": "true", "Authorization": f"bearer {get_api_key()}"}
+    headers = get_auth_headers()
     gql_query = fetch_answer_transcript_and_media_gql(mentor, question)
     json_res = exec_graphql_with_json_validation(
         gql_query, fetch_answer_transcript_media_json_schema, headers=headers
@@ -365,13 +500,7 @@ def media_update_gql(req: MediaUpdateRequest) -> GQLQueryBody:
 
 
 def update_media(req: MediaUpdateRequest) -> None:
-    headers = {"mentor-graphql-req": "true", "Authorization": f"bearer {get_api_key()}"}
-    body = media_update_gql(req)
-    res = requests.post(get_graphql_endpoint(), json=body, headers=headers)
-    res.raise_for_status()
-    tdjson = res.json()
-    if "errors" in tdjson:
-        raise Exception(json.dumps(tdjson.get("errors")))
+    get_graphql_client().execute(media_update_gql(req), headers=get_auth_headers())
 
 
 def fetch_text_from_url(url: str) -> str:
@@ -424,13 +553,9 @@ def import_task_create_gql_query(req: ImportTaskGQLRequest) -> GQLQueryBody:
 
 
 def import_task_create_gql(req: ImportTaskGQLRequest) -> None:
-    headers = {"mentor-graphql-req": "true", "Authorization": f"bearer {get_api_key()}"}
-    body = import_task_create_gql_query(req)
-    res = requests.post(get_graphql_endpoint(), json=body, headers=headers)
-    res.raise_for_status()
-    tdjson = res.json()
-    if "errors" in tdjson:
-        raise Exception(json.dumps(tdjson.get("errors")))
+    get_graphql_client().execute(
+        import_task_create_gql_query(req), headers=get_auth_headers()
+    )
 
 
 @dataclass
@@ -605,11 +730,22 @@ def get_media_list_from_answer_gql(answer_gql):
     return media_list
 
 
+def get_import_mentor_read_timeout() -> float:
+    """
+    Importing a mentor can take graphql minutes,
+    the import is never retried once sent
+    """
+    return float(environ.get("GRAPHQL_IMPORT_MENTOR_READ_TIMEOUT") or 600)
+
+
 def import_mentor_gql(req: ImportMentorGQLRequest) -> MentorImportGQLResponse:
-    headers = {"mentor-graphql-req": "true", "Authorization": f"bearer {get_api_key()}"}
+    headers = get_auth_headers()
     query = import_mentor_gql_query(req)
     res = exec_graphql_with_json_validation(
-        query, import_mentor_gql_response_schema, headers=headers
+        query,
+        import_mentor_gql_response_schema,
+        headers=headers,
+        read_timeout=get_import_mentor_read_timeout(),
     )
     res_data = res["data"]["api"]["mentorImport"]
     import_response_data = {
@@ -662,10 +798,6 @@ def import_task_update_gql_query(req: ImportTaskUpdateGQLRequest) -> GQLQueryBod
 
 
 def import_task_update_gql(req: ImportTaskGQLRequest) -> None:
-    headers = {"mentor-graphql-req": "true", "Authorization": f"bearer {get_api_key()}"}
-    body = import_task_update_gql_query(req)
-    res = requests.post(get_graphql_endpoint(), json=body, headers=headers)
-    res.raise_for_status()
-    tdjson = res.json()
-    if "errors" in tdjson:
-        raise Exception(json.dumps(tdjson.get("errors")))
+    get_graphql_client().execute(
+        import_task_update_gql_query(req), headers=get_auth_headers()
+    )
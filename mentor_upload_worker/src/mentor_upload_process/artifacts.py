@@ -0,0 +1,278 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+"""
+Artifact stores hand intermediate media (e.g. the trimmed upload)
+from one pipeline stage to the next.
+
+Stages pass artifact references (str) between each other instead of paths,
+so the stage that produced an artifact and the stage that consumes it
+don't have to run on the same host. Configure with env var ARTIFACT_STORE:
+
+ - local (default): refs are paths on the local disk; every stage
+   of an upload must run on the same host
+ - shared: artifacts are copied to a shared mount (ARTIFACT_STORE_DIR)
+ - s3: artifacts are uploaded to an S3 compatible bucket
+   (ARTIFACT_STORE_S3_BUCKET, ARTIFACT_STORE_S3_PREFIX, ARTIFACT_STORE_S3_ENDPOINT_URL)
+
+Non-local stores fetch artifacts through a read-through cache
+on the local disk of each node (ARTIFACT_CACHE_DIR, ARTIFACT_CACHE_MAX_BYTES).
+"""
+from abc import ABC, abstractmethod
+from functools import lru_cache
+import logging
+from os import (
+    environ,
+    makedirs,
+    path,
+    register_at_fork,
+    remove,
+    replace,
+    scandir,
+    utime,
+)
+from shutil import copyfile
+from tempfile import gettempdir
+from typing import Callable
+import uuid
+
+import boto3
+from botocore.config import Config
+
+from .s3 import get_s3_client, get_s3_transfer_config
+
+log = logging.getLogger()
+
+
+class ArtifactCache:
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def path_for(self, ref: str) -> str:
+        return path.join(self.root, ref.lstrip("/"))
+
+    def fetch(self, ref: str, download: Callable[[str], None]) -> str:
+        """
+        Returns the local path of a cached artifact,
+        calling download(tmp_file) to populate the cache on a miss
+        """
+        local_file = self.path_for(ref)
+        if path.isfile(local_file):
+            log.debug("artifact cache hit %s", ref)
+            utime(local_file)  # mark as recently used for prune
+            return local_file
+        makedirs(path.dirname(local_file), exist_ok=True)
+        # download to a tmp file so concurrent readers never see a partial file
+        tmp_file = f"{local_file}.{uuid.uuid4()}.part"
+        try:
+            download(tmp_file)
+            replace(tmp_file, local_file)
+        finally:
+            if path.exists(tmp_file):
+                remove(tmp_file)
+        self.prune(keep=local_file)
+        return local_file
+
+    def evict(self, ref: str) -> None:
+        local_file = self.path_for(ref)
+        if path.isfile(local_file):
+            remove(local_file)
+
+    def prune(self, keep: str = "") -> None:
+        """
+        Deletes the least recently used files
+        until the cache is no bigger than max_bytes
+        """
+        entries = []
+        for entry in _walk_files(self.root):
+            st = entry.stat()
+            entries.append((st.st_mtime, st.st_size, entry.path))
+        total = sum(e[1] for e in entries)
+        for _, size, file_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if file_path == keep:
+                continue
+            try:
+                remove(file_path)
+                total -= size
+            except OSError as x:
+                log.warning(f"failed to prune cached artifact {file_path}: {x}")
+
+
+def _walk_files(root: str):
+    if not path.isdir(root):
+        return
+    for entry in scandir(root):
+        if entry.is_dir(follow_symlinks=False):
+            yield from _walk_files(entry.path)
+        elif entry.is_file(follow_symlinks=False):
+            yield entry
+
+
+class ArtifactStore(ABC):
+    # True when refs are paths that can be read directly on this host
+    is_local = False
+
+    @abstractmethod
+    def put(self, local_file: str, key: str) -> str:
+        """
+        Stores a local file as an artifact and returns the ref to pass on
+        """
+
+    @abstractmethod
+    def fetch(self, ref: str) -> str:
+        """
+        Returns a path on the local disk with the content of the artifact
+        """
+
+    @abstractmethod
+    def delete(self, ref: str) -> None:
+        pass
+
+
+class LocalArtifactStore(ArtifactStore):
+    is_local = True
+
+    def put(self, local_file: str, key: str) -> str:
+        return str(local_file)
+
+    def fetch(self, ref: str) -> str:
+        return ref
+
+    def delete(self, ref: str) -> None:
+        # local artifacts live in the upload work dir,
+        # which is deleted with the work dir
+        pass
+
+
+class SharedMountArtifactStore(ArtifactStore):
+    def __init__(self, root: str, cache: ArtifactCache):
+        self.root = root
+        self.cache = cache
+
+    def _path(self, ref: str) -> str:
+        return path.join(self.root, ref.lstrip("/"))
+
+    def put(self, local_file: str, key: str) -> str:
+        target = self._path(key)
+        makedirs(path.dirname(target), exist_ok=True)
+        copyfile(local_file, target)
+        return key
+
+    def fetch(self, ref: str) -> str:
+        return self.cache.fetch(
+            ref, lambda tmp_file: copyfile(self._path(ref), tmp_file)
+        )
+
+    def delete(self, ref: str) -> None:
+        self.cache.evict(ref)
+        if path.isfile(self._path(ref)):
+            remove(self._path(ref))
+
+
+class S3ArtifactStore(ArtifactStore):
+    def __init__(self, s3_client, bucket: str, prefix: str, cache: ArtifactCache):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.cache = cache
+
+    def _key(self, ref: str) -> str:
+        return f"{self.prefix}/{ref.lstrip('/')}" if self.prefix else ref
+
+    def put(self, local_file: str, key: str) -> str:
+        self.s3.upload_file(
+            str(local_file),
+            self.bucket,
+            self._key(key),
+            Config=get_s3_transfer_config(),
+        )
+        return key
+
+    def fetch(self, ref: str) -> str:
+        return self.cache.fetch(
+            ref,
+            lambda tmp_file: self.s3.download_file(
+                self.bucket, self._key(ref), tmp_file, Config=get_s3_transfer_config()
+            ),
+        )
+
+    def delete(self, ref: str) -> None:
+        self.cache.evict(ref)
+        self.s3.delete_object(Bucket=self.bucket, Key=self._key(ref))
+
+
+def _require_env(n: str) -> str:
+    env_val = environ.get(n, "")
+    if not env_val:
+        raise EnvironmentError(f"missing required env var {n}")
+    return env_val
+
+
+def _create_artifact_cache() -> ArtifactCache:
+    return ArtifactCache(
+        environ.get("ARTIFACT_CACHE_DIR")
+        or path.join(gettempdir(), "mentor-upload-artifact-cache"),
+        int(environ.get("ARTIFACT_CACHE_MAX_BYTES") or 10 * 1024**3),
+    )
+
+
+_ARTIFACT_STORE_S3_OVERRIDES = (
+    "ARTIFACT_STORE_S3_ENDPOINT_URL",
+    "ARTIFACT_STORE_S3_REGION",
+    "ARTIFACT_STORE_S3_ACCESS_KEY_ID",
+    "ARTIFACT_STORE_S3_SECRET_ACCESS_KEY",
+)
+
+
+def _create_artifact_s3_client():
+    """
+    A client of its own when the artifact bucket is configured apart
+    from the static bucket (e.g. another region or account),
+    otherwise the static bucket's client
+    """
+    if not any(environ.get(n) for n in _ARTIFACT_STORE_S3_OVERRIDES):
+        return get_s3_client()
+    return boto3.client(
+        "s3",
+        endpoint_url=environ.get("ARTIFACT_STORE_S3_ENDPOINT_URL") or None,
+        region_name=environ.get("ARTIFACT_STORE_S3_REGION")
+        or _require_env("STATIC_AWS_REGION"),
+        aws_access_key_id=environ.get("ARTIFACT_STORE_S3_ACCESS_KEY_ID")
+        or _require_env("STATIC_AWS_ACCESS_KEY_ID"),
+        aws_secret_access_key=environ.get("ARTIFACT_STORE_S3_SECRET_ACCESS_KEY")
+        or _require_env("STATIC_AWS_SECRET_ACCESS_KEY"),
+        config=Config(
+            max_pool_connections=int(environ.get("S3_MAX_POOL_CONNECTIONS") or 50)
+        ),
+    )
+
+
+@lru_cache(maxsize=1)
+def get_artifact_store() -> ArtifactStore:
+    store_type = (environ.get("ARTIFACT_STORE") or "local").lower()
+    if store_type == "local":
+        return LocalArtifactStore()
+    if store_type == "shared":
+        return SharedMountArtifactStore(
+            _require_env("ARTIFACT_STORE_DIR"), _create_artifact_cache()
+        )
+    if store_type == "s3":
+        return S3ArtifactStore(
+            _create_artifact_s3_client(),
+            environ.get("ARTIFACT_STORE_S3_BUCKET")
+            or _require_env("STATIC_AWS_S3_BUCKET"),
+            environ.get("ARTIFACT_STORE_S3_PREFIX") or "upload-artifacts",
+            _create_artifact_cache(),
+        )
+    raise EnvironmentError(f"unsupported ARTIFACT_STORE {store_type}")
+
+
+# a store created before a fork (e.g. celery prefork) must not share
+# its s3 client's connection pool with the children
+register_at_fork(after_in_child=get_artifact_store.cache_clear)
@@ -0,0 +1,106 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+from collections import OrderedDict
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable, Optional, Tuple
+
+log = logging.getLogger()
+
+
+class TTLCache:
+    """
+    Thread safe in-memory cache, entries expire ttl seconds after they're set
+    and the least recently used entries are evicted beyond max_size
+    """
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        if self.ttl <= 0 or self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisCacheTier:
+    """
+    Cache tier shared by all workers, values are stored as json.
+    Redis being unavailable is never fatal, it just counts as a miss
+    """
+
+    def __init__(self, redis_client, prefix: str, ttl: int):
+        self.redis = redis_client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[Any]:
+        try:
+            value = self.redis.get(f"{self.prefix}{key}")
+            return json.loads(value) if value is not None else None
+        except Exception as x:
+            log.warning(f"failed to read {key} from redis cache: {x}")
+            return None
+
+    def set(self, key: str, value: Any) -> None:
+        try:
+            self.redis.setex(f"{self.prefix}{key}", self.ttl, json.dumps(value))
+        except Exception as x:
+            log.warning(f"failed to write {key} to redis cache: {x}")
+
+
+class TieredCache:
+    """
+    Looks values up in the local cache, then the shared tier (if any),
+    and only then calls fetch (populating both tiers).
+    Values must be json serializable to be shared.
+    """
+
+    def __init__(self, local: TTLCache, shared: RedisCacheTier = None):
+        self.local = local
+        self.shared = shared
+
+    def get(self, key: str, fetch: Callable[[], Any]) -> Any:
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        if self.shared:
+            value = self.shared.get(key)
+        if value is None:
+            value = fetch()
+            if self.shared:
+                self.shared.set(key, value)
+        self.local.set(key, value)
+        return value
+
+    def clear(self) -> None:
+        self.local.clear()
@@ -0,0 +1,236 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+"""
+Splits a transcript into subtitle cues and writes them as vtt.
+
+Segmentation and timing are separate steps, so a timing strategy
+can be swapped in without changing how the transcript is chunked:
+
+ - split_transcript: cuts the transcript into chunks of ~cue_length chars
+ - a TimingStrategy: gives each chunk a start and end time
+ - cues_to_vtt: writes the timed cues
+
+The defaults reproduce the vtt transcript_to_vtt has always generated.
+
+When word timings are known (e.g. from the subtitles the transcription
+service generated), retime_transcript keeps the timing of every word
+that is unchanged in an edited transcript and only interpolates
+the changed spans, then pack_cues groups the words into cues
+by character and time budget.
+"""
+from dataclasses import dataclass
+from difflib import SequenceMatcher
+from io import StringIO
+import math
+import re
+from typing import Callable, List, Optional
+
+from .webvtt import Cue, VttWriter, parse_vtt
+
+DEFAULT_CUE_LENGTH = 68
+DEFAULT_CUE_OFFSET = 0.85
+DEFAULT_MAX_CUE_SECONDS = 7.0
+DEFAULT_MAX_CUE_GAP_SECONDS = 1.5
+# below this share of words keeping their timing, an edit is a rewrite
+MIN_RETIMED_WORDS_RATIO = 0.5
+
+
+@dataclass
+class WordTiming:
+    word: str
+    start: float
+    end: float
+
+
+# (chunks, media duration) -> cues
+TimingStrategy = Callable[[List[str], float], List[Cue]]
+
+
+def split_transcript(
+    transcript: str, cue_length: int = DEFAULT_CUE_LENGTH
+) -> List[str]:
+    """
+    Cuts the transcript at the first space past every multiple of cue_length,
+    so words are never split apart.
+    Chunks keep their leading space, joined they are the transcript.
+    Single pass over the transcript (the spaces are visited once, in order)
+    """
+    spaces = [i for i, c in enumerate(transcript) if c == " "]
+    splits = [0]
+    # the first space never starts a chunk
+    el = 1
+    for k in range(1, len(spaces)):
+        while el < len(spaces) and spaces[el] <= cue_length * k:
+            el += 1
+        if el >= len(spaces):
+            break
+        # a word longer than cue_length spans multiple boundaries,
+        # repeating its split (and making an empty chunk) like it always has
+        splits.append(spaces[el])
+    splits.append(len(transcript))
+    return [transcript[splits[j] : splits[j + 1]] for j in range(len(splits) - 1)]
+
+
+def uniform_timing(
+    cue_length: int = DEFAULT_CUE_LENGTH, offset: float = DEFAULT_CUE_OFFSET
+) -> TimingStrategy:
+    """
+    Spreads the transcript evenly over the duration,
+    one slot for every cue_length chars, shifted by offset seconds
+    """
+
+    def timing(chunks: List[str], duration: float) -> List[Cue]:
+        slots = math.ceil(sum(len(c) for c in chunks) / cue_length)
+        if not slots:
+            return []
+        return [
+            Cue(
+                start=round((duration / slots) * j, 2) + offset,
+                end=round((duration / slots) * (j + 1), 2) + offset,
+                text=chunk,
+            )
+            for j, chunk in enumerate(chunks)
+        ]
+
+    return timing
+
+
+def cues_to_vtt(cues: List[Cue]) -> str:
+    f = StringIO()
+    VttWriter(f).write_all(cues)
+    return f.getvalue()
+
+
+def _spread(words: List[str], start: float, end: float) -> List[WordTiming]:
+    """
+    Times words over [start, end], each getting a share
+    proportional to its length
+    """
+    total = sum(len(w) + 1 for w in words)
+    timings = []
+    t = start
+    for w in words:
+        w_end = t + (end - start) * (len(w) + 1) / total
+        timings.append(WordTiming(w, t, w_end))
+        t = w_end
+    return timings
+
+
+def word_timings_from_cues(cues: List[Cue]) -> List[WordTiming]:
+    """
+    Approximates word timings from cue timings,
+    spreading the words of every cue over its duration
+    """
+    timings = []
+    for cue in cues:
+        words = cue.text.split()
+        if words:
+            timings.extend(_spread(words, cue.start, max(cue.end, cue.start)))
+    return timings
+
+
+def word_timings_from_vtt(vtt: str) -> List[WordTiming]:
+    return word_timings_from_cues(parse_vtt(vtt))
+
+
+def _match_key(word: str) -> str:
+    # edits that only change case or punctuation keep the word's timing
+    return re.sub(r"[^\w']", "", word.lower())
+
+
+def retime_transcript(
+    transcript: str, previous: List[WordTiming], duration: float
+) -> Optional[List[WordTiming]]:
+    """
+    Times the words of an edited transcript,
+    given the timings of the words of the transcript it was edited from.
+    Words that didn't change keep their timing,
+    replaced and inserted words are spread over the time of the words
+    they replace (or the gap they were inserted in).
+    Returns None when too little of the transcript is left to keep timings for
+    """
+    words = transcript.split()
+    if not words or not previous:
+        return None
+    matcher = SequenceMatcher(
+        None,
+        [_match_key(w.word) for w in previous],
+        [_match_key(w) for w in words],
+        autojunk=False,
+    )
+    timings: List[WordTiming] = []
+    kept = 0
+    for op, i1, i2, j1, j2 in matcher.get_opcodes():
+        if op == "equal":
+            kept += j2 - j1
+            timings.extend(
+                WordTiming(words[j], previous[i].start, previous[i].end)
+                for i, j in zip(range(i1, i2), range(j1, j2))
+            )
+        elif op in ("replace", "insert"):
+            if op == "replace":
+                start, end = previous[i1].start, previous[i2 - 1].end
+            else:
+                start = timings[-1].end if timings else 0.0
+                end = previous[i1].start if i1 < len(previous) else duration
+            timings.extend(_spread(words[j1:j2], start, max(start, end)))
+    if kept < len(words) * MIN_RETIMED_WORDS_RATIO:
+        return None
+    return timings
+
+
+def pack_cues(
+    words: List[WordTiming],
+    cue_length: int = DEFAULT_CUE_LENGTH,
+    max_cue_seconds: float = DEFAULT_MAX_CUE_SECONDS,
+    max_gap_seconds: float = DEFAULT_MAX_CUE_GAP_SECONDS,
+) -> List[Cue]:
+    """
+    Groups timed words into cues of at most cue_length chars
+    and max_cue_seconds, starting a new cue at pauses longer than max_gap_seconds
+    """
+    cues: List[Cue] = []
+    current: List[WordTiming] = []
+    chars = 0
+    for w in words:
+        if current and (
+            chars + 1 + len(w.word) > cue_length
+            or w.end - current[0].start > max_cue_seconds
+            or w.start - current[-1].end > max_gap_seconds
+        ):
+            cues.append(
+                Cue(
+                    current[0].start, current[-1].end, " ".join(x.word for x in current)
+                )
+            )
+            current = []
+        chars = chars + 1 + len(w.word) if current else len(w.word)
+        current.append(w)
+    if current:
+        cues.append(
+            Cue(current[0].start, current[-1].end, " ".join(x.word for x in current))
+        )
+    return cues
+
+
+def transcript_to_cues(
+    transcript: str,
+    duration: float,
+    cue_length: int = DEFAULT_CUE_LENGTH,
+    timing: TimingStrategy = None,
+    previous_words: List[WordTiming] = None,
+) -> List[Cue]:
+    """
+    Times the transcript by previous_words (see retime_transcript) when given,
+    falling back to timing (uniform by default)
+    """
+    if previous_words:
+        words = retime_transcript(transcript, previous_words, duration)
+        if words:
+            return pack_cues(words, cue_length)
+    timing = timing or uniform_timing(cue_length)
+    return timing(split_transcript(transcript, cue_length), duration)
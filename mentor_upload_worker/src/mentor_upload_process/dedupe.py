@@ -0,0 +1,231 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+"""
+Content addressed dedupe of uploads.
+
+The api hashes every upload (sha256 of its content) as it saves it.
+Once an upload was processed, a manifest of what it produced
+(the web and mobile renditions, the transcript and subtitles)
+is recorded under (content hash, trim, encode profile).
+An identical upload reuses them: the renditions are copied
+within the bucket and the transcript reused,
+so it's neither encoded nor transcribed again.
+
+Configure with env var UPLOAD_DEDUPE_STORE:
+
+ - none (default): uploads are never deduped
+ - redis: manifests are kept in UPLOAD_DEDUPE_REDIS_URL
+   (or the celery broker) for UPLOAD_DEDUPE_TTL seconds
+ - s3: manifests are json objects in the static bucket
+   under UPLOAD_DEDUPE_S3_PREFIX (expire them with a lifecycle rule)
+
+Bump UPLOAD_DEDUPE_ENCODE_PROFILE when the renditions
+the encoders produce change, so older ones aren't reused.
+"""
+from abc import ABC, abstractmethod
+from functools import lru_cache
+import json
+import logging
+from os import environ, path
+from typing import List, Optional
+
+from . import TrimRequest
+from .s3 import get_s3_client, get_s3_transfer_config
+
+log = logging.getLogger()
+
+ENCODE_PROFILE = "1"
+
+
+def get_encode_profile() -> str:
+    return environ.get("UPLOAD_DEDUPE_ENCODE_PROFILE") or ENCODE_PROFILE
+
+
+def dedupe_key(
+    content_hash: str, trim: Optional[TrimRequest], profile: str = ""
+) -> str:
+    window = f"{float(trim['start']):.3f}-{float(trim['end']):.3f}" if trim else "full"
+    return f"{content_hash}/{window}/{profile or get_encode_profile()}"
+
+
+class ManifestStore(ABC):
+    @abstractmethod
+    def get(self, key: str) -> Optional[dict]:
+        pass
+
+    @abstractmethod
+    def put(self, key: str, manifest: dict) -> None:
+        pass
+
+
+class RedisManifestStore(ManifestStore):
+    """
+    Redis being unavailable is never fatal, it just counts as a miss
+    """
+
+    def __init__(self, redis_client, prefix: str, ttl: int):
+        self.redis = redis_client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[dict]:
+        try:
+            value = self.redis.get(f"{self.prefix}{key}")
+            return json.loads(value) if value is not None else None
+        except Exception as x:
+            log.warning(f"failed to read upload manifest {key} from redis: {x}")
+            return None
+
+    def put(self, key: str, manifest: dict) -> None:
+        try:
+            self.redis.setex(f"{self.prefix}{key}", self.ttl, json.dumps(manifest))
+        except Exception as x:
+            log.warning(f"failed to write upload manifest {key} to redis: {x}")
+
+
+class S3ManifestStore(ManifestStore):
+    def __init__(self, s3_client, bucket: str, prefix: str):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}/{key}.json" if self.prefix else f"{key}.json"
+
+    def get(self, key: str) -> Optional[dict]:
+        try:
+            res = self.s3.get_object(Bucket=self.bucket, Key=self._key(key))
+            return json.loads(res["Body"].read())
+        except self.s3.exceptions.NoSuchKey:
+            return None
+        except Exception as x:
+            log.warning(f"failed to read upload manifest {key} from s3: {x}")
+            return None
+
+    def put(self, key: str, manifest: dict) -> None:
+        try:
+            self.s3.put_object(
+                Bucket=self.bucket,
+                Key=self._key(key),
+                Body=json.dumps(manifest).encode("utf-8"),
+                ContentType="application/json",
+            )
+        except Exception as x:
+            log.warning(f"failed to write upload manifest {key} to s3: {x}")
+
+
+def get_dedupe_redis_url() -> str:
+    if environ.get("UPLOAD_DEDUPE_REDIS_URL"):
+        return environ.get("UPLOAD_DEDUPE_REDIS_URL")
+    broker_url = environ.get("UPLOAD_CELERY_BROKER_URL") or environ.get(
+        "CELERY_BROKER_URL"
+    )
+    if broker_url and broker_url.startswith("redis"):
+        return broker_url
+    raise EnvironmentError("UPLOAD_DEDUPE_STORE=redis requires a redis url")
+
+
+@lru_cache(maxsize=1)
+def get_manifest_store() -> Optional[ManifestStore]:
+    store_type = (environ.get("UPLOAD_DEDUPE_STORE") or "none").lower()
+    if store_type == "none":
+        return None
+    if store_type == "redis":
+        import redis
+
+        return RedisManifestStore(
+            redis.Redis.from_url(get_dedupe_redis_url(), socket_timeout=1),
+            "mentor-upload:manifest:",
+            int(environ.get("UPLOAD_DEDUPE_TTL") or 30 * 24 * 60 * 60),
+        )
+    if store_type == "s3":
+        bucket = environ.get("STATIC_AWS_S3_BUCKET", "")
+        if not bucket:
+            raise EnvironmentError("missing required env var STATIC_AWS_S3_BUCKET")
+        return S3ManifestStore(
+            get_s3_client(),
+            bucket,
+            environ.get("UPLOAD_DEDUPE_S3_PREFIX") or "upload-manifests",
+        )
+    raise EnvironmentError(f"unsupported UPLOAD_DEDUPE_STORE {store_type}")
+
+
+def _upload_key(req: dict) -> Optional[str]:
+    content_hash = req.get("content_hash")
+    if not content_hash:
+        return None
+    return dedupe_key(content_hash, req.get("trim"))
+
+
+def find_upload_manifest(req: dict) -> Optional[dict]:
+    """
+    The manifest of an earlier upload identical to this one, if any
+    """
+    key = _upload_key(req)
+    store = get_manifest_store()
+    if not key or not store:
+        return None
+    manifest = store.get(key)
+    if manifest:
+        log.info(f"upload {req.get('video_path')} is a duplicate of {key}")
+    return manifest
+
+
+def record_upload_manifest(
+    req: dict,
+    media: List[dict],
+    transcript: Optional[str] = None,
+    subtitles: Optional[str] = None,
+) -> None:
+    """
+    Records what an upload produced, transcript and subtitles
+    are None when the upload wasn't transcribed (e.g. idle videos)
+    and then kept from the manifest recorded before, if any
+    """
+    key = _upload_key(req)
+    store = get_manifest_store()
+    renditions = [m for m in media if m.get("type") == "video"]
+    if not key or not store or not renditions:
+        return
+    manifest = {"media": renditions}
+    if transcript is None:
+        previous = store.get(key) or {}
+        if "transcript" in previous:
+            manifest["transcript"] = previous["transcript"]
+            manifest["subtitles"] = previous.get("subtitles") or ""
+    else:
+        manifest["transcript"] = transcript
+        manifest["subtitles"] = subtitles or ""
+    store.put(key, manifest)
+
+
+def copy_renditions(
+    s3, bucket: str, manifest: Optional[dict], video_path_base: str
+) -> Optional[List[dict]]:
+    """
+    Copies the renditions of a manifest to video_path_base
+    and returns their media, or None when there's nothing to reuse
+    (e.g. the renditions were deleted since)
+    """
+    renditions = (manifest or {}).get("media") or []
+    if not renditions:
+        return None
+    media = []
+    try:
+        for rendition in renditions:
+            item_path = f"{video_path_base}{path.basename(rendition['url'])}"
+            s3.copy(
+                {"Bucket": bucket, "Key": rendition["url"]},
+                bucket,
+                item_path,
+                Config=get_s3_transfer_config(),
+            )
+            media.append({**rendition, "url": item_path})
+    except Exception as x:
+        log.warning(f"failed to reuse renditions {renditions}: {x}")
+        return None
+    return media
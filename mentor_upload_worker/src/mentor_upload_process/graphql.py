@@ -0,0 +1,232 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+from dataclasses import dataclass
+import json
+import logging
+from os import environ, register_at_fork
+import random
+import re
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+log = logging.getLogger()
+
+_OPERATION_NAME = re.compile(r"^\s*(?:query|mutation)\s+(\w+)")
+_MUTATION = re.compile(r"^\s*mutation\b")
+
+_lock = threading.Lock()
+_graphql_client = None
+
+
+def get_graphql_endpoint() -> str:
+    return environ.get("GRAPHQL_ENDPOINT") or "http://graphql/graphql"
+
+
+def _float_env(n: str, default: float) -> float:
+    return float(environ.get(n) or default)
+
+
+def operation_name(body: dict) -> str:
+    m = _OPERATION_NAME.match(body.get("query") or "")
+    return m.group(1) if m else "anonymous"
+
+
+def is_mutation(body: dict) -> bool:
+    return bool(_MUTATION.match(body.get("query") or ""))
+
+
+def _is_connect_error(x: requests.exceptions.RequestException) -> bool:
+    """
+    True when the request never reached the server,
+    so sending it again can't apply it twice
+    """
+    if isinstance(x, requests.exceptions.ConnectTimeout):
+        return True
+    if not isinstance(x, requests.exceptions.ConnectionError):
+        return False
+    reason = x.args[0] if x.args else None
+    # requests wraps urllib3's MaxRetryError, which wraps the cause
+    return isinstance(getattr(reason, "reason", reason), NewConnectionError)
+
+
+@dataclass
+class OperationStats:
+    count: int = 0
+    errors: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+
+class GraphQLMetrics:
+    """
+    Latency per GraphQL operation name, for this worker process
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, OperationStats] = {}
+
+    def record(self, operation: str, seconds: float, failed: bool) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(operation, OperationStats())
+            stats.count += 1
+            stats.errors += 1 if failed else 0
+            stats.total_seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+        log.debug(
+            f"graphql {operation} took {seconds * 1000:.1f}ms{' (failed)' if failed else ''}"
+        )
+
+    def snapshot(self) -> Dict[str, OperationStats]:
+        with self._lock:
+            return {k: OperationStats(**vars(v)) for k, v in self._stats.items()}
+
+
+class GraphQLClient:
+    """
+    Executes GraphQL requests over a keep-alive connection pool.
+    Failures are retried with exponential backoff and full jitter:
+    errors connecting always, read timeouts and 5xx responses only
+    when the request is idempotent (queries, or mutations said to be)
+    since a mutation that timed out may still have been applied.
+    """
+
+    def __init__(
+        self,
+        endpoint: str = None,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 60.0,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        pool_size: int = 10,
+    ):
+        # when no endpoint is given, GRAPHQL_ENDPOINT is read on every request
+        self.endpoint = endpoint
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.metrics = GraphQLMetrics()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(
+            0, min(self.backoff_max, self.backoff_base * 2**attempt)
+        )
+
+    def _post(
+        self, body: dict, headers: dict, idempotent: bool, timeout: tuple
+    ) -> requests.Response:
+        attempt = 0
+        while True:
+            try:
+                res = self.session.post(
+                    self.endpoint or get_graphql_endpoint(),
+                    json=body,
+                    headers=headers,
+                    timeout=timeout,
+                )
+                if (
+                    res.status_code < 500
+                    or not idempotent
+                    or attempt >= self.max_retries
+                ):
+                    return res
+                reason = f"status {res.status_code}"
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+            ) as x:
+                if attempt >= self.max_retries or not (
+                    idempotent or _is_connect_error(x)
+                ):
+                    raise x
+                reason = str(x)
+            delay = self._backoff(attempt)
+            attempt += 1
+            log.warning(
+                f"graphql {operation_name(body)} failed ({reason}), retry {attempt} in {delay:.2f}s"
+            )
+            time.sleep(delay)
+
+    def execute(
+        self,
+        body: dict,
+        headers: dict = None,
+        idempotent: Optional[bool] = None,
+        read_timeout: Optional[float] = None,
+        raise_errors: bool = True,
+    ) -> dict:
+        """
+        Posts a GraphQL request and returns the json response,
+        raising if the request failed or (unless raise_errors=False)
+        the response has errors.
+        Queries are idempotent, mutations only when idempotent=True
+        (e.g. setting a status), read_timeout overrides the client's
+        for requests known to be slow
+        """
+        if idempotent is None:
+            idempotent = not is_mutation(body)
+        timeout = (
+            self.timeout if read_timeout is None else (self.timeout[0], read_timeout)
+        )
+        started = time.perf_counter()
+        failed = True
+        try:
+            res = self._post(body, headers, idempotent, timeout)
+            res.raise_for_status()
+            tdjson = res.json()
+            if "errors" in tdjson and raise_errors:
+                raise Exception(json.dumps(tdjson.get("errors")))
+            failed = "errors" in tdjson
+            return tdjson
+        finally:
+            self.metrics.record(
+                operation_name(body), time.perf_counter() - started, failed
+            )
+
+
+def _create_graphql_client() -> GraphQLClient:
+    return GraphQLClient(
+        connect_timeout=_float_env("GRAPHQL_CONNECT_TIMEOUT", 5.0),
+        read_timeout=_float_env("GRAPHQL_READ_TIMEOUT", 60.0),
+        max_retries=int(environ.get("GRAPHQL_MAX_RETRIES") or 3),
+        backoff_base=_float_env("GRAPHQL_RETRY_BACKOFF", 0.5),
+        backoff_max=_float_env("GRAPHQL_RETRY_BACKOFF_MAX", 8.0),
+        pool_size=int(environ.get("GRAPHQL_POOL_SIZE") or 10),
+    )
+
+
+def get_graphql_client() -> GraphQLClient:
+    """
+    Returns the GraphQL client shared by everything in this worker process
+    """
+    global _graphql_client
+    if _graphql_client is None:
+        with _lock:
+            if _graphql_client is None:
+                _graphql_client = _create_graphql_client()
+    return _graphql_client
+
+
+def reset_graphql_client() -> None:
+    global _lock, _graphql_client
+    _lock = threading.Lock()
+    _graphql_client = None
+
+
+# connection pools must not be shared with forked (e.g. celery prefork) children
+register_at_fork(after_in_child=reset_graphql_client)
@@ -4,31 +4,53 @@
 #
 # The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
 #
-import json
 import jsonschema
-from jsonschema import validate
-import requests
+from jsonschema.exceptions import best_match
+from jsonschema.validators import validator_for
 import logging
-from os import environ
 
+from .graphql import get_graphql_client, get_graphql_endpoint  # noqa: F401
 
-def get_graphql_endpoint() -> str:
-    return environ.get("GRAPHQL_ENDPOINT") or "http://graphql/graphql"
+# id(schema) -> (schema, validator)
+_validators = {}
 
 
-def exec_graphql_with_json_validation(request_query, json_schema, **req_kwargs):
-    res = requests.post(get_graphql_endpoint(), json=request_query, **req_kwargs)
-    res.raise_for_status()
-    tdjson = res.json()
-    if "errors" in tdjson:
-        raise Exception(json.dumps(tdjson.get("errors")))
-    validate_json(tdjson, json_schema)
+def exec_graphql_with_json_validation(
+    request_query, json_schema, headers=None, read_timeout=None
+):
+    tdjson = get_graphql_client().execute(
+        request_query, headers=headers, read_timeout=read_timeout
+    )
+    validate_json(tdjson, json_schema, fast=True)
     return tdjson
 
 
-def validate_json(json_data, json_schema):
+def get_json_validator(json_schema):
+    """
+    Returns a validator for json_schema.
+    The schema is checked and its validator built only the first time it's seen,
+    so schemas must not be mutated after they're first used
+    """
+    cached = _validators.get(id(json_schema))
+    if cached is None or cached[0] is not json_schema:
+        cls = validator_for(json_schema)
+        cls.check_schema(json_schema)
+        cached = (json_schema, cls(json_schema))
+        _validators[id(json_schema)] = cached
+    return cached[1]
+
+
+def _validate(json_data, json_schema, fast=False):
+    errors = get_json_validator(json_schema).iter_errors(json_data)
+    # fast mode stops at the first error instead of looking for the most relevant one
+    error = next(errors, None) if fast else best_match(errors)
+    if error is not None:
+        raise error
+
+
+def validate_json(json_data, json_schema, fast=False):
     try:
-        validate(instance=json_data, schema=json_schema)
+        _validate(json_data, json_schema, fast=fast)
     except jsonschema.exceptions.ValidationError as err:
         logging.error(msg=err)
         raise Exception(err)
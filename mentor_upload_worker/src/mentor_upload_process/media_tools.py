@@ -4,47 +4,339 @@
 #
 # The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
 #
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 from dataclasses import dataclass
+from functools import lru_cache
+import json
 import logging
 import os
 import re
-from typing import List, Optional, Tuple, Union
-import math
+import subprocess
+from tempfile import TemporaryDirectory
+import threading
+from typing import (
+    Callable,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 import ffmpy
 from pymediainfo import MediaInfo
+import requests
+
+from . import TrimRequest
+from .captions import (
+    DEFAULT_CUE_LENGTH,
+    TimingStrategy,
+    cues_to_vtt,
+    transcript_to_cues,
+    word_timings_from_vtt,
+)
+from .subprocesses import run_managed
+from .webvtt import trim_vtt_file
 
 log = logging.getLogger()
 
 
-def find_duration(audio_or_video_file: str) -> float:
-    log.info(audio_or_video_file)
-    media_info = MediaInfo.parse(audio_or_video_file)
+@dataclass(frozen=True)
+class MediaProbe:
+    duration: float
+    video_dims: Tuple[int, int]
+    # ffmpeg names, empty when unknown or there is no such track
+    video_codec: str = ""
+    pix_fmt: str = ""
+    rotation: float = 0.0
+    audio_codec: str = ""
+    audio_channels: int = 0
+    # the moov atom comes before the media data
+    faststart: bool = False
+    # bits/second of the video track, 0 when unknown
+    video_bit_rate: int = 0
+    # e.g. ("high", 4.1), empty and 0 when unknown
+    video_profile: str = ""
+    video_level: float = 0.0
+
+
+# mediainfo formats to ffmpeg codec names
+_CODEC_NAMES = {
+    "AVC": "h264",
+    "HEVC": "hevc",
+    "VP8": "vp8",
+    "VP9": "vp9",
+    "AV1": "av1",
+    "AAC": "aac",
+    "MPEG Audio": "mp3",
+    "Opus": "opus",
+    "Vorbis": "vorbis",
+}
+
+_CHROMA_SUBSAMPLINGS = {"4:2:0": "420", "4:2:2": "422", "4:4:4": "444"}
+
+
+def _codec_name(track) -> str:
+    fmt = getattr(track, "format", None) or ""
+    return _CODEC_NAMES.get(fmt, fmt.lower())
+
+
+def _pix_fmt(track) -> str:
+    color_space = getattr(track, "color_space", None)
+    subsampling = _CHROMA_SUBSAMPLINGS.get(
+        getattr(track, "chroma_subsampling", None) or ""
+    )
+    if color_space != "YUV" or not subsampling:
+        return ""
+    bit_depth = int(getattr(track, "bit_depth", None) or 8)
+    return f"yuv{subsampling}p" + ("" if bit_depth == 8 else f"{bit_depth}le")
+
+
+def _profile_and_level(track) -> Tuple[str, float]:
+    # mediainfo has them as format_profile "High@L4.1",
+    # or (newer versions) format_profile "High" and format_level "4.1"
+    profile, _, level = (getattr(track, "format_profile", None) or "").partition("@")
+    level = level or str(getattr(track, "format_level", None) or "")
+    try:
+        return profile.strip().lower(), float(level.lstrip("L") or 0)
+    except ValueError:
+        return profile.strip().lower(), 0.0
+
+
+def _media_probe_from_media_info(media_info: MediaInfo) -> MediaProbe:
+    duration = -1.0
     for t in media_info.tracks:
         if t.track_type in ["Video", "Audio"]:
             try:
                 log.debug(t)
-                return float(t.duration / 1000)
+                duration = float(t.duration / 1000)
+                break
             except Exception:
                 pass
-    return -1.0
-
-
-def find_video_dims(video_file: str) -> Tuple[int, int]:
-    log.info(video_file)
-    media_info = MediaInfo.parse(video_file)
     video_tracks = [t for t in media_info.tracks if t.track_type == "Video"]
     log.debug(video_tracks)
-    return (
+    video_dims = (
         (video_tracks[0].width, video_tracks[0].height)
         if len(video_tracks) >= 1
         else (-1, -1)
     )
+    audio_tracks = [t for t in media_info.tracks if t.track_type == "Audio"]
+    general_tracks = [t for t in media_info.tracks if t.track_type == "General"]
+    profile, level = _profile_and_level(video_tracks[0]) if video_tracks else ("", 0)
+    return MediaProbe(
+        duration=duration,
+        video_dims=video_dims,
+        video_codec=_codec_name(video_tracks[0]) if video_tracks else "",
+        pix_fmt=_pix_fmt(video_tracks[0]) if video_tracks else "",
+        rotation=float(getattr(video_tracks[0], "rotation", None) or 0.0)
+        if video_tracks
+        else 0.0,
+        audio_codec=_codec_name(audio_tracks[0]) if audio_tracks else "",
+        audio_channels=int(getattr(audio_tracks[0], "channel_s", None) or 0)
+        if audio_tracks
+        else 0,
+        faststart=bool(general_tracks)
+        and getattr(general_tracks[0], "isstreamable", None) == "Yes",
+        video_bit_rate=int(getattr(video_tracks[0], "bit_rate", None) or 0)
+        if video_tracks
+        else 0,
+        video_profile=profile,
+        video_level=level,
+    )
+
+
+def _media_probe_cache_size() -> int:
+    return int(os.environ.get("MEDIA_PROBE_CACHE_SIZE") or 128)
+
+
+@lru_cache(maxsize=_media_probe_cache_size())
+def _probe_media_cached(audio_or_video_file_or_url: str, version: Hashable):
+    # version is only part of the cache key,
+    # so a changed file/object gets probed again
+    return _media_probe_from_media_info(MediaInfo.parse(audio_or_video_file_or_url))
+
+
+def _media_version(audio_or_video_file_or_url: str) -> Optional[Hashable]:
+    """
+    Returns what identifies the current content at a path or url:
+    size + mtime for local files and ETag (or Last-Modified + Content-Length)
+    for urls. Returns None when the content can't be identified,
+    in which case the probe result must not be cached
+    """
+    if re.search("^https?", audio_or_video_file_or_url):
+        try:
+            res = requests.head(
+                audio_or_video_file_or_url, allow_redirects=True, timeout=10
+            )
+            res.raise_for_status()
+        except Exception as x:
+            log.warning(f"failed to fetch headers for {audio_or_video_file_or_url}")
+            log.exception(x)
+            return None
+        etag = res.headers.get("ETag")
+        if etag:
+            return etag
+        last_modified = res.headers.get("Last-Modified")
+        content_length = res.headers.get("Content-Length")
+        if last_modified and content_length:
+            return (last_modified, content_length)
+        return None
+    try:
+        st = os.stat(audio_or_video_file_or_url)
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime_ns)
+
+
+def probe_media(audio_or_video_file_or_url: str) -> MediaProbe:
+    """
+    Runs mediainfo once per version of a file (or url)
+    and shares the result with every caller through a bounded LRU cache
+    """
+    audio_or_video_file_or_url = str(audio_or_video_file_or_url)
+    version = _media_version(audio_or_video_file_or_url)
+    if version is None:
+        return _media_probe_from_media_info(MediaInfo.parse(audio_or_video_file_or_url))
+    return _probe_media_cached(audio_or_video_file_or_url, version)
+
+
+def find_duration(
+    audio_or_video_file: str, probe: Optional[MediaProbe] = None
+) -> float:
+    log.info(audio_or_video_file)
+    return (probe or probe_media(audio_or_video_file)).duration
+
+
+def find_video_dims(
+    video_file: str, probe: Optional[MediaProbe] = None
+) -> Tuple[int, int]:
+    log.info(video_file)
+    return (probe or probe_media(video_file)).video_dims
 
 
 def format_secs(secs: Union[float, int, str]) -> str:
     return f"{float(str(secs)):.3f}"
 
 
+@dataclass(frozen=True)
+class FFmpegProgress:
+    # seconds of output written
+    out_time: float
+    # of the expected duration, None when the duration is unknown
+    percent: Optional[float]
+    fps: float
+    # encoded seconds per second of wall-clock time
+    speed: float
+    done: bool = False
+
+
+ProgressCallback = Callable[[FFmpegProgress], None]
+
+
+def global_args_progress() -> Tuple[str, ...]:
+    # key=value progress blocks on stdout, independent of -loglevel
+    return ("-progress", "pipe:1", "-nostats")
+
+
+def _progress_value(block: dict, key: str) -> float:
+    try:
+        return float((block.get(key) or "").rstrip("x"))
+    except ValueError:
+        return 0.0
+
+
+def iter_progress(lines: Iterable[str], duration: float) -> Iterator[FFmpegProgress]:
+    """
+    Parses the blocks ffmpeg writes with -progress,
+    each of which ends with a progress=continue|end line
+    """
+    block: dict = {}
+    for line in lines:
+        key, sep, value = line.strip().partition("=")
+        if not sep:
+            continue
+        block[key] = value
+        if key != "progress":
+            continue
+        # out_time_ms is in microseconds too, newer versions add out_time_us
+        out_time = (
+            _progress_value(block, "out_time_us")
+            or _progress_value(block, "out_time_ms")
+        ) / 1000000
+        yield FFmpegProgress(
+            out_time=out_time,
+            percent=min(round(out_time / duration * 100, 1), 100.0)
+            if duration > 0
+            else None,
+            fps=_progress_value(block, "fps"),
+            speed=_progress_value(block, "speed"),
+            done=value == "end",
+        )
+        block = {}
+
+
+def _read_progress(f, duration: float, on_progress: ProgressCallback) -> None:
+    with f:
+        for progress in iter_progress(f, duration):
+            try:
+                on_progress(progress)
+            except Exception as x:
+                log.warning(f"failed to report ffmpeg progress: {x}")
+
+
+def run_ffmpeg(
+    ff: ffmpy.FFmpeg,
+    duration: float = 0.0,
+    on_progress: Optional[ProgressCallback] = None,
+) -> None:
+    """
+    Runs ffmpeg under supervision (see subprocesses.run_managed),
+    passing the progress it writes to stdout
+    (when built with global_args_progress) to on_progress
+    """
+    if on_progress is None:
+        run_managed(ff)
+        log.debug(ff)
+        return
+    read_fd, write_fd = os.pipe()
+    reader = threading.Thread(
+        target=_read_progress,
+        args=(os.fdopen(read_fd, "r"), duration, on_progress),
+        daemon=True,
+    )
+    reader.start()
+    try:
+        with os.fdopen(write_fd, "w") as stdout:
+            run_managed(ff, stdout=stdout)
+    finally:
+        # closing the write end ends the reader once it has read everything
+        reader.join()
+    log.debug(ff)
+
+
+def _global_args_progress(
+    on_progress: Optional[ProgressCallback],
+) -> Optional[Tuple[str, ...]]:
+    return global_args_progress() if on_progress else None
+
+
+def input_args_trim(trim: Optional[TrimRequest]) -> Optional[Tuple[str, ...]]:
+    """
+    Seeks the input to the trim window, so an encode decodes (and outputs)
+    only the trimmed part of the source.
+    Returns None (the ffmpy default) when there is nothing to trim
+    """
+    if not trim:
+        return None
+    start_secs = float(trim.get("start") or 0.0)
+    end_secs = float(trim.get("end"))
+    return ("-ss", format_secs(start_secs), "-t", format_secs(end_secs - start_secs))
+
+
 def output_args_trim_video(start_secs: float, end_secs: float) -> Tuple[str, ...]:
     return (
         "-ss",
@@ -58,24 +350,200 @@ def output_args_trim_video(start_secs: float, end_secs: float) -> Tuple[str, ...
     )
 
 
-def output_args_video_encode_for_mobile(
-    src_file: str, target_height=480, video_dims: Optional[Tuple[int, int]] = None
+def trim_stream_copy_enabled() -> bool:
+    return (os.environ.get("TRIM_STREAM_COPY") or "true").lower() != "false"
+
+
+def trim_stream_copy_min_secs() -> float:
+    return float(os.environ.get("TRIM_STREAM_COPY_MIN_SECS") or 2.0)
+
+
+# codecs whose re-encoded edges can be concatenated with copied GOPs,
+# mapped to the encoder for the edges
+STREAM_COPY_TRIM_ENCODERS = {"h264": "libx264"}
+
+# a keyframe this close to a trim point is treated as on it
+_KEYFRAME_TOLERANCE_SECS = 0.001
+
+
+@dataclass(frozen=True)
+class KeyframeProbe:
+    codec: str
+    pix_fmt: str
+    # seconds from the start of the video, sorted
+    keyframes: Tuple[float, ...]
+
+
+@dataclass(frozen=True)
+class TrimSegment:
+    start: float
+    end: float
+    # copied GOPs, otherwise a re-encoded partial GOP
+    copy: bool
+
+
+def probe_keyframes(
+    video_file_or_url: str, until_secs: Optional[float] = None
+) -> KeyframeProbe:
+    """
+    Lists the keyframes of the first video stream (up to until_secs).
+    Only reads packet headers, nothing gets decoded
+    """
+    global_options: Tuple[str, ...] = (
+        "-v",
+        "error",
+        "-select_streams",
+        "v:0",
+        "-show_entries",
+        "format=start_time:stream=codec_name,pix_fmt:packet=pts_time,flags",
+        "-of",
+        "json",
+    )
+    if until_secs is not None:
+        global_options += ("-read_intervals", f"%{format_secs(until_secs)}")
+    ff = ffmpy.FFprobe(
+        global_options=global_options, inputs={str(video_file_or_url): None}
+    )
+    stdout, _ = run_managed(ff, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    probe = json.loads(stdout or b"{}")
+    streams = probe.get("streams") or []
+    if not streams:
+        raise Exception(f"no video stream found in {video_file_or_url}")
+    start_time = float((probe.get("format") or {}).get("start_time") or 0.0)
+    keyframes = sorted(
+        float(p["pts_time"]) - start_time
+        for p in probe.get("packets") or []
+        if "K" in p.get("flags", "") and p.get("pts_time") not in (None, "N/A")
+    )
+    return KeyframeProbe(
+        codec=streams[0].get("codec_name") or "",
+        pix_fmt=streams[0].get("pix_fmt") or "yuv420p",
+        keyframes=tuple(keyframes),
+    )
+
+
+def plan_trim(
+    keyframes: Sequence[float],
+    start_secs: float,
+    end_secs: float,
+    min_copy_secs: float = 0.0,
+) -> Optional[List[TrimSegment]]:
+    """
+    Splits a trim into the GOP-aligned middle (first to last keyframe
+    within the trim), which can be stream copied, and the partial GOPs
+    before and after it, which need re-encoding.
+    Returns None when less than min_copy_secs could be copied
+    """
+    i = bisect_left(keyframes, start_secs - _KEYFRAME_TOLERANCE_SECS)
+    j = bisect_right(keyframes, end_secs + _KEYFRAME_TOLERANCE_SECS) - 1
+    if i >= len(keyframes) or j <= i:
+        return None
+    copy_start, copy_end = keyframes[i], keyframes[j]
+    if copy_end - copy_start < max(min_copy_secs, _KEYFRAME_TOLERANCE_SECS):
+        return None
+    segments = []
+    if copy_start - start_secs > _KEYFRAME_TOLERANCE_SECS:
+        segments.append(TrimSegment(start_secs, copy_start, copy=False))
+    segments.append(TrimSegment(copy_start, copy_end, copy=True))
+    if end_secs - copy_end > _KEYFRAME_TOLERANCE_SECS:
+        segments.append(TrimSegment(copy_end, end_secs, copy=False))
+    return segments
+
+
+def _seek_secs(secs: float) -> str:
+    # keyframe timestamps need more precision than format_secs,
+    # seeking a hair before one would land on the previous keyframe
+    return f"{secs:.6f}"
+
+
+def output_args_trim_segment(
+    segment: TrimSegment, encoder: str, pix_fmt: str
 ) -> Tuple[str, ...]:
-    i_w, i_h = video_dims or find_video_dims(src_file)
-    o_w, o_h = (target_height, target_height)
-    crop_w = 0
-    crop_h = 0
-    if i_w > i_h:
-        # for now assumes we want to zoom in slightly on landscape videos
-        # before cropping to square
-        crop_h = i_h * 0.25
-        crop_w = i_w - (i_h - crop_h)
-    else:
-        crop_h = crop_h - crop_h
+    codec_args: Tuple[str, ...] = (
+        ("-c:v", "copy")
+        if segment.copy
+        else ("-c:v", encoder, "-crf", "18", "-pix_fmt", pix_fmt)
+    )
+    # mpegts carries the codec parameters in-band,
+    # so re-encoded and copied segments concatenate cleanly
+    return (
+        ("-t", _seek_secs(segment.end - segment.start), "-map", "0:v:0", "-an")
+        + codec_args
+        + ("-f", "mpegts", "-y", "-loglevel", "quiet")
+    )
+
+
+def video_trim_stream_copy(
+    input_file: str, output_file: str, start_secs: float, end_secs: float
+) -> bool:
+    """
+    Trims by stream copying whole GOPs and only re-encoding the partial
+    GOPs at the edges (see plan_trim), then concatenating the segments.
+    Audio is cheap to encode and gets re-encoded for the whole trim.
+    Returns False, without writing anything, when the video can't be
+    trimmed this way, in which case it has to be fully re-encoded
+    """
+    probe = probe_keyframes(input_file, until_secs=end_secs)
+    encoder = STREAM_COPY_TRIM_ENCODERS.get(probe.codec)
+    if not encoder:
+        log.info(f"can't stream copy trim {probe.codec} video {input_file}")
+        return False
+    segments = plan_trim(
+        probe.keyframes, start_secs, end_secs, trim_stream_copy_min_secs()
+    )
+    if not segments:
+        log.info(f"no whole GOPs to stream copy in {input_file}")
+        return False
+    log.debug(segments)
+    with TemporaryDirectory(dir=os.path.dirname(str(output_file)) or None) as tmp:
+        concat_file = os.path.join(tmp, "segments.txt")
+        with open(concat_file, "w") as f:
+            for n, segment in enumerate(segments):
+                segment_file = os.path.join(tmp, f"{n}.ts")
+                ff = ffmpy.FFmpeg(
+                    inputs={str(input_file): ("-ss", _seek_secs(segment.start))},
+                    outputs={
+                        segment_file: output_args_trim_segment(
+                            segment, encoder, probe.pix_fmt
+                        )
+                    },
+                )
+                run_ffmpeg(ff)
+                f.write(f"file '{os.path.abspath(segment_file)}'\n")
+        ff = ffmpy.FFmpeg(
+            inputs={
+                concat_file: ("-f", "concat", "-safe", "0"),
+                str(input_file): (
+                    "-ss",
+                    format_secs(start_secs),
+                    "-t",
+                    format_secs(end_secs - start_secs),
+                ),
+            },
+            outputs={
+                str(output_file): (
+                    "-map",
+                    "0:v",
+                    "-map",
+                    "1:a?",
+                    "-c:v",
+                    "copy",
+                    "-c:a",
+                    "aac",
+                    "-movflags",
+                    "+faststart",
+                    "-y",
+                    "-loglevel",
+                    "quiet",
+                )
+            },
+        )
+        run_ffmpeg(ff)
+    return True
+
+
+def output_args_h264_aac() -> Tuple[str, ...]:
     return (
-        "-y",
-        "-filter:v",
-        f"crop=iw-{crop_w:.0f}:ih-{crop_h:.0f},scale={o_w:.0f}:{o_h:.0f}",
         "-c:v",
         "libx264",
         "-crf",
@@ -88,18 +556,30 @@ def output_args_video_encode_for_mobile(
         "aac",
         "-ac",
         "1",
-        "-loglevel",
-        "quiet",
     )
 
 
-def output_args_video_encode_for_web(
-    src_file: str,
-    max_height=720,
-    target_aspect=1.77777777778,
-    video_dims: Optional[Tuple[int, int]] = None,
-) -> Tuple[str, ...]:
-    i_w, i_h = video_dims or find_video_dims(src_file)
+def video_filter_encode_for_mobile(
+    video_dims: Tuple[int, int], target_height=480
+) -> str:
+    i_w, i_h = video_dims
+    o_w, o_h = (target_height, target_height)
+    crop_w = 0
+    crop_h = 0
+    if i_w > i_h:
+        # for now assumes we want to zoom in slightly on landscape videos
+        # before cropping to square
+        crop_h = i_h * 0.25
+        crop_w = i_w - (i_h - crop_h)
+    else:
+        crop_h = crop_h - crop_h
+    return f"crop=iw-{crop_w:.0f}:ih-{crop_h:.0f},scale={o_w:.0f}:{o_h:.0f}"
+
+
+def video_filter_encode_for_web(
+    video_dims: Tuple[int, int], max_height=720, target_aspect=1.77777777778
+) -> str:
+    i_w, i_h = video_dims
     crop_w = 0
     crop_h = 0
     o_w = 0
@@ -115,65 +595,650 @@ def output_args_video_encode_for_web(
         o_w += 1  # ensure width is divisible by 2
     if o_h % 2 != 0:
         o_h += 1  # ensure height is divisible by 2
+    return f"crop=iw-{crop_w:.0f}:ih-{crop_h:.0f},scale={o_w:.0f}:{o_h:.0f}"
+
+
+def output_args_video_encode_for_mobile(
+    src_file: str,
+    target_height=480,
+    video_dims: Optional[Tuple[int, int]] = None,
+    probe: Optional[MediaProbe] = None,
+) -> Tuple[str, ...]:
+    return (
+        (
+            "-y",
+            "-filter:v",
+            video_filter_encode_for_mobile(
+                video_dims or find_video_dims(src_file, probe=probe),
+                target_height=target_height,
+            ),
+        )
+        + output_args_h264_aac()
+        + ("-loglevel", "quiet")
+    )
+
+
+def output_args_video_encode_for_web(
+    src_file: str,
+    max_height=720,
+    target_aspect=1.77777777778,
+    video_dims: Optional[Tuple[int, int]] = None,
+    probe: Optional[MediaProbe] = None,
+) -> Tuple[str, ...]:
+    return (
+        (
+            "-y",
+            "-filter:v",
+            video_filter_encode_for_web(
+                video_dims or find_video_dims(src_file, probe=probe),
+                max_height=max_height,
+                target_aspect=target_aspect,
+            ),
+        )
+        + output_args_h264_aac()
+        + ("-loglevel", "quiet")
+    )
+
+
+def global_args_video_encode_for_web_and_mobile(
+    src_file: str,
+    target_height=480,
+    max_height=720,
+    target_aspect=1.77777777778,
+    video_dims: Optional[Tuple[int, int]] = None,
+    probe: Optional[MediaProbe] = None,
+) -> Tuple[str, ...]:
+    """
+    Decodes the source once and splits the decoded video
+    into the mobile and web crop/scale chains,
+    which are exposed as the [mobile] and [web] filter outputs
+    """
+    video_dims = video_dims or find_video_dims(src_file, probe=probe)
+    mobile_filter = video_filter_encode_for_mobile(
+        video_dims, target_height=target_height
+    )
+    web_filter = video_filter_encode_for_web(
+        video_dims, max_height=max_height, target_aspect=target_aspect
+    )
     return (
         "-y",
-        "-filter:v",
-        f"crop=iw-{crop_w:.0f}:ih-{crop_h:.0f},scale={o_w:.0f}:{o_h:.0f}",
-        "-c:v",
-        "libx264",
-        "-crf",
-        "23",
-        "-pix_fmt",
-        "yuv420p",
-        "-movflags",
-        "+faststart",
-        "-c:a",
-        "aac",
-        "-ac",
-        "1",
         "-loglevel",
         "quiet",
+        "-filter_complex",
+        f"[0:v]split=2[mobile_in][web_in];[mobile_in]{mobile_filter}[mobile];[web_in]{web_filter}[web]",
     )
 
 
+def output_args_video_encode_split(filter_output: str) -> Tuple[str, ...]:
+    # audio is optional (?) so silent videos still encode
+    return ("-map", f"[{filter_output}]", "-map", "0:a?") + output_args_h264_aac()
+
+
 def output_args_video_to_audio() -> Tuple[str, ...]:
     return ("-loglevel", "quiet", "-y")
 
 
-def video_encode_for_mobile(src_file: str, tgt_file: str, target_height=480) -> None:
+def passthrough_enabled() -> bool:
+    return (os.environ.get("TRANSCODE_PASSTHROUGH") or "true").lower() != "false"
+
+
+def passthrough_max_bit_rate() -> int:
+    """
+    Videos above this many bits/second are encoded even when conformant,
+    to what the crf of output_args_h264_aac makes of them
+    """
+    return int(os.environ.get("TRANSCODE_PASSTHROUGH_MAX_BITRATE") or 4_000_000)
+
+
+# what every h264 decoder of the web and mobile clients plays
+_PASSTHROUGH_PROFILES = ("constrained baseline", "baseline", "main", "high")
+_PASSTHROUGH_MAX_LEVEL = 4.1
+
+
+def can_passthrough(probe: MediaProbe, video_filter: str) -> bool:
+    """
+    Whether encoding the source with video_filter and output_args_h264_aac
+    would produce the same format the source already has:
+    h264 (High@L4.1 or lower) yuv420p video the filter leaves at its size,
+    at no more than passthrough_max_bit_rate,
+    and no audio or mono aac
+    """
+    w, h = probe.video_dims
+    return (
+        passthrough_enabled()
+        and probe.video_codec == "h264"
+        and probe.video_profile in _PASSTHROUGH_PROFILES
+        and 0 < probe.video_level <= _PASSTHROUGH_MAX_LEVEL
+        and 0 < probe.video_bit_rate <= passthrough_max_bit_rate()
+        and probe.pix_fmt == "yuv420p"
+        and not probe.rotation
+        and video_filter == f"crop=iw-0:ih-0,scale={w}:{h}"
+        and (
+            not probe.audio_codec
+            or (probe.audio_codec == "aac" and probe.audio_channels == 1)
+        )
+    )
+
+
+def output_args_remux() -> Tuple[str, ...]:
+    return (
+        "-map",
+        "0:v:0",
+        "-map",
+        "0:a?",
+        "-c",
+        "copy",
+        "-movflags",
+        "+faststart",
+        "-y",
+        "-loglevel",
+        "quiet",
+    )
+
+
+def video_passthrough(
+    src_file: str, tgt_file: str, trim: Optional[TrimRequest] = None
+) -> bool:
+    """
+    Copies a conformant source (see can_passthrough) to tgt_file
+    with a stream copy, moving the moov atom to the front.
+    A trimmed source goes through video_trim_stream_copy,
+    so only the partial GOPs at the trim edges are encoded.
+    Returns False when the source has to be encoded
+    """
+    if trim:
+        try:
+            return video_trim_stream_copy(
+                src_file,
+                tgt_file,
+                float(trim.get("start") or 0.0),
+                float(trim.get("end")),
+            )
+        except Exception as x:
+            log.warning(f"failed to stream copy trim {src_file}: {x}")
+            return False
+    ff = ffmpy.FFmpeg(
+        inputs={str(src_file): None}, outputs={str(tgt_file): output_args_remux()}
+    )
+    run_ffmpeg(ff)
+    return True
+
+
+def video_encode_for_mobile(
+    src_file: str,
+    tgt_file: str,
+    target_height=480,
+    probe: Optional[MediaProbe] = None,
+    trim: Optional[TrimRequest] = None,
+    on_progress: Optional[ProgressCallback] = None,
+) -> None:
+    """
+    Encodes the mobile rendition, or remuxes the source
+    when it already conforms to it (see can_passthrough)
+    """
     log.info("%s, %s, %s", src_file, tgt_file, target_height)
     os.makedirs(os.path.dirname(tgt_file), exist_ok=True)
+    probe = probe or probe_media(src_file)
+    if can_passthrough(
+        probe,
+        video_filter_encode_for_mobile(
+            find_video_dims(src_file, probe=probe), target_height=target_height
+        ),
+    ) and video_passthrough(src_file, tgt_file, trim=trim):
+        return
     ff = ffmpy.FFmpeg(
-        inputs={str(src_file): None},
+        global_options=_global_args_progress(on_progress),
+        inputs={str(src_file): input_args_trim(trim)},
         outputs={
             str(tgt_file): output_args_video_encode_for_mobile(
-                src_file, target_height=target_height
+                src_file, target_height=target_height, probe=probe
             )
         },
     )
-    ff.run()
-    log.debug(ff)
+    run_ffmpeg(ff, _window_secs(src_file, trim, probe, on_progress), on_progress)
 
 
 def video_encode_for_web(
-    src_file: str, tgt_file: str, max_height=720, target_aspect=1.77777777778
+    src_file: str,
+    tgt_file: str,
+    max_height=720,
+    target_aspect=1.77777777778,
+    probe: Optional[MediaProbe] = None,
+    trim: Optional[TrimRequest] = None,
+    on_progress: Optional[ProgressCallback] = None,
 ) -> None:
+    """
+    Encodes the web rendition, or remuxes the source
+    when it already conforms to it (see can_passthrough)
+    """
     log.info("%s, %s, %s, %s", src_file, tgt_file, max_height, target_aspect)
     os.makedirs(os.path.dirname(tgt_file), exist_ok=True)
+    probe = probe or probe_media(src_file)
+    if can_passthrough(
+        probe,
+        video_filter_encode_for_web(
+            find_video_dims(src_file, probe=probe),
+            max_height=max_height,
+            target_aspect=target_aspect,
+        ),
+    ) and video_passthrough(src_file, tgt_file, trim=trim):
+        return
     ff = ffmpy.FFmpeg(
-        inputs={str(src_file): None},
+        global_options=_global_args_progress(on_progress),
+        inputs={str(src_file): input_args_trim(trim)},
         outputs={
             str(tgt_file): output_args_video_encode_for_web(
-                src_file, max_height=max_height, target_aspect=target_aspect
+                src_file,
+                max_height=max_height,
+                target_aspect=target_aspect,
+                probe=probe,
             )
         },
     )
-    ff.run()
-    log.debug(ff)
+    run_ffmpeg(ff, _window_secs(src_file, trim, probe, on_progress), on_progress)
+
+
+def available_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def chunked_encode_workers() -> int:
+    return int(os.environ.get("CHUNKED_ENCODE_WORKERS") or available_cpus())
+
+
+def chunked_encode_min_secs() -> float:
+    return float(os.environ.get("CHUNKED_ENCODE_MIN_SECS") or 300.0)
+
+
+def chunked_encode_min_chunk_secs() -> float:
+    return float(os.environ.get("CHUNKED_ENCODE_MIN_CHUNK_SECS") or 30.0)
+
+
+def _trim_window(
+    src_file: str, trim: Optional[TrimRequest], probe: Optional[MediaProbe] = None
+) -> Tuple[float, float]:
+    if trim:
+        return (float(trim.get("start") or 0.0), float(trim.get("end")))
+    return (0.0, find_duration(src_file, probe=probe))
+
+
+def _window_secs(
+    src_file: str,
+    trim: Optional[TrimRequest],
+    probe: Optional[MediaProbe],
+    on_progress: Optional[ProgressCallback],
+) -> float:
+    # the duration is only needed to report progress against
+    if not on_progress:
+        return 0.0
+    start_secs, end_secs = _trim_window(src_file, trim, probe=probe)
+    return end_secs - start_secs
+
+
+class _ChunksProgress:
+    """
+    Sums up the progress of the concurrent encodes of chunks
+    into the progress of the whole encode
+    """
+
+    def __init__(self, chunks: int, duration: float, on_progress: ProgressCallback):
+        self.duration = duration
+        self.on_progress = on_progress
+        self._lock = threading.Lock()
+        self._chunks: List[Optional[FFmpegProgress]] = [None] * chunks
+
+    def chunk(self, n: int) -> ProgressCallback:
+        def on_chunk_progress(progress: FFmpegProgress) -> None:
+            with self._lock:
+                self._chunks[n] = progress
+                reported = [p for p in self._chunks if p]
+                out_time = sum(p.out_time for p in reported)
+                total = FFmpegProgress(
+                    out_time=out_time,
+                    percent=min(round(out_time / self.duration * 100, 1), 100.0)
+                    if self.duration > 0
+                    else None,
+                    fps=sum(p.fps for p in reported if not p.done),
+                    speed=sum(p.speed for p in reported if not p.done),
+                    done=len(reported) == len(self._chunks)
+                    and all(p.done for p in reported),
+                )
+                self.on_progress(total)
+
+        return on_chunk_progress
+
+
+def plan_chunks(
+    keyframes: Sequence[float],
+    start_secs: float,
+    end_secs: float,
+    max_chunks: int,
+    min_chunk_secs: float = 0.0,
+) -> List[Tuple[float, float]]:
+    """
+    Splits [start_secs, end_secs] into at most max_chunks chunks
+    of about the same length, cutting at the keyframe nearest
+    to each even split, so no two chunks decode the same GOP.
+    Chunks are kept at least min_chunk_secs long (on average)
+    """
+    if min_chunk_secs > 0:
+        max_chunks = min(max_chunks, int((end_secs - start_secs) // min_chunk_secs))
+    bounds = [start_secs]
+    for k in range(1, max(max_chunks, 1)):
+        target = start_secs + (end_secs - start_secs) * k / max_chunks
+        i = bisect_left(keyframes, target)
+        nearest = sorted(
+            keyframes[max(i - 1, 0) : i + 1], key=lambda t: abs(t - target)
+        )
+        if (
+            nearest
+            and nearest[0] - bounds[-1] > _KEYFRAME_TOLERANCE_SECS
+            and end_secs - nearest[0] > _KEYFRAME_TOLERANCE_SECS
+        ):
+            bounds.append(nearest[0])
+    bounds.append(end_secs)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def output_args_video_encode_chunk(
+    filter_output: str, threads: int = 0
+) -> Tuple[str, ...]:
+    # audio is encoded once for the whole video when the chunks are joined
+    return (
+        "-map",
+        f"[{filter_output}]",
+        "-an",
+        "-c:v",
+        "libx264",
+        "-crf",
+        "23",
+        "-pix_fmt",
+        "yuv420p",
+        "-threads",
+        str(threads),
+        "-f",
+        "mpegts",
+    )
+
+
+def output_args_video_join_chunks() -> Tuple[str, ...]:
+    return (
+        "-map",
+        "0:v",
+        "-map",
+        "1:a?",
+        "-c:v",
+        "copy",
+        "-c:a",
+        "aac",
+        "-ac",
+        "1",
+        "-movflags",
+        "+faststart",
+        "-y",
+        "-loglevel",
+        "quiet",
+    )
+
+
+def _join_chunks(
+    src_file: str,
+    chunk_files: List[str],
+    tgt_file: str,
+    start_secs: float,
+    end_secs: float,
+) -> None:
+    concat_file = f"{chunk_files[0]}.txt"
+    with open(concat_file, "w") as f:
+        for chunk_file in chunk_files:
+            f.write(f"file '{os.path.abspath(chunk_file)}'\n")
+    ff = ffmpy.FFmpeg(
+        inputs={
+            concat_file: ("-f", "concat", "-safe", "0"),
+            str(src_file): (
+                "-ss",
+                format_secs(start_secs),
+                "-t",
+                format_secs(end_secs - start_secs),
+            ),
+        },
+        outputs={str(tgt_file): output_args_video_join_chunks()},
+    )
+    run_ffmpeg(ff)
+
+
+def video_encode_for_web_and_mobile_chunked(
+    src_file: str,
+    web_tgt_file: str,
+    mobile_tgt_file: str,
+    target_height=480,
+    max_height=720,
+    target_aspect=1.77777777778,
+    probe: Optional[MediaProbe] = None,
+    trim: Optional[TrimRequest] = None,
+    workers: Optional[int] = None,
+    on_progress: Optional[ProgressCallback] = None,
+) -> bool:
+    """
+    Splits the source at keyframes into chunks (see plan_chunks),
+    encodes the web and mobile renditions of the chunks concurrently,
+    one ffmpeg process per chunk, and joins each rendition's chunks
+    with the concat demuxer.
+    Returns False, without writing anything, when the source
+    doesn't split into at least 2 chunks
+    """
+    workers = workers or chunked_encode_workers()
+    start_secs, end_secs = _trim_window(src_file, trim, probe=probe)
+    keyframes = probe_keyframes(src_file, until_secs=end_secs).keyframes
+    chunks = plan_chunks(
+        keyframes, start_secs, end_secs, workers, chunked_encode_min_chunk_secs()
+    )
+    if len(chunks) < 2:
+        log.info(f"{src_file} doesn't split into chunks")
+        return False
+    log.debug(chunks)
+    global_options = global_args_video_encode_for_web_and_mobile(
+        src_file,
+        target_height=target_height,
+        max_height=max_height,
+        target_aspect=target_aspect,
+        probe=probe,
+    )
+    chunks_progress = (
+        _ChunksProgress(len(chunks), end_secs - start_secs, on_progress)
+        if on_progress
+        else None
+    )
+    concurrency = min(workers, len(chunks))
+    # share the cores between the concurrent encodes
+    threads = max(available_cpus() // concurrency, 1)
+    with TemporaryDirectory(dir=os.path.dirname(str(web_tgt_file)) or None) as tmp:
+
+        def encode_chunk(n: int) -> Tuple[str, str]:
+            chunk_start, chunk_end = chunks[n]
+            mobile_chunk = os.path.join(tmp, f"mobile-{n}.ts")
+            web_chunk = os.path.join(tmp, f"web-{n}.ts")
+            ff = ffmpy.FFmpeg(
+                global_options=global_options
+                + (global_args_progress() if chunks_progress else ()),
+                inputs={
+                    str(src_file): (
+                        "-ss",
+                        _seek_secs(chunk_start),
+                        "-t",
+                        _seek_secs(chunk_end - chunk_start),
+                    )
+                },
+                outputs={
+                    mobile_chunk: output_args_video_encode_chunk("mobile", threads),
+                    web_chunk: output_args_video_encode_chunk("web", threads),
+                },
+            )
+            run_ffmpeg(
+                ff,
+                chunk_end - chunk_start,
+                chunks_progress.chunk(n) if chunks_progress else None,
+            )
+            return mobile_chunk, web_chunk
+
+        # the work happens in the ffmpeg processes, the threads only wait on them
+        # (and celery's prefork workers can't start a multiprocessing pool)
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            # each in a copy of this context, so the encodes count as this task's
+            chunk_files = [
+                f.result()
+                for f in [
+                    executor.submit(copy_context().run, encode_chunk, n)
+                    for n in range(len(chunks))
+                ]
+            ]
+        _join_chunks(
+            src_file,
+            [mobile for mobile, _ in chunk_files],
+            mobile_tgt_file,
+            start_secs,
+            end_secs,
+        )
+        _join_chunks(
+            src_file,
+            [web for _, web in chunk_files],
+            web_tgt_file,
+            start_secs,
+            end_secs,
+        )
+    return True
+
+
+def use_chunked_encode(
+    src_file: str,
+    chunked: Optional[bool] = None,
+    probe: Optional[MediaProbe] = None,
+    trim: Optional[TrimRequest] = None,
+) -> bool:
+    """
+    Whether to encode in chunks: as requested when chunked is set,
+    otherwise when the (trimmed) video is at least CHUNKED_ENCODE_MIN_SECS long.
+    Never with a single worker
+    """
+    if chunked is False or chunked_encode_workers() < 2:
+        return False
+    if chunked:
+        return True
+    start_secs, end_secs = _trim_window(src_file, trim, probe=probe)
+    return end_secs - start_secs >= chunked_encode_min_secs()
+
+
+def video_encode_for_web_and_mobile(
+    src_file: str,
+    web_tgt_file: str,
+    mobile_tgt_file: str,
+    target_height=480,
+    max_height=720,
+    target_aspect=1.77777777778,
+    probe: Optional[MediaProbe] = None,
+    trim: Optional[TrimRequest] = None,
+    chunked: Optional[bool] = None,
+    on_progress: Optional[ProgressCallback] = None,
+) -> None:
+    """
+    Encodes both the web and mobile renditions with a single ffmpeg run,
+    so the source video only gets decoded once.
+    When given a trim, only the trim window is decoded and encoded.
+    Long videos (or when chunked is set) are encoded in chunks
+    across cores instead, see video_encode_for_web_and_mobile_chunked.
+    A rendition the source already conforms to is remuxed,
+    see can_passthrough.
+    on_progress gets the progress of the encode, see run_ffmpeg
+    """
+    log.info(
+        "%s, %s, %s, %s, %s, %s",
+        src_file,
+        web_tgt_file,
+        mobile_tgt_file,
+        target_height,
+        max_height,
+        target_aspect,
+    )
+    os.makedirs(os.path.dirname(web_tgt_file), exist_ok=True)
+    os.makedirs(os.path.dirname(mobile_tgt_file), exist_ok=True)
+    probe = probe or probe_media(src_file)
+    video_dims = find_video_dims(src_file, probe=probe)
+    web_passthrough = can_passthrough(
+        probe,
+        video_filter_encode_for_web(
+            video_dims, max_height=max_height, target_aspect=target_aspect
+        ),
+    ) and video_passthrough(src_file, web_tgt_file, trim=trim)
+    mobile_passthrough = can_passthrough(
+        probe, video_filter_encode_for_mobile(video_dims, target_height=target_height)
+    ) and video_passthrough(src_file, mobile_tgt_file, trim=trim)
+    if web_passthrough and mobile_passthrough:
+        return
+    if web_passthrough or mobile_passthrough:
+        # only one rendition is left to encode
+        if web_passthrough:
+            video_encode_for_mobile(
+                src_file,
+                mobile_tgt_file,
+                target_height=target_height,
+                probe=probe,
+                trim=trim,
+                on_progress=on_progress,
+            )
+        else:
+            video_encode_for_web(
+                src_file,
+                web_tgt_file,
+                max_height=max_height,
+                target_aspect=target_aspect,
+                probe=probe,
+                trim=trim,
+                on_progress=on_progress,
+            )
+        return
+    if use_chunked_encode(src_file, chunked=chunked, probe=probe, trim=trim):
+        try:
+            if video_encode_for_web_and_mobile_chunked(
+                src_file,
+                web_tgt_file,
+                mobile_tgt_file,
+                target_height=target_height,
+                max_height=max_height,
+                target_aspect=target_aspect,
+                probe=probe,
+                trim=trim,
+                on_progress=on_progress,
+            ):
+                return
+        except Exception as x:
+            log.warning(f"failed to encode {src_file} in chunks: {x}")
+    ff = ffmpy.FFmpeg(
+        global_options=global_args_video_encode_for_web_and_mobile(
+            src_file,
+            target_height=target_height,
+            max_height=max_height,
+            target_aspect=target_aspect,
+            probe=probe,
+        )
+        + (global_args_progress() if on_progress else ()),
+        inputs={str(src_file): input_args_trim(trim)},
+        outputs={
+            str(mobile_tgt_file): output_args_video_encode_split("mobile"),
+            str(web_tgt_file): output_args_video_encode_split("web"),
+        },
+    )
+    run_ffmpeg(ff, _window_secs(src_file, trim, probe, on_progress), on_progress)
 
 
 def video_to_audio(
-    input_file: str, output_file: str = "", output_audio_encoding="mp3"
+    input_file: str,
+    output_file: str = "",
+    output_audio_encoding="mp3",
+    trim: Optional[TrimRequest] = None,
+    on_progress: Optional[ProgressCallback] = None,
 ) -> str:
     """
     Converts the .mp4 file to an audio file (.mp3 by default).
@@ -182,6 +1247,8 @@ def video_to_audio(
     Parameters:
     input_file: Examples are /example/path/to/session1/session1part1.mp4
     output_file: if not set, uses {input_file}.mp3
+    trim: if set, only the audio within the trim window is converted
+    on_progress: if set, gets the progress of the conversion (see run_ffmpeg)
 
     Returns: path to the new audio file
     """
@@ -193,14 +1260,30 @@ def video_to_audio(
         output_file or f"{os.path.splitext(input_file)[0]}.{output_audio_encoding}"
     )
     ff = ffmpy.FFmpeg(
-        inputs={str(input_file): None},
+        global_options=_global_args_progress(on_progress),
+        inputs={str(input_file): input_args_trim(trim)},
         outputs={str(output_file): output_args_video_to_audio()},
     )
-    ff.run()
-    log.debug(ff)
+    run_ffmpeg(ff, _window_secs(input_file, trim, None, on_progress), on_progress)
     return output_file
 
 
+def _video_trim(
+    input_file: str, output_file: str, start_secs: float, end_secs: float
+) -> None:
+    if trim_stream_copy_enabled():
+        try:
+            if video_trim_stream_copy(input_file, output_file, start_secs, end_secs):
+                return
+        except Exception as x:
+            log.warning(f"failed to stream copy trim {input_file}, re-encoding: {x}")
+    ff = ffmpy.FFmpeg(
+        inputs={str(input_file): None},
+        outputs={str(output_file): output_args_trim_video(start_secs, end_secs)},
+    )
+    run_ffmpeg(ff)
+
+
 def video_trim(
     input_file: str, output_file: str, start_secs: float, end_secs: float
 ) -> None:
@@ -208,12 +1291,7 @@ def video_trim(
     if not os.path.exists(input_file):
         raise Exception(f"ERROR: Can't trim, {input_file} doesn't exist")
     os.makedirs(os.path.dirname(output_file), exist_ok=True)
-    ff = ffmpy.FFmpeg(
-        inputs={str(input_file): None},
-        outputs={str(output_file): output_args_trim_video(start_secs, end_secs)},
-    )
-    ff.run()
-    log.debug(ff)
+    _video_trim(input_file, output_file, start_secs, end_secs)
 
 
 def existing_video_trim(
@@ -221,12 +1299,7 @@ def existing_video_trim(
 ) -> None:
     log.info("%s, %s, %s-%s", input_file, output_file, start_secs, end_secs)
     os.makedirs(os.path.dirname(output_file), exist_ok=True)
-    ff = ffmpy.FFmpeg(
-        inputs={str(input_file): None},
-        outputs={str(output_file): output_args_trim_video(start_secs, end_secs)},
-    )
-    ff.run()
-    log.debug(ff)
+    _video_trim(input_file, output_file, start_secs, end_secs)
 
 
 def find(
@@ -236,8 +1309,20 @@ def find(
 
 
 def transcript_to_vtt(
-    audio_or_video_file_or_url: str, vtt_file: str, transcript: str
+    audio_or_video_file_or_url: str,
+    vtt_file: str,
+    transcript: str,
+    probe: Optional[MediaProbe] = None,
+    cue_length: int = DEFAULT_CUE_LENGTH,
+    timing: TimingStrategy = None,
+    previous_vtt: str = None,
 ) -> str:
+    """
+    Writes subtitles for the transcript to vtt_file.
+    When given the vtt of the transcript this one was edited from,
+    only the edited words are re-timed (falling back to uniform timing
+    when the edit changed most of the transcript)
+    """
     log.info("%s, %s, %s", audio_or_video_file_or_url, vtt_file, transcript)
 
     if not os.path.exists(audio_or_video_file_or_url) and not re.search(
@@ -246,39 +1331,22 @@ def transcript_to_vtt(
         raise Exception(
             f"ERROR: Can't generate vtt, {audio_or_video_file_or_url} doesn't exist or is not a valid url"
         )
-    duration = find_duration(audio_or_video_file_or_url)
+    duration = find_duration(audio_or_video_file_or_url, probe=probe)
     log.debug(duration)
     if duration <= 0:
         log.warning(f"video duration for {audio_or_video_file_or_url} returned 0")
         return ""
-    piece_length = 68
-    word_indexes = find(transcript, " ")
-    split_index = [0]
-    for k in range(1, len(word_indexes)):
-        for el in range(1, len(word_indexes)):
-            if word_indexes[el] > piece_length * k:
-                split_index.append(word_indexes[el])
-                break
-    split_index.append(len(transcript))
-    log.debug(split_index)
-    amount_of_chunks = math.ceil(len(transcript) / piece_length)
-    log.debug(amount_of_chunks)
-    vtt_str = "WEBVTT FILE:\n\n"
-    for j in range(len(split_index) - 1):  # this uses a constant piece length
-        seconds_start = round((duration / amount_of_chunks) * j, 2) + 0.85
-        seconds_end = round((duration / amount_of_chunks) * (j + 1), 2) + 0.85
-        output_start = (
-            str(math.floor(seconds_start / 60)).zfill(2)
-            + ":"
-            + ("%.3f" % (seconds_start % 60)).zfill(6)
+    vtt_str = cues_to_vtt(
+        transcript_to_cues(
+            transcript,
+            duration,
+            cue_length=cue_length,
+            timing=timing,
+            previous_words=word_timings_from_vtt(previous_vtt)
+            if previous_vtt
+            else None,
         )
-        output_end = (
-            str(math.floor(seconds_end / 60)).zfill(2)
-            + ":"
-            + ("%.3f" % (seconds_end % 60)).zfill(6)
-        )
-        vtt_str += f"00:{output_start} --> 00:{output_end}\n"
-        vtt_str += f"{transcript[split_index[j] : split_index[j + 1]]}\n\n"
+    )
     os.makedirs(os.path.dirname(vtt_file), exist_ok=True)
     with open(vtt_file, "w") as f:
         f.write(vtt_str)
@@ -286,73 +1354,17 @@ def transcript_to_vtt(
     return vtt_str
 
 
-@dataclass
-class TimestampSegment:
-    secs_start: float
-    secs_end: float
-    transcript_segment: str
-
-
-def vtt_str_file_to_objects(vtt_str_file) -> List[TimestampSegment]:
-    timestamp_segs = []
-    vtt_file = open(vtt_str_file, "r")
-    line = vtt_file.readline()
-    while line:
-        if re.search("^00:", line):
-            timestamp_split = line.split(" --> ")
-            start_duration = timestamp_split[0]
-            (
-                start_hours,
-                start_minutes,
-                start_seconds,
-            ) = start_duration.split(":")
-            end_duration = timestamp_split[1]
-            (
-                end_hours,
-                end_minutes,
-                end_seconds,
-            ) = end_duration.split(":")
-            timestamp_segs.append(
-                TimestampSegment(
-                    float(start_minutes) * 60 + float(start_seconds),
-                    float(end_minutes) * 60 + float(end_seconds),
-                    vtt_file.readline().strip(),
-                )
-            )
-        line = vtt_file.readline()
-    vtt_file.close()
-    return timestamp_segs
-
-
 def trim_vtt_and_transcript_via_timestamps(
     vtt_str_file: str, trim_start_secs: float, trim_end_secs: float
-):
-    timestamp_segs = vtt_str_file_to_objects(vtt_str_file)
-    # Removes timestamp segments that come after the new end of the video
-    # In the future, should also accomodate for the user trimming the start of the video
-    for timestamp_seg in timestamp_segs[:]:
-        if timestamp_seg.secs_start >= trim_end_secs:
-            timestamp_segs.remove(timestamp_seg)
-
-    new_vtt_str = "WEBVTT FILE:\n\n"
-    new_transcript = ""
-    for timestamp_seg in timestamp_segs:
-        output_start = (
-            str(math.floor(timestamp_seg.secs_start / 60)).zfill(2)
-            + ":"
-            + ("%.3f" % (timestamp_seg.secs_start % 60)).zfill(6)
-        )
-        output_end = (
-            str(math.floor(timestamp_seg.secs_end / 60)).zfill(2)
-            + ":"
-            + ("%.3f" % (timestamp_seg.secs_end % 60)).zfill(6)
-        )
-        new_vtt_str += f"00:{output_start} --> 00:{output_end}\n"
-        new_vtt_str += f"{timestamp_seg.transcript_segment}\n\n"
-        new_transcript += f"{timestamp_seg.transcript_segment} "
-    new_transcript = new_transcript.strip()
-
-    vtt_file = open(vtt_str_file, "w")
-    vtt_file.write(new_vtt_str)
-    vtt_file.close()
+) -> Tuple[str, str]:
+    """
+    Trims the vtt file in place to the cues within the trim window
+    (shifted so the window starts at 0)
+    and returns the trimmed vtt and its transcript
+    """
+    new_transcript = trim_vtt_file(
+        vtt_str_file, vtt_str_file, trim_start_secs, trim_end_secs
+    )
+    with open(vtt_str_file, "r") as f:
+        new_vtt_str = f.read()
     return new_vtt_str, new_transcript
@@ -12,10 +12,7 @@ from pathlib import Path
 from tempfile import mkdtemp
 from shutil import copyfile, rmtree
 from typing import List, Tuple
-import urllib.request
 
-import boto3
-from boto3_type_annotations.s3 import Client as S3Client
 import transcribe
 import uuid
 
@@ -29,11 +26,20 @@ from . import (
     TrimExistingUploadRequest,
     RegenVTTRequest,
 )
+from .artifacts import get_artifact_store
+from .dedupe import copy_renditions, find_upload_manifest, record_upload_manifest
+from .s3 import get_s3_client, get_s3_transfer_config
+from .status import TaskProgressReporter, report_task_status
+from .transfer import (
+    HostConnectionLimiter,
+    get_transfer_max_connections_per_host,
+    get_transfer_max_workers,
+    run_concurrently,
+    stream_url_to_s3,
+)
 from .media_tools import (
-    video_trim,
     existing_video_trim,
-    video_encode_for_mobile,
-    video_encode_for_web,
+    video_encode_for_web_and_mobile,
     video_to_audio,
     transcript_to_vtt,
     trim_vtt_and_transcript_via_timestamps,
@@ -46,7 +52,6 @@ from .api import (
     upload_update_answer,
     update_media,
     AnswerUpdateRequest,
-    upload_task_status_update,
     UpdateTaskStatusRequest,
     MediaUpdateRequest,
     fetch_answer_transcript_and_media,
@@ -67,15 +72,6 @@ def _require_env(n: str) -> str:
     return env_val
 
 
-def _create_s3_client() -> S3Client:
-    return boto3.client(
-        "s3",
-        region_name=_require_env("STATIC_AWS_REGION"),
-        aws_access_key_id=_require_env("STATIC_AWS_ACCESS_KEY_ID"),
-        aws_secret_access_key=_require_env("STATIC_AWS_SECRET_ACCESS_KEY"),
-    )
-
-
 def _new_work_dir_name() -> str:
     return str(uuid.uuid1())  # can use uuid1 here cos private to server
 
@@ -120,8 +116,26 @@ def _trimming_work_dir():
             logging.exception(x)
 
 
+@contextmanager
+def _stage_video_work_dir(params: dict):
+    """
+    Yields (video_file, work_dir) on the local disk for a stage
+    that consumes the video produced by trim_upload_stage.
+    With a non-local artifact store the video is fetched
+    (through the node's artifact cache) into a work dir private to the stage,
+    because this stage may run on a different host than trim_upload_stage.
+    """
+    video_artifact = params.get("video_artifact")
+    store = get_artifact_store()
+    if not video_artifact or store.is_local:
+        yield (Path(params.get("video_file")), Path(params.get("work_dir")))
+        return
+    with _trimming_work_dir() as stage_work_dir:
+        yield (Path(store.fetch(video_artifact)), stage_work_dir)
+
+
 def cancel_task(req: CancelTaskRequest) -> CancelTaskResponse:
-    upload_task_status_update(
+    report_task_status(
         UpdateTaskStatusRequest(
             mentor=req.get("mentor"),
             question=req.get("question"),
@@ -129,8 +143,10 @@ def cancel_task(req: CancelTaskRequest) -> CancelTaskResponse:
             new_status="CANCELLING",
         )
     )
+    # the task's ffmpeg processes run in the worker process of the task,
+    # which kills them when the revoke (after this) terminates the task
     # TODO: potentially need to cancel s3 upload and aws transcribe if they have already started?
-    upload_task_status_update(
+    report_task_status(
         UpdateTaskStatusRequest(
             mentor=req.get("mentor"),
             question=req.get("question"),
@@ -149,7 +165,7 @@ def trim_upload_stage(req: ProcessAnswerRequest, task_id: str):
     trim = req.get("trim", None)
     video_path = req.get("video_path", "")
     if not video_path:
-        upload_task_status_update(
+        report_task_status(
             UpdateTaskStatusRequest(
                 mentor=req.get("mentor"),
                 question=req.get("question"),
@@ -160,7 +176,7 @@ def trim_upload_stage(req: ProcessAnswerRequest, task_id: str):
         raise Exception("missing required param 'video_path'")
     video_path_full = upload_path(video_path)
     if not path.isfile(video_path_full):
-        upload_task_status_update(
+        report_task_status(
             UpdateTaskStatusRequest(
                 mentor=req.get("mentor"),
                 question=req.get("question"),
@@ -172,7 +188,7 @@ def trim_upload_stage(req: ProcessAnswerRequest, task_id: str):
     with _video_work_dir(video_path_full) as context:
         try:
             video_file, work_dir = context
-            upload_task_status_update(
+            report_task_status(
                 UpdateTaskStatusRequest(
                     mentor=req.get("mentor"),
                     question=req.get("question"),
@@ -180,13 +196,16 @@ def trim_upload_stage(req: ProcessAnswerRequest, task_id: str):
                     new_status="IN_PROGRESS",
                 )
             )
-            if trim:
-                trim_file = work_dir / "trim.mp4"
-                video_trim(video_file, trim_file, trim.get("start"), trim.get("end"))
-                from shutil import copyfile
-
-                copyfile(trim_file, video_file)
-            upload_task_status_update(
+            # the trim is applied by the encoders of the downstream stages,
+            # which only decode the trim window of the uploaded video
+            store = get_artifact_store()
+            video_artifact = store.put(
+                str(video_file), f"{work_dir.name}/{video_file.name}"
+            )
+            if not store.is_local:
+                # downstream stages fetch the video from the store
+                _delete_video_work_dir(work_dir)
+            report_task_status(
                 UpdateTaskStatusRequest(
                     mentor=req.get("mentor"),
                     question=req.get("question"),
@@ -194,13 +213,24 @@ def trim_upload_stage(req: ProcessAnswerRequest, task_id: str):
                     new_status="DONE",
                 )
             )
-            return {"video_file": str(video_file), "work_dir": str(work_dir)}
+            result = {
+                "video_file": str(video_file),
+                "work_dir": str(work_dir),
+                "video_artifact": video_artifact,
+                "trim": trim,
+            }
+            # an identical upload was processed before,
+            # the next stages reuse what it produced
+            manifest = find_upload_manifest(req)
+            if manifest:
+                result["dedupe_manifest"] = manifest
+            return result
         except Exception as x:
             import logging
 
             logging.exception(x)
             _delete_video_work_dir(work_dir)
-            upload_task_status_update(
+            report_task_status(
                 UpdateTaskStatusRequest(
                     mentor=req.get("mentor"),
                     question=req.get("question"),
@@ -219,9 +249,15 @@ def extract_params_for_transcode_transcribe_stages(
             params["video_file"] = dic["video_file"]
         if "work_dir" in dic:
             params["work_dir"] = dic["work_dir"]
+        if "video_artifact" in dic:
+            params["video_artifact"] = dic["video_artifact"]
+        if "trim" in dic:
+            params["trim"] = dic["trim"]
+        if "dedupe_manifest" in dic:
+            params["dedupe_manifest"] = dic["dedupe_manifest"]
 
     if "video_file" not in params:
-        upload_task_status_update(
+        report_task_status(
             UpdateTaskStatusRequest(
                 mentor=req.get("mentor"),
                 question=req.get("question"),
@@ -231,7 +267,7 @@ def extract_params_for_transcode_transcribe_stages(
         )
         raise Exception("missing required param 'video_file'")
     if "work_dir" not in params:
-        upload_task_status_update(
+        report_task_status(
             UpdateTaskStatusRequest(
                 mentor=req.get("mentor"),
                 question=req.get("question"),
@@ -241,7 +277,7 @@ def extract_params_for_transcode_transcribe_stages(
         )
         raise Exception("missing required param 'work_dir'")
     if "video_path" not in params:
-        upload_task_status_update(
+        report_task_status(
             UpdateTaskStatusRequest(
                 mentor=req.get("mentor"),
                 question=req.get("question"),
@@ -253,38 +289,30 @@ def extract_params_for_transcode_transcribe_stages(
     return params
 
 
-def transcode_stage(dict_tuple: dict, req: ProcessAnswerRequest, task_id: str):
-    params = extract_params_for_transcode_transcribe_stages(dict_tuple, req, task_id)
-    try:
-        mentor = params.get("mentor")
-        question = params.get("question")
-        work_dir = Path(params.get("work_dir"))
-        video_file = Path(params.get("video_file"))
-        MediaUpload = Tuple[  # noqa: N806
-            str, str, str, str, str
-        ]  # media_type, tag, file_name, content_type, file
-        media_uploads: List[MediaUpload] = []
-        upload_task_status_update(
-            UpdateTaskStatusRequest(
-                mentor=req.get("mentor"),
-                question=req.get("question"),
-                task_id=task_id,
-                new_status="IN_PROGRESS",
-            )
+def _transcode_and_upload(params: dict, task_id: str, video_path_base: str):
+    MediaUpload = Tuple[  # noqa: N806
+        str, str, str, str, str
+    ]  # media_type, tag, file_name, content_type, file
+    media_uploads: List[MediaUpload] = []
+    with _stage_video_work_dir(params) as (stage_video_file, stage_work_dir):
+        video_mobile_file = stage_work_dir / "mobile.mp4"
+        video_web_file = stage_work_dir / "web.mp4"
+        video_encode_for_web_and_mobile(
+            stage_video_file,
+            video_web_file,
+            video_mobile_file,
+            trim=params.get("trim"),
+            chunked=params.get("chunked_encode"),
+            on_progress=TaskProgressReporter(task_id, "transcoding"),
         )
-        video_mobile_file = work_dir / "mobile.mp4"
-        video_encode_for_mobile(video_file, video_mobile_file)
         media_uploads.append(
             ("video", "mobile", "mobile.mp4", "video/mp4", video_mobile_file)
         )
-        video_web_file = work_dir / "web.mp4"
-        video_encode_for_web(video_file, video_web_file)
         media_uploads.append(("video", "web", "web.mp4", "video/mp4", video_web_file))
 
         media = []
-        s3 = _create_s3_client()
+        s3 = get_s3_client()
         s3_bucket = _require_env("STATIC_AWS_S3_BUCKET")
-        video_path_base = f"videos/{mentor}/{question}/{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}/"
         for media_type, tag, file_name, content_type, file in media_uploads:
             if path.isfile(file):
                 item_path = f"{video_path_base}{file_name}"
@@ -300,13 +328,39 @@ def transcode_stage(dict_tuple: dict, req: ProcessAnswerRequest, task_id: str):
                     s3_bucket,
                     item_path,
                     ExtraArgs={"ContentType": content_type},
+                    Config=get_s3_transfer_config(),
                 )
             else:
                 import logging
 
                 logging.error(f"Failed to find file at {file}")
+    return media
+
 
-        upload_task_status_update(
+def transcode_stage(dict_tuple: dict, req: ProcessAnswerRequest, task_id: str):
+    params = extract_params_for_transcode_transcribe_stages(dict_tuple, req, task_id)
+    try:
+        mentor = params.get("mentor")
+        question = params.get("question")
+        work_dir = Path(params.get("work_dir"))
+        video_file = Path(params.get("video_file"))
+        report_task_status(
+            UpdateTaskStatusRequest(
+                mentor=req.get("mentor"),
+                question=req.get("question"),
+                task_id=task_id,
+                new_status="IN_PROGRESS",
+            )
+        )
+        s3 = get_s3_client()
+        s3_bucket = _require_env("STATIC_AWS_S3_BUCKET")
+        video_path_base = f"videos/{mentor}/{question}/{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}/"
+        media = copy_renditions(
+            s3, s3_bucket, params.get("dedupe_manifest"), video_path_base
+        )
+        if media is None:
+            media = _transcode_and_upload(params, task_id, video_path_base)
+        report_task_status(
             UpdateTaskStatusRequest(
                 mentor=req.get("mentor"),
                 question=req.get("question"),
@@ -314,17 +368,20 @@ def transcode_stage(dict_tuple: dict, req: ProcessAnswerRequest, task_id: str):
                 new_status="DONE",
             )
         )
-        return {
+        result = {
             "media": media,
             "video_file": str(video_file),
             "work_dir": str(work_dir),
         }
+        if params.get("video_artifact"):
+            result["video_artifact"] = params["video_artifact"]
+        return result
     except Exception as x:
         import logging
 
         logging.exception(x)
         _delete_video_work_dir(work_dir)
-        upload_task_status_update(
+        report_task_status(
             UpdateTaskStatusRequest(
                 mentor=req.get("mentor"),
                 question=req.get("question"),
@@ -334,19 +391,39 @@ def transcode_stage(dict_tuple: dict, req: ProcessAnswerRequest, task_id: str):
         )
 
 
+def _transcribe(params: dict, task_id: str) -> Tuple[str, str]:
+    with _stage_video_work_dir(params) as (stage_video_file, stage_work_dir):
+        audio_file = video_to_audio(
+            str(stage_video_file),
+            str(stage_work_dir / f"{stage_video_file.stem}.mp3"),
+            trim=params.get("trim"),
+            on_progress=TaskProgressReporter(task_id, "transcribing"),
+        )
+        transcription_service = transcribe.init_transcription_service()
+        transcribe_result = transcription_service.transcribe(
+            [
+                transcribe.TranscribeJobRequest(
+                    sourceFile=audio_file, generateSubtitles=True
+                )
+            ]
+        )
+    job_result = transcribe_result.first()
+    transcript = job_result.transcript if job_result else ""
+    subtitles = job_result.subtitles if job_result else ""
+    return transcript, subtitles
+
+
 def transcribe_stage(dict_tuple: dict, req: ProcessAnswerRequest, task_id: str):
     params = extract_params_for_transcode_transcribe_stages(dict_tuple, req, task_id)
     try:
         mentor = params.get("mentor")
         question = params.get("question")
         work_dir = params.get("work_dir")
-        video_file = params.get("video_file")
         is_idle = is_idle_question(question)
-        audio_file = video_to_audio(video_file)
         transcript = ""
         subtitles = ""
         if not is_idle:
-            upload_task_status_update(
+            report_task_status(
                 UpdateTaskStatusRequest(
                     mentor=mentor,
                     question=question,
@@ -354,18 +431,13 @@ def transcribe_stage(dict_tuple: dict, req: ProcessAnswerRequest, task_id: str):
                     new_status="IN_PROGRESS",
                 )
             )
-            transcription_service = transcribe.init_transcription_service()
-            transcribe_result = transcription_service.transcribe(
-                [
-                    transcribe.TranscribeJobRequest(
-                        sourceFile=audio_file, generateSubtitles=True
-                    )
-                ]
-            )
-            job_result = transcribe_result.first()
-            transcript = job_result.transcript if job_result else ""
-            subtitles = job_result.subtitles if job_result else ""
-        upload_task_status_update(
+            manifest = params.get("dedupe_manifest") or {}
+            if "transcript" in manifest:
+                transcript = manifest["transcript"]
+                subtitles = manifest.get("subtitles") or ""
+            else:
+                transcript, subtitles = _transcribe(params, task_id)
+        report_task_status(
             UpdateTaskStatusRequest(
                 mentor=mentor,
                 question=question,
@@ -373,13 +445,17 @@ def transcribe_stage(dict_tuple: dict, req: ProcessAnswerRequest, task_id: str):
                 new_status="DONE",
             )
         )
-        return {"transcript": transcript, "subtitles": subtitles}
+        return {
+            "transcript": transcript,
+            "subtitles": subtitles,
+            "transcribed": not is_idle,
+        }
     except Exception as x:
         import logging
 
         logging.exception(x)
         _delete_video_work_dir(work_dir)
-        upload_task_status_update(
+        report_task_status(
             UpdateTaskStatusRequest(
                 mentor=mentor,
                 question=question,
@@ -409,9 +485,13 @@ def extract_params_for_finalization_stage(
                 params["media"].append(media)
         if "work_dir" in dic:
             params["work_dir"] = dic["work_dir"]
+        if "video_artifact" in dic:
+            params["video_artifact"] = dic["video_artifact"]
+        if "transcribed" in dic:
+            params["transcribed"] = dic["transcribed"]
 
     if "media" not in params:
-        upload_task_status_update(
+        report_task_status(
             UpdateTaskStatusRequest(
                 mentor=req.get("mentor"),
                 question=req.get("question"),
@@ -422,7 +502,7 @@ def extract_params_for_finalization_stage(
         raise Exception("Missing media param in finalization stage")
 
     if "transcript" not in params:
-        upload_task_status_update(
+        report_task_status(
             UpdateTaskStatusRequest(
                 mentor=req.get("mentor"),
                 question=req.get("question"),
@@ -432,7 +512,7 @@ def extract_params_for_finalization_stage(
         )
         raise Exception("Missing transcript param in finalization stage")
     if "video_path" not in params:
-        upload_task_status_update(
+        report_task_status(
             UpdateTaskStatusRequest(
                 mentor=req.get("mentor"),
                 question=req.get("question"),
@@ -457,7 +537,7 @@ def finalization_stage(dict_tuple: dict, req: ProcessAnswerRequest, task_id: str
     work_dir = Path(params.get("work_dir"))
     try:
         video_path_full = upload_path(params["video_path"])
-        upload_task_status_update(
+        report_task_status(
             UpdateTaskStatusRequest(
                 mentor=req.get("mentor"),
                 question=req.get("question"),
@@ -485,7 +565,7 @@ def finalization_stage(dict_tuple: dict, req: ProcessAnswerRequest, task_id: str
                 logging.exception(vtt_err)
 
         if media_uploads:
-            s3 = _create_s3_client()
+            s3 = get_s3_client()
             s3_bucket = _require_env("STATIC_AWS_S3_BUCKET")
             video_path_base = f"videos/{mentor}/{question}/{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}/"
             for media_type, tag, file_name, content_type, file in media_uploads:
@@ -503,6 +583,7 @@ def finalization_stage(dict_tuple: dict, req: ProcessAnswerRequest, task_id: str
                         s3_bucket,
                         item_path,
                         ExtraArgs={"ContentType": content_type},
+                        Config=get_s3_transfer_config(),
                     )
                 else:
                     import logging
@@ -517,7 +598,11 @@ def finalization_stage(dict_tuple: dict, req: ProcessAnswerRequest, task_id: str
                 has_edited_transcript=False,
             )
         )
-        upload_task_status_update(
+        if params.get("transcribed"):
+            record_upload_manifest(params, media, transcript, subtitles)
+        else:
+            record_upload_manifest(params, media)
+        report_task_status(
             UpdateTaskStatusRequest(
                 mentor=mentor,
                 question=question,
@@ -533,7 +618,7 @@ def finalization_stage(dict_tuple: dict, req: ProcessAnswerRequest, task_id: str
 
         logging.exception(x)
         _delete_video_work_dir(work_dir)
-        upload_task_status_update(
+        report_task_status(
             UpdateTaskStatusRequest(
                 mentor=req.get("mentor"),
                 question=req.get("question"),
@@ -547,6 +632,8 @@ def finalization_stage(dict_tuple: dict, req: ProcessAnswerRequest, task_id: str
             #  We generally do want to clean these up, but maybe should have a flag
             # in the job request like "disable_delete_file_on_complete" (default False)
             _delete_video_work_dir(work_dir)
+            if params.get("video_artifact"):
+                get_artifact_store().delete(params["video_artifact"])
             remove(video_path_full)
         except Exception as x:
             import logging
@@ -567,7 +654,7 @@ def trim_existing_upload(req: TrimExistingUploadRequest, task_id: str):
                 answer_media,
                 has_edited_transcript,
             ) = fetch_answer_transcript_and_media(mentor, question)
-            upload_task_status_update(
+            report_task_status(
                 UpdateTaskStatusRequest(
                     mentor=mentor,
                     question=question,
@@ -622,7 +709,7 @@ def trim_existing_upload(req: TrimExistingUploadRequest, task_id: str):
                 new_media.append(vtt_media)
 
             if media_uploads:
-                s3 = _create_s3_client()
+                s3 = get_s3_client()
                 s3_bucket = _require_env("STATIC_AWS_S3_BUCKET")
                 video_path_base = f"videos/{mentor}/{question}/{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}/"
                 for media_type, tag, file_name, content_type, file in media_uploads:
@@ -640,6 +727,7 @@ def trim_existing_upload(req: TrimExistingUploadRequest, task_id: str):
                             s3_bucket,
                             item_path,
                             ExtraArgs={"ContentType": content_type},
+                            Config=get_s3_transfer_config(),
                         )
                     else:
                         import logging
@@ -654,7 +742,7 @@ def trim_existing_upload(req: TrimExistingUploadRequest, task_id: str):
                     media=new_media,
                 )
             )
-            upload_task_status_update(
+            report_task_status(
                 UpdateTaskStatusRequest(
                     mentor=mentor,
                     question=question,
@@ -668,7 +756,7 @@ def trim_existing_upload(req: TrimExistingUploadRequest, task_id: str):
         except Exception as x:
             import logging
 
-            upload_task_status_update(
+            report_task_status(
                 UpdateTaskStatusRequest(
                     mentor=mentor,
                     question=question,
@@ -701,10 +789,24 @@ def regen_vtt(req: RegenVTTRequest):
                 raise Exception(
                     f"failed to find answer media for mentor: {mentor} and question: {question}"
                 )
-            transcript_to_vtt(web_media["url"], vtt_file, transcript)
+            vtt_media = next(
+                (x for x in answer_media if x["type"] == "subtitles"), None
+            )
+            previous_vtt = None
+            if vtt_media:
+                try:
+                    previous_vtt = fetch_text_from_url(vtt_media["url"])
+                except Exception as x:
+                    import logging
+
+                    # without it the subtitles are timed uniformly
+                    logging.warning(f"failed to fetch previous vtt: {x}")
+            transcript_to_vtt(
+                web_media["url"], vtt_file, transcript, previous_vtt=previous_vtt
+            )
             media_uploads = [("subtitles", "en", "en.vtt", "text/vtt", vtt_file)]
             new_media = []
-            s3 = _create_s3_client()
+            s3 = get_s3_client()
             s3_bucket = _require_env("STATIC_AWS_S3_BUCKET")
             video_path_base = f"videos/{mentor}/{question}/{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}/"
             for media_type, tag, file_name, content_type, file in media_uploads:
@@ -722,6 +824,7 @@ def regen_vtt(req: RegenVTTRequest):
                         s3_bucket,
                         item_path,
                         ExtraArgs={"ContentType": content_type},
+                        Config=get_s3_transfer_config(),
                     )
                 else:
                     import logging
@@ -751,7 +854,7 @@ def process_transfer_video(req: ProcessTransferRequest, task_id: str):
     media = answer.get("media", [])
     if not answer.get("hasUntransferredMedia", False):
         return
-    upload_task_status_update(
+    report_task_status(
         UpdateTaskStatusRequest(
             mentor=mentor,
             question=question,
@@ -761,27 +864,20 @@ def process_transfer_video(req: ProcessTransferRequest, task_id: str):
             media=media,
         )
     )
+    s3_bucket = _require_env("STATIC_AWS_S3_BUCKET")
     for m in media:
         if m.get("needsTransfer", False):
             typ = m.get("type", "")
             tag = m.get("tag", "")
             root_ext = "vtt" if typ == "subtitles" else "mp4"
             try:
-                file_path, headers = urllib.request.urlretrieve(m.get("url", ""))
                 item_path = f"videos/{mentor}/{question}/{tag}.{root_ext}"
-                s3 = _create_s3_client()
-                s3_bucket = _require_env("STATIC_AWS_S3_BUCKET")
                 content_type = "text/vtt" if typ == "subtitles" else "video/mp4"
-                s3.upload_file(
-                    file_path,
-                    s3_bucket,
-                    item_path,
-                    ExtraArgs={"ContentType": content_type},
-                )
+                stream_url_to_s3(m.get("url", ""), s3_bucket, item_path, content_type)
                 m["needsTransfer"] = False
                 m["url"] = item_path
 
-                upload_task_status_update(
+                report_task_status(
                     UpdateTaskStatusRequest(
                         mentor=mentor,
                         question=question,
@@ -798,7 +894,7 @@ def process_transfer_video(req: ProcessTransferRequest, task_id: str):
                 logging.error(f"Failed to upload video to s3 {x}")
 
                 logging.exception(x)
-                upload_task_status_update(
+                report_task_status(
                     UpdateTaskStatusRequest(
                         mentor=mentor,
                         question=question,
@@ -808,14 +904,6 @@ def process_transfer_video(req: ProcessTransferRequest, task_id: str):
                         media=media,
                     )
                 )
-            finally:
-                try:
-                    remove(file_path)
-                except Exception as x:
-                    import logging
-
-                    logging.error(f"failed to delete file '{file_path}'")
-                    logging.exception(x)
 
 
 def process_transfer_mentor(req: ProcessTransferMentor, task_id: str):
@@ -861,63 +949,47 @@ def process_transfer_mentor(req: ProcessTransferMentor, task_id: str):
         ImportTaskUpdateGQLRequest(mentor=mentor, s3_video_migration=s3_video_migration)
     )
 
-    for answer in answers_with_media_transfers:
-        try:
-            question = answer["question"]["_id"]
-            for m in answer["media"]:
-                if m.get("needsTransfer", False):
-                    typ = m.get("type", "")
-                    tag = m.get("tag", "")
-                    root_ext = "vtt" if typ == "subtitles" else "mp4"
-                    try:
-                        file_path, headers = urllib.request.urlretrieve(
-                            m.get("url", "")
-                        )
-                        item_path = f"videos/{mentor}/{question}/{tag}.{root_ext}"
-                        s3 = _create_s3_client()
-                        s3_bucket = _require_env("STATIC_AWS_S3_BUCKET")
-                        content_type = "text/vtt" if typ == "subtitles" else "video/mp4"
-                        s3.upload_file(
-                            file_path,
-                            s3_bucket,
-                            item_path,
-                            ExtraArgs={"ContentType": content_type},
-                        )
-                        m["needsTransfer"] = False
-                        m["url"] = item_path
-                        update_media_vars = {"mentor": mentor, "question": question}
-                        if tag == "en":
-                            update_media_vars["vtt_media"] = m
-                        if tag == "web":
-                            update_media_vars["web_media"] = m
-                        if tag == "mobile":
-                            update_media_vars["mobile_media"] = m
-                        update_media(MediaUpdateRequest(**update_media_vars))
-                        answer_media_migrate_update = {
-                            "question": question,
-                            "status": "DONE",
-                        }
-                        import_task_update_gql(
-                            ImportTaskUpdateGQLRequest(
-                                mentor=mentor,
-                                answerMediaMigrateUpdate=answer_media_migrate_update,
-                            )
-                        )
+    s3_bucket = _require_env("STATIC_AWS_S3_BUCKET")
+    limiter = HostConnectionLimiter(get_transfer_max_connections_per_host())
+    run_concurrently(
+        lambda answer: _transfer_answer_media(mentor, answer, s3_bucket, limiter),
+        answers_with_media_transfers,
+        max_workers=get_transfer_max_workers(),
+    )
 
-                    except Exception as x:
-                        media_url = m.get("url", "")
-                        logging.error(f"Failed to upload video {media_url} to s3 {x}")
-                        logging.exception(x)
-                        raise x
-                    finally:
-                        try:
-                            remove(file_path)
-                        except Exception as x:
-                            import logging
-
-                            logging.error(f"failed to delete file '{file_path}'")
-                            logging.exception(x)
-                else:
+
+def _transfer_answer_media(
+    mentor: str, answer: dict, s3_bucket: str, limiter: HostConnectionLimiter
+) -> None:
+    import logging
+
+    question = answer["question"]["_id"]
+    try:
+        for m in answer["media"]:
+            if m.get("needsTransfer", False):
+                typ = m.get("type", "")
+                tag = m.get("tag", "")
+                root_ext = "vtt" if typ == "subtitles" else "mp4"
+                try:
+                    item_path = f"videos/{mentor}/{question}/{tag}.{root_ext}"
+                    content_type = "text/vtt" if typ == "subtitles" else "video/mp4"
+                    stream_url_to_s3(
+                        m.get("url", ""),
+                        s3_bucket,
+                        item_path,
+                        content_type,
+                        limiter=limiter,
+                    )
+                    m["needsTransfer"] = False
+                    m["url"] = item_path
+                    update_media_vars = {"mentor": mentor, "question": question}
+                    if tag == "en":
+                        update_media_vars["vtt_media"] = m
+                    if tag == "web":
+                        update_media_vars["web_media"] = m
+                    if tag == "mobile":
+                        update_media_vars["mobile_media"] = m
+                    update_media(MediaUpdateRequest(**update_media_vars))
                     answer_media_migrate_update = {
                         "question": question,
                         "status": "DONE",
@@ -928,18 +1000,33 @@ def process_transfer_mentor(req: ProcessTransferMentor, task_id: str):
                             answerMediaMigrateUpdate=answer_media_migrate_update,
                         )
                     )
-        except Exception as e:
-            logging.error(
-                f"Failed to process media for answer with question {question}"
-            )
-            logging.exception(e)
-            import_task_update_gql(
-                ImportTaskUpdateGQLRequest(
-                    mentor=mentor,
-                    answerMediaMigrateUpdate={
-                        "question": question,
-                        "status": "FAILED",
-                        "errorMessage": str(e),
-                    },
+
+                except Exception as x:
+                    media_url = m.get("url", "")
+                    logging.error(f"Failed to upload video {media_url} to s3 {x}")
+                    logging.exception(x)
+                    raise x
+            else:
+                answer_media_migrate_update = {
+                    "question": question,
+                    "status": "DONE",
+                }
+                import_task_update_gql(
+                    ImportTaskUpdateGQLRequest(
+                        mentor=mentor,
+                        answerMediaMigrateUpdate=answer_media_migrate_update,
+                    )
                 )
+    except Exception as e:
+        logging.error(f"Failed to process media for answer with question {question}")
+        logging.exception(e)
+        import_task_update_gql(
+            ImportTaskUpdateGQLRequest(
+                mentor=mentor,
+                answerMediaMigrateUpdate={
+                    "question": question,
+                    "status": "FAILED",
+                    "errorMessage": str(e),
+                },
             )
+        )
@@ -0,0 +1,83 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+from os import environ, register_at_fork
+import threading
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from boto3_type_annotations.s3 import Client as S3Client
+from botocore.config import Config
+
+MB = 1024 * 1024
+
+_lock = threading.Lock()
+_s3_client = None
+_s3_transfer_config = None
+
+
+def _require_env(n: str) -> str:
+    env_val = environ.get(n, "")
+    if not env_val:
+        raise EnvironmentError(f"missing required env var {n}")
+    return env_val
+
+
+def _int_env(n: str, default: int) -> int:
+    return int(environ.get(n) or default)
+
+
+def _create_s3_client() -> S3Client:
+    return boto3.client(
+        "s3",
+        region_name=_require_env("STATIC_AWS_REGION"),
+        aws_access_key_id=_require_env("STATIC_AWS_ACCESS_KEY_ID"),
+        aws_secret_access_key=_require_env("STATIC_AWS_SECRET_ACCESS_KEY"),
+        config=Config(
+            max_pool_connections=_int_env("S3_MAX_POOL_CONNECTIONS", 50),
+        ),
+    )
+
+
+def _create_s3_transfer_config() -> TransferConfig:
+    return TransferConfig(
+        multipart_threshold=_int_env("S3_MULTIPART_THRESHOLD", 8 * MB),
+        multipart_chunksize=_int_env("S3_MULTIPART_CHUNKSIZE", 8 * MB),
+        max_concurrency=_int_env("S3_MAX_CONCURRENCY", 10),
+    )
+
+
+def get_s3_client() -> S3Client:
+    """
+    Returns the S3 client shared by everything in this worker process,
+    so connections (and TLS sessions) in its pool get reused across uploads
+    """
+    global _s3_client
+    if _s3_client is None:
+        with _lock:
+            if _s3_client is None:
+                _s3_client = _create_s3_client()
+    return _s3_client
+
+
+def get_s3_transfer_config() -> TransferConfig:
+    global _s3_transfer_config
+    if _s3_transfer_config is None:
+        with _lock:
+            if _s3_transfer_config is None:
+                _s3_transfer_config = _create_s3_transfer_config()
+    return _s3_transfer_config
+
+
+def reset_s3_client() -> None:
+    global _lock, _s3_client, _s3_transfer_config
+    _lock = threading.Lock()
+    _s3_client = None
+    _s3_transfer_config = None
+
+
+# connection pools must not be shared with forked (e.g. celery prefork) children
+register_at_fork(after_in_child=reset_s3_client)
@@ -0,0 +1,280 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import atexit
+from dataclasses import asdict, replace
+import logging
+from os import environ, register_at_fork
+import threading
+from time import monotonic
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .api import (
+    TaskStatusBatchError,
+    UpdateTaskStatusRequest,
+    upload_task_status_batch_update,
+    upload_task_status_update,
+)
+from .media_tools import FFmpegProgress
+
+log = logging.getLogger()
+
+_lock = threading.Lock()
+_reporter = None
+
+
+def get_task_status_flush_interval() -> float:
+    """
+    Seconds between flushes of buffered task status updates,
+    0 sends every update synchronously as it is reported
+    """
+    return float(environ.get("TASK_STATUS_FLUSH_INTERVAL") or 0.5)
+
+
+def get_task_status_max_batch_size() -> int:
+    return int(environ.get("TASK_STATUS_MAX_BATCH_SIZE") or 25)
+
+
+def get_task_status_terminate_flush_timeout() -> float:
+    """
+    Seconds a terminated worker process waits for its pending transitions
+    to be sent before it exits
+    """
+    return float(environ.get("TASK_STATUS_TERMINATE_FLUSH_TIMEOUT") or 3.0)
+
+
+def get_task_status_max_retries() -> int:
+    """
+    Times a failed transition is sent again (on the following flushes)
+    before it's given up on
+    """
+    return int(environ.get("TASK_STATUS_MAX_RETRIES") or 5)
+
+
+def get_task_progress_interval() -> float:
+    """
+    Minimum seconds between progress updates of a task
+    """
+    return float(environ.get("TASK_PROGRESS_INTERVAL") or 2.0)
+
+
+def _task_key(req: UpdateTaskStatusRequest) -> Tuple[str, str, str]:
+    return (req.mentor, req.question, req.task_id)
+
+
+class TaskStatusReporter:
+    """
+    Buffers task status transitions and sends them from a background thread,
+    so stages don't wait on GraphQL round trips to report progress.
+
+    Only the latest transition of each task is sent:
+    a transition reported before the previous one was flushed supersedes it
+    (keeping the transcript and media of the superseded one if it has none).
+    Pending transitions are sent in batches (one aliased mutation per batch)
+    every flush_interval seconds, or as soon as flush is called.
+    A transition that fails to send is pending again, unless superseded
+    in the meantime, up to max_retries times.
+    """
+
+    def __init__(
+        self, flush_interval: float, max_batch_size: int = 25, max_retries: int = 5
+    ):
+        self.flush_interval = flush_interval
+        self.max_batch_size = max_batch_size
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+        # serializes flushes so transitions of a task are sent in order
+        self._flush_lock = threading.Lock()
+        self._pending: Dict[Tuple[str, str, str], UpdateTaskStatusRequest] = {}
+        # failed sends of each pending transition
+        self._retries: Dict[Tuple[str, str, str], int] = {}
+        self._wake = threading.Event()
+        self._thread = None
+
+    def report(self, req: UpdateTaskStatusRequest) -> None:
+        if self.flush_interval <= 0:
+            upload_task_status_update(req)
+            return
+        key = _task_key(req)
+        with self._lock:
+            self._retries.pop(key, None)
+            self._put_pending(req)
+            self._ensure_thread()
+
+    def _put_pending(self, req: UpdateTaskStatusRequest) -> None:
+        key = _task_key(req)
+        superseded = self._pending.pop(key, None)
+        if superseded:
+            req = replace(
+                req,
+                transcript=req.transcript or superseded.transcript,
+                media=req.media or superseded.media,
+            )
+        self._pending[key] = req
+
+    def flush(self, wait: bool = True) -> None:
+        """
+        Sends all pending transitions,
+        or with wait=False, wakes the background thread to send them
+        """
+        if not wait:
+            self._wake.set()
+            return
+        with self._flush_lock:
+            with self._lock:
+                pending = list(self._pending.values())
+                retries = {k: self._retries.pop(k) for k in list(self._retries)}
+                self._pending.clear()
+            for i in range(0, len(pending), self.max_batch_size):
+                self._send(pending[i : i + self.max_batch_size], retries)
+
+    def _send(
+        self,
+        batch: List[UpdateTaskStatusRequest],
+        retries: Dict[Tuple[str, str, str], int],
+    ) -> None:
+        try:
+            upload_task_status_batch_update(batch)
+            return
+        except TaskStatusBatchError as x:
+            failed = x.failed
+            log.error(
+                f"failed to update status of tasks {[r.task_id for r in failed]}: {x}"
+            )
+        except Exception as x:
+            failed = batch
+            log.error(
+                f"failed to update status of tasks {[r.task_id for r in batch]}: {x}"
+            )
+            log.exception(x)
+        with self._lock:
+            for req in failed:
+                key = _task_key(req)
+                if key in self._pending:
+                    # superseded by a transition reported since,
+                    # which keeps this one's transcript and media
+                    newer = self._pending.pop(key)
+                    self._put_pending(req)
+                    self._put_pending(newer)
+                    continue
+                attempts = retries.get(key, 0) + 1
+                if attempts > self.max_retries:
+                    log.error(
+                        f"gave up updating task {req.task_id} to {req.new_status}"
+                    )
+                    continue
+                self._retries[key] = attempts
+                self._pending[key] = req
+            if self._pending:
+                self._ensure_thread()
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name="task-status-reporter", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+
+def get_task_status_reporter() -> TaskStatusReporter:
+    global _reporter
+    if _reporter is None:
+        with _lock:
+            if _reporter is None:
+                _reporter = TaskStatusReporter(
+                    get_task_status_flush_interval(),
+                    get_task_status_max_batch_size(),
+                    get_task_status_max_retries(),
+                )
+    return _reporter
+
+
+def report_task_status(req: UpdateTaskStatusRequest) -> None:
+    get_task_status_reporter().report(req)
+
+
+def flush_task_status(wait: bool = True, timeout: Optional[float] = None) -> None:
+    """
+    Sends the pending transitions of this process,
+    with a timeout gives up waiting for them after timeout seconds
+    """
+    if _reporter is None:
+        return
+    if timeout is None:
+        _reporter.flush(wait=wait)
+        return
+    flusher = threading.Thread(
+        target=_reporter.flush, name="task-status-flush", daemon=True
+    )
+    flusher.start()
+    flusher.join(timeout)
+
+
+def reset_task_status_reporter() -> None:
+    global _lock, _reporter
+    _lock = threading.Lock()
+    _reporter = None
+
+
+# (task_id, progress) -> None
+TaskProgressSink = Callable[[str, dict], None]
+
+_progress_sink: Optional[TaskProgressSink] = None
+
+
+def set_task_progress_sink(sink: Optional[TaskProgressSink]) -> None:
+    """
+    Sets where the progress of tasks is sent,
+    e.g. the celery result backend, which the upload status endpoint reads
+    """
+    global _progress_sink
+    _progress_sink = sink
+
+
+class TaskProgressReporter:
+    """
+    Sends the progress of a task's ffmpeg runs to the progress sink,
+    at most once every interval seconds (the last update is always sent)
+    """
+
+    def __init__(self, task_id: str, stage: str, interval: float = None):
+        self.task_id = task_id
+        self.stage = stage
+        self.interval = get_task_progress_interval() if interval is None else interval
+        self._last_sent = None
+
+    def __call__(self, progress: FFmpegProgress) -> None:
+        now = monotonic()
+        if (
+            not progress.done
+            and self._last_sent is not None
+            and now - self._last_sent < self.interval
+        ):
+            return
+        self._last_sent = now
+        # the speed of finished runs is what concurrency gets tuned by
+        (log.info if progress.done else log.debug)(
+            "%s",
+            {"task_id": self.task_id, "stage": self.stage, "progress": progress},
+        )
+        sink = _progress_sink
+        if sink is None:
+            return
+        try:
+            sink(self.task_id, {"stage": self.stage, **asdict(progress)})
+        except Exception as x:
+            log.warning(f"failed to send progress of task {self.task_id}: {x}")
+
+
+# the reporter thread doesn't survive a fork, children start their own
+register_at_fork(after_in_child=reset_task_status_reporter)
+atexit.register(flush_task_status)
@@ -0,0 +1,267 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+"""
+Runs ffmpeg/ffprobe (ffmpy) processes under supervision:
+
+ - every process gets its own process group, so killing it
+   also kills anything it started
+ - a wall-clock timeout kills a hung process
+ - optional nice, CPU affinity and memory limits are applied
+   as soon as the process starts
+ - processes are registered under the task that started them,
+   so cancelling (or terminating) a task kills its processes right away
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+import logging
+import os
+import signal
+import threading
+from typing import Callable, Dict, Optional, Set, Tuple
+
+log = logging.getLogger()
+
+_current_task_id: ContextVar[Optional[str]] = ContextVar(
+    "current_task_id", default=None
+)
+
+
+class ProcessTimeoutError(Exception):
+    pass
+
+
+class ProcessCancelledError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class ProcessLimits:
+    # wall-clock seconds, 0 for none
+    timeout: float = 0.0
+    nice: int = 0
+    cpu_affinity: Tuple[int, ...] = ()
+    # address space bytes, 0 for none
+    memory_bytes: int = 0
+
+
+def parse_cpu_list(cpus: str) -> Tuple[int, ...]:
+    """
+    Parses a cpu list like taskset's, e.g. 0-3,6
+    """
+    parsed = []
+    for part in (cpus or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        parsed.extend(range(int(first), int(last or first) + 1))
+    return tuple(sorted(set(parsed)))
+
+
+def get_process_limits() -> ProcessLimits:
+    return ProcessLimits(
+        timeout=float(os.environ.get("FFMPEG_TIMEOUT") or 3 * 60 * 60),
+        nice=int(os.environ.get("FFMPEG_NICE") or 0),
+        cpu_affinity=parse_cpu_list(os.environ.get("FFMPEG_CPU_AFFINITY") or ""),
+        memory_bytes=int(os.environ.get("FFMPEG_MEMORY_LIMIT_MB") or 0) * 1024 * 1024,
+    )
+
+
+def _apply_limits(pid: int, limits: ProcessLimits) -> None:
+    if limits.nice:
+        # per process group, so it applies to every thread already started
+        os.setpriority(os.PRIO_PGRP, pid, limits.nice)
+    if limits.cpu_affinity:
+        for tid in os.listdir(f"/proc/{pid}/task"):
+            os.sched_setaffinity(int(tid), limits.cpu_affinity)
+    if limits.memory_bytes:
+        import resource
+
+        resource.prlimit(
+            pid, resource.RLIMIT_AS, (limits.memory_bytes, limits.memory_bytes)
+        )
+
+
+class ManagedProcess:
+    """
+    Supervises one run of an ffmpy command from a background thread
+    """
+
+    def __init__(self, ff, limits: ProcessLimits):
+        self.ff = ff
+        self.limits = limits
+        self.killed_because: Optional[str] = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def _process(self):
+        # ffmpy sets process once it started the command
+        return getattr(self.ff, "process", None)
+
+    def kill(self, because: str) -> None:
+        with self._lock:
+            if self.killed_because is None:
+                self.killed_because = because
+            process = self._process()
+            if process is None or process.poll() is not None:
+                # not started yet (supervise kills it once it is) or already exited
+                return
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def supervise(self) -> None:
+        while self._process() is None:
+            if self._done.wait(0.01):
+                return
+        if self.killed_because:
+            self.kill(self.killed_because)
+            return
+        try:
+            _apply_limits(self._process().pid, self.limits)
+        except Exception as x:
+            log.warning(f"failed to apply limits {self.limits}: {x}")
+        if not self._done.wait(self.limits.timeout or None):
+            log.error(f"killing {self.ff}, still running after {self.limits.timeout}s")
+            self.kill("timeout")
+
+    def finish(self) -> None:
+        self._done.set()
+
+
+class ProcessRegistry:
+    """
+    The processes running for each task (None for processes started outside one)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._processes: Dict[Optional[str], Set[ManagedProcess]] = {}
+
+    def add(self, task_id: Optional[str], process: ManagedProcess) -> None:
+        with self._lock:
+            self._processes.setdefault(task_id, set()).add(process)
+
+    def remove(self, task_id: Optional[str], process: ManagedProcess) -> None:
+        with self._lock:
+            processes = self._processes.get(task_id, set())
+            processes.discard(process)
+            if not processes:
+                self._processes.pop(task_id, None)
+
+    def kill(self, task_id: str, because: str = "cancelled") -> int:
+        with self._lock:
+            processes = list(self._processes.get(task_id, ()))
+        for process in processes:
+            process.kill(because)
+        return len(processes)
+
+    def kill_all(self, because: str = "cancelled") -> int:
+        with self._lock:
+            processes = [p for ps in self._processes.values() for p in ps]
+        for process in processes:
+            process.kill(because)
+        return len(processes)
+
+
+_registry = ProcessRegistry()
+
+
+def get_process_registry() -> ProcessRegistry:
+    return _registry
+
+
+@contextmanager
+def task_processes(task_id: str):
+    """
+    Registers the processes started within (in this thread or context)
+    under task_id
+    """
+    token = _current_task_id.set(task_id)
+    try:
+        yield
+    finally:
+        _current_task_id.reset(token)
+
+
+def bind_task_processes(task_id: Optional[str]) -> None:
+    """
+    Like task_processes, for callers that can't wrap the task
+    (e.g. celery's task_prerun/task_postrun signals)
+    """
+    _current_task_id.set(task_id)
+
+
+def kill_task_processes(task_id: str) -> int:
+    """
+    Kills the process groups of every process running for task_id
+    in this process, returns how many were killed
+    """
+    killed = _registry.kill(task_id)
+    if killed:
+        log.info(f"killed {killed} processes of task {task_id}")
+    return killed
+
+
+def run_managed(ff, limits: Optional[ProcessLimits] = None, **kwargs):
+    """
+    Runs an ffmpy command (passing kwargs to its run) in its own process group,
+    killing it when it runs past the timeout or its task gets cancelled.
+    Raises ProcessTimeoutError or ProcessCancelledError when it was killed
+    """
+    process = ManagedProcess(ff, limits or get_process_limits())
+    task_id = _current_task_id.get()
+    _registry.add(task_id, process)
+    threading.Thread(
+        target=process.supervise, name="process-supervisor", daemon=True
+    ).start()
+    try:
+        return ff.run(start_new_session=True, **kwargs)
+    except Exception as x:
+        if process.killed_because == "timeout":
+            raise ProcessTimeoutError(
+                f"{ff} timed out after {process.limits.timeout}s"
+            ) from x
+        if process.killed_because:
+            raise ProcessCancelledError(
+                f"{ff} was killed, task {task_id} {process.killed_because}"
+            ) from x
+        raise
+    finally:
+        process.finish()
+        _registry.remove(task_id, process)
+
+
+def kill_processes_on_terminate(
+    before_exit: Optional[Callable[[], None]] = None
+) -> None:
+    """
+    Makes SIGTERM (what celery's revoke with terminate=True sends
+    to the worker process running the task) kill the process groups
+    of all running processes before the worker process exits,
+    so they don't outlive it as orphans.
+    before_exit (e.g. sending buffered state) is called after,
+    unless an earlier SIGTERM handler takes over
+    """
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def on_terminate(signum, frame):
+        _registry.kill_all("terminated")
+        if callable(previous):
+            previous(signum, frame)
+            return
+        if before_exit is not None:
+            try:
+                before_exit()
+            except Exception as x:
+                log.exception(x)
+        signal.signal(signum, signal.SIG_DFL)
+        os.kill(os.getpid(), signum)
+
+    signal.signal(signal.SIGTERM, on_terminate)
@@ -0,0 +1,180 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager, nullcontext
+import logging
+from os import environ
+import threading
+from typing import Callable, Dict, Iterable, Iterator, TypeVar
+from urllib.parse import urlparse
+
+import requests
+
+from .s3 import MB, get_s3_client
+
+log = logging.getLogger()
+
+T = TypeVar("T")
+
+
+def get_transfer_max_workers() -> int:
+    return int(environ.get("TRANSFER_MAX_WORKERS") or 8)
+
+
+def get_transfer_max_connections_per_host() -> int:
+    return int(environ.get("TRANSFER_MAX_CONNECTIONS_PER_HOST") or 4)
+
+
+class HostConnectionLimiter:
+    """
+    Caps how many transfers run against the same host at once,
+    so a concurrent import doesn't hammer a single origin
+    """
+
+    def __init__(self, max_per_host: int):
+        self.max_per_host = max_per_host
+        self._lock = threading.Lock()
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+
+    def _semaphore(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._semaphores[host]
+
+    @contextmanager
+    def slot(self, url: str):
+        with self._semaphore(urlparse(url).netloc):
+            yield
+
+
+# S3 requires every part of a multipart upload except the last to be >= 5MB
+MIN_PART_SIZE = 5 * MB
+
+
+def get_transfer_part_size() -> int:
+    return max(int(environ.get("TRANSFER_PART_SIZE") or 8 * MB), MIN_PART_SIZE)
+
+
+def get_transfer_max_resumes() -> int:
+    return int(environ.get("TRANSFER_MAX_RESUMES") or 5)
+
+
+def iter_url_parts(
+    url: str, part_size: int, max_resumes: int, chunk_size: int = 64 * 1024
+) -> Iterator[bytes]:
+    """
+    Yields the body of a GET on url in parts of exactly part_size bytes
+    (the last part may be smaller, and there is always at least one part).
+    Only one part is held in memory at a time.
+    If the connection drops mid-body, the download resumes
+    with a ranged GET from the last byte received (up to max_resumes times).
+    """
+    offset = 0
+    resumes = 0
+    etag = None
+    parts_yielded = 0
+    buffer = bytearray()
+    while True:
+        # identity encoding so byte offsets match the Range header
+        headers = {"Accept-Encoding": "identity"}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+            if etag:
+                headers["If-Range"] = etag
+        try:
+            with requests.get(url, headers=headers, stream=True, timeout=60) as res:
+                res.raise_for_status()
+                if offset and res.status_code != 206:
+                    raise Exception(
+                        f"failed to resume download of {url} at byte {offset}: server returned {res.status_code}"
+                    )
+                etag = etag or res.headers.get("ETag")
+                for chunk in res.iter_content(chunk_size=chunk_size):
+                    buffer += chunk
+                    offset += len(chunk)
+                    while len(buffer) >= part_size:
+                        yield bytes(buffer[:part_size])
+                        parts_yielded += 1
+                        del buffer[:part_size]
+            break
+        except (
+            requests.exceptions.ConnectionError,
+            requests.exceptions.ChunkedEncodingError,
+            requests.exceptions.Timeout,
+        ) as x:
+            resumes += 1
+            if resumes > max_resumes:
+                raise x
+            log.warning(
+                f"download of {url} interrupted at byte {offset}, resuming: {x}"
+            )
+    if buffer or not parts_yielded:
+        yield bytes(buffer)
+
+
+def stream_url_to_s3(
+    url: str,
+    s3_bucket: str,
+    item_path: str,
+    content_type: str,
+    limiter: HostConnectionLimiter = None,
+) -> None:
+    """
+    Streams the body of a GET on url into an S3 multipart upload
+    in fixed-size parts, without writing it to local disk
+    """
+    s3 = get_s3_client()
+    with limiter.slot(url) if limiter else nullcontext():
+        upload_id = s3.create_multipart_upload(
+            Bucket=s3_bucket, Key=item_path, ContentType=content_type
+        )["UploadId"]
+        try:
+            parts = []
+            for part_number, body in enumerate(
+                iter_url_parts(
+                    url, get_transfer_part_size(), get_transfer_max_resumes()
+                ),
+                start=1,
+            ):
+                res = s3.upload_part(
+                    Bucket=s3_bucket,
+                    Key=item_path,
+                    UploadId=upload_id,
+                    PartNumber=part_number,
+                    Body=body,
+                )
+                parts.append({"ETag": res["ETag"], "PartNumber": part_number})
+            s3.complete_multipart_upload(
+                Bucket=s3_bucket,
+                Key=item_path,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+        except Exception as x:
+            s3.abort_multipart_upload(
+                Bucket=s3_bucket, Key=item_path, UploadId=upload_id
+            )
+            raise x
+
+
+def run_concurrently(
+    fn: Callable[[T], None], items: Iterable[T], max_workers: int
+) -> None:
+    """
+    Calls fn for every item on a bounded thread pool
+    and waits for all of them to finish.
+    fn is expected to handle (and report) its own failures,
+    anything it raises is logged here so it can't stop the other items
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(fn, item) for item in items]
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as x:
+                log.exception(x)
@@ -0,0 +1,128 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+"""
+Streaming WebVTT parsing and writing.
+
+iter_cues parses cues lazily from any iterable of lines (e.g. an open file),
+VttWriter writes cues one at a time, so subtitles of any length
+are processed in one pass without being loaded into memory.
+"""
+from dataclasses import dataclass
+import math
+import os
+import re
+from typing import Iterable, Iterator, List, TextIO
+
+VTT_HEADER = "WEBVTT FILE:\n\n"
+
+_TIMESTAMP = r"(?:\d+:)?\d{2}:\d{2}(?:\.\d+)?"
+_CUE_TIMING = re.compile(rf"^\s*({_TIMESTAMP})\s+-->\s+({_TIMESTAMP})")
+
+
+@dataclass
+class Cue:
+    start: float
+    end: float
+    # lines of a multi-line cue are joined with \n
+    text: str
+
+
+def parse_timestamp(timestamp: str) -> float:
+    """
+    Parses hh:mm:ss.ttt (hours are optional) to seconds
+    """
+    parts = timestamp.strip().split(":")
+    seconds = float(parts[-1])
+    minutes = int(parts[-2])
+    hours = int(parts[-3]) if len(parts) > 2 else 0
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def format_timestamp(seconds: float) -> str:
+    """
+    Formats seconds as hh:mm:ss.ttt
+    """
+    seconds = max(seconds, 0.0)
+    hours = math.floor(seconds / 3600)
+    minutes = math.floor((seconds % 3600) / 60)
+    return f"{str(hours).zfill(2)}:{str(minutes).zfill(2)}:" + (
+        "%.3f" % (seconds % 60)
+    ).zfill(6)
+
+
+def iter_cues(lines: Iterable[str]) -> Iterator[Cue]:
+    """
+    Yields the cues of a vtt document given as lines,
+    skipping the header, cue identifiers, NOTE and STYLE blocks
+    """
+    timing = None
+    text: List[str] = []
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if timing is None:
+            m = _CUE_TIMING.match(line)
+            if m:
+                timing = (parse_timestamp(m.group(1)), parse_timestamp(m.group(2)))
+            continue
+        if line.strip():
+            text.append(line.strip())
+            continue
+        yield Cue(timing[0], timing[1], "\n".join(text))
+        timing = None
+        text = []
+    if timing is not None:
+        yield Cue(timing[0], timing[1], "\n".join(text))
+
+
+def parse_vtt(vtt: str) -> List[Cue]:
+    return list(iter_cues(vtt.splitlines()))
+
+
+def clip_cues(
+    cues: Iterable[Cue], start: float, end: float, shift: bool = True
+) -> Iterator[Cue]:
+    """
+    Yields the cues (or the part of them) that fall within [start, end],
+    shifted so start becomes 0 when shift is set
+    """
+    offset = start if shift else 0.0
+    for cue in cues:
+        if cue.end <= start or cue.start >= end:
+            continue
+        yield Cue(max(cue.start, start) - offset, min(cue.end, end) - offset, cue.text)
+
+
+class VttWriter:
+    def __init__(self, f: TextIO, header: str = VTT_HEADER):
+        self.f = f
+        self.f.write(header)
+
+    def write(self, cue: Cue) -> None:
+        self.f.write(
+            f"{format_timestamp(cue.start)} --> {format_timestamp(cue.end)}\n{cue.text}\n\n"
+        )
+
+    def write_all(self, cues: Iterable[Cue]) -> None:
+        for cue in cues:
+            self.write(cue)
+
+
+def trim_vtt_file(src_file: str, dst_file: str, start: float, end: float) -> str:
+    """
+    Writes the cues of src_file within [start, end] to dst_file,
+    shifted to start at 0, and returns their transcript.
+    src_file and dst_file may be the same file
+    """
+    tmp_file = f"{dst_file}.tmp"
+    transcript = []
+    with open(src_file, "r") as src, open(tmp_file, "w") as dst:
+        writer = VttWriter(dst)
+        for cue in clip_cues(iter_cues(src), start, end):
+            writer.write(cue)
+            transcript.append(cue.text.replace("\n", " "))
+    os.replace(tmp_file, dst_file)
+    return " ".join(transcript).strip()
@@ -11,6 +11,13 @@ load_dotenv()  # take environment variables from .env.
 import os  # NOQA
 import logging  # NOQA
 from celery import Celery  # NOQA
+from celery.signals import (  # NOQA
+    task_postrun,
+    task_prerun,
+    task_revoked,
+    worker_process_init,
+    worker_process_shutdown,
+)
 from kombu import Exchange, Queue  # NOQA
 
 from mentor_upload_process import (  # NOQA
@@ -24,6 +31,16 @@ from mentor_upload_process import (  # NOQA
     process,
     RegenVTTRequest,
 )
+from mentor_upload_process.status import (  # NOQA
+    flush_task_status,
+    get_task_status_terminate_flush_timeout,
+    set_task_progress_sink,
+)
+from mentor_upload_process.subprocesses import (  # NOQA
+    bind_task_processes,
+    kill_processes_on_terminate,
+    kill_task_processes,
+)
 
 log = logging.getLogger()
 
@@ -149,6 +166,50 @@ log.info("%s", {"celery_config": celery_config})
 celery.conf.update(celery_config)
 
 
+@task_prerun.connect
+def bind_task_processes_on_task_start(task_id=None, **kwargs):
+    # ffmpeg processes the task starts are killed when it's cancelled
+    bind_task_processes(task_id)
+
+
+@task_postrun.connect
+def flush_task_status_on_task_end(task_id=None, **kwargs):
+    # send the final status of the task now, without making the task wait for it
+    flush_task_status(wait=False)
+    bind_task_processes(None)
+
+
+@task_revoked.connect
+def kill_processes_on_task_revoked(request=None, **kwargs):
+    # only finds the processes when the task runs in this process (solo/threads pool)
+    if request is not None:
+        kill_task_processes(request.id)
+
+
+@worker_process_init.connect
+def kill_processes_on_worker_process_terminate(**kwargs):
+    # revoke(terminate=True) sends SIGTERM to the (prefork) process running the task,
+    # which then exits without running worker_process_shutdown
+    kill_processes_on_terminate(
+        before_exit=lambda: flush_task_status(
+            timeout=get_task_status_terminate_flush_timeout()
+        )
+    )
+
+
+@worker_process_shutdown.connect
+def flush_task_status_on_shutdown(**kwargs):
+    flush_task_status()
+
+
+def store_task_progress(task_id: str, progress: dict) -> None:
+    # the upload status endpoint returns this as the task's state and info
+    celery.backend.store_result(task_id, progress, "PROGRESS")
+
+
+set_task_progress_sink(store_task_progress)
+
+
 @celery.task()
 def trim_upload_stage(
     req: ProcessAnswerRequest,
@@ -0,0 +1,136 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+from os import path
+from unittest.mock import Mock, patch
+
+import pytest
+
+from mentor_upload_process.artifacts import (
+    ArtifactCache,
+    ArtifactStore,
+    LocalArtifactStore,
+    S3ArtifactStore,
+    SharedMountArtifactStore,
+    get_artifact_store,
+)
+from mentor_upload_process.s3 import get_s3_transfer_config
+
+
+def test_local_store_passes_paths_through(tmpdir):
+    video_file = str(tmpdir / "video.mp4")
+    store = LocalArtifactStore()
+    ref = store.put(video_file, "work/video.mp4")
+    assert ref == video_file
+    assert store.fetch(ref) == video_file
+
+
+def test_an_incomplete_store_cant_be_created():
+    class PutOnlyArtifactStore(ArtifactStore):
+        def put(self, local_file: str, key: str) -> str:
+            return key
+
+    with pytest.raises(TypeError):
+        PutOnlyArtifactStore()
+
+
+def test_shared_mount_store_fetches_through_local_cache(tmpdir):
+    video_file = tmpdir / "work" / "video.mp4"
+    video_file.write("fake video", ensure=True)
+    cache = ArtifactCache(str(tmpdir / "cache"), max_bytes=1024)
+    store = SharedMountArtifactStore(str(tmpdir / "shared"), cache)
+    ref = store.put(str(video_file), "work/video.mp4")
+    assert ref == "work/video.mp4"
+    assert path.isfile(tmpdir / "shared" / "work" / "video.mp4")
+    local_file = store.fetch(ref)
+    assert local_file == str(tmpdir / "cache" / "work" / "video.mp4")
+    with open(local_file) as f:
+        assert f.read() == "fake video"
+    store.delete(ref)
+    assert not path.exists(local_file)
+    assert not path.exists(tmpdir / "shared" / "work" / "video.mp4")
+
+
+def test_s3_store_downloads_once_per_node(tmpdir):
+    s3 = Mock()
+    s3.download_file.side_effect = lambda bucket, key, f, **kwargs: open(f, "w").write(
+        "v"
+    )
+    cache = ArtifactCache(str(tmpdir / "cache"), max_bytes=1024)
+    store = S3ArtifactStore(s3, "bucket", "upload-artifacts", cache)
+    ref = store.put("/work/video.mp4", "work/video.mp4")
+    s3.upload_file.assert_called_once_with(
+        "/work/video.mp4",
+        "bucket",
+        "upload-artifacts/work/video.mp4",
+        Config=get_s3_transfer_config(),
+    )
+    assert store.fetch(ref) == store.fetch(ref)
+    assert s3.download_file.call_count == 1
+    store.delete(ref)
+    s3.delete_object.assert_called_once_with(
+        Bucket="bucket", Key="upload-artifacts/work/video.mp4"
+    )
+
+
+def test_cache_prunes_least_recently_used(tmpdir):
+    cache = ArtifactCache(str(tmpdir / "cache"), max_bytes=10)
+    first = cache.fetch("a", lambda f: open(f, "w").write("123456"))
+    second = cache.fetch("b", lambda f: open(f, "w").write("123456"))
+    assert not path.exists(first)
+    assert path.exists(second)
+
+
+def test_store_type_from_env(monkeypatch, tmpdir):
+    get_artifact_store.cache_clear()
+    try:
+        monkeypatch.setenv("ARTIFACT_STORE", "shared")
+        monkeypatch.setenv("ARTIFACT_STORE_DIR", str(tmpdir))
+        assert isinstance(get_artifact_store(), SharedMountArtifactStore)
+    finally:
+        get_artifact_store.cache_clear()
+
+
+@pytest.mark.parametrize(
+    "override,dedicated",
+    [
+        (None, False),
+        ("ARTIFACT_STORE_S3_ENDPOINT_URL", True),
+        ("ARTIFACT_STORE_S3_REGION", True),
+        ("ARTIFACT_STORE_S3_ACCESS_KEY_ID", True),
+        ("ARTIFACT_STORE_S3_SECRET_ACCESS_KEY", True),
+    ],
+)
+def test_s3_store_has_its_own_client_when_configured_apart(
+    override, dedicated, monkeypatch
+):
+    for n in (
+        "STATIC_AWS_REGION",
+        "STATIC_AWS_ACCESS_KEY_ID",
+        "STATIC_AWS_SECRET_ACCESS_KEY",
+    ):
+        monkeypatch.setenv(n, "x")
+    monkeypatch.setenv("STATIC_AWS_S3_BUCKET", "bucket")
+    monkeypatch.setenv("ARTIFACT_STORE", "s3")
+    for n in (
+        "ARTIFACT_STORE_S3_ENDPOINT_URL",
+        "ARTIFACT_STORE_S3_REGION",
+        "ARTIFACT_STORE_S3_ACCESS_KEY_ID",
+        "ARTIFACT_STORE_S3_SECRET_ACCESS_KEY",
+    ):
+        monkeypatch.delenv(n, raising=False)
+    if override:
+        monkeypatch.setenv(
+            override,
+            "http://minio:9000" if override.endswith("URL") else "us-west-2",
+        )
+    get_artifact_store.cache_clear()
+    try:
+        with patch("mentor_upload_process.artifacts.get_s3_client") as get_s3_client:
+            store = get_artifact_store()
+        assert (store.s3 is not get_s3_client.return_value) == dedicated
+    finally:
+        get_artifact_store.cache_clear()
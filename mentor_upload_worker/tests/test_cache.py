@@ -0,0 +1,93 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+from unittest.mock import patch, Mock
+
+import responses
+
+from mentor_upload_process.api import (
+    QuestionMetadata,
+    fetch_question,
+    get_graphql_endpoint,
+    get_question_cache,
+)
+from mentor_upload_process.cache import RedisCacheTier, TieredCache, TTLCache
+
+
+@patch("mentor_upload_process.cache.time.monotonic")
+def test_ttl_cache_expires_entries(mock_monotonic: Mock):
+    mock_monotonic.return_value = 100
+    cache = TTLCache(ttl=10, max_size=10)
+    cache.set("q1", {"name": "a"})
+    mock_monotonic.return_value = 109
+    assert cache.get("q1") == {"name": "a"}
+    mock_monotonic.return_value = 110
+    assert cache.get("q1") is None
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(ttl=60, max_size=2)
+    cache.set("q1", 1)
+    cache.set("q2", 2)
+    cache.get("q1")
+    cache.set("q3", 3)
+    assert (cache.get("q1"), cache.get("q2"), cache.get("q3")) == (1, None, 3)
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def setex(self, key, ttl, value):
+        self.values[key] = value
+
+
+def test_tiered_cache_shares_fetched_values():
+    redis = _FakeRedis()
+    fetch = Mock(return_value={"name": "a"})
+    worker_1 = TieredCache(TTLCache(60, 10), RedisCacheTier(redis, "q:", 60))
+    worker_2 = TieredCache(TTLCache(60, 10), RedisCacheTier(redis, "q:", 60))
+    assert worker_1.get("q1", fetch) == {"name": "a"}
+    assert worker_1.get("q1", fetch) == {"name": "a"}
+    assert worker_2.get("q1", fetch) == {"name": "a"}
+    assert fetch.call_count == 1
+    assert "q:q1" in redis.values
+
+
+def test_tiered_cache_falls_back_to_fetch_when_redis_fails():
+    redis = Mock()
+    redis.get.side_effect = ConnectionError("redis down")
+    redis.setex.side_effect = ConnectionError("redis down")
+    cache = TieredCache(TTLCache(60, 10), RedisCacheTier(redis, "q:", 60))
+    assert cache.get("q1", lambda: {"name": "a"}) == {"name": "a"}
+
+
+@responses.activate
+def test_fetch_question_is_cached():
+    get_question_cache().clear()
+    responses.add(
+        responses.POST,
+        get_graphql_endpoint(),
+        json={
+            "data": {
+                "question": {
+                    "name": "_IDLE_",
+                    "type": "UTTERANCE",
+                    "minVideoLength": 10,
+                }
+            }
+        },
+        status=200,
+    )
+    for _ in range(3):
+        assert fetch_question("q1") == QuestionMetadata(
+            name="_IDLE_", type="UTTERANCE", min_video_length=10
+        )
+    assert len(responses.calls) == 1
+    get_question_cache().clear()
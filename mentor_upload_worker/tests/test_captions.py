@@ -0,0 +1,156 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import math
+import random
+
+import pytest
+
+from mentor_upload_process.captions import (
+    Cue,
+    WordTiming,
+    cues_to_vtt,
+    pack_cues,
+    retime_transcript,
+    split_transcript,
+    transcript_to_cues,
+    uniform_timing,
+    word_timings_from_vtt,
+)
+
+
+def _legacy_transcript_to_vtt(transcript: str, duration: float) -> str:
+    """
+    the O(words^2) implementation transcript_to_vtt used to have,
+    the default output must stay byte-identical to it
+    """
+    piece_length = 68
+    word_indexes = [i for i, ltr in enumerate(transcript) if ltr == " "]
+    split_index = [0]
+    for k in range(1, len(word_indexes)):
+        for el in range(1, len(word_indexes)):
+            if word_indexes[el] > piece_length * k:
+                split_index.append(word_indexes[el])
+                break
+    split_index.append(len(transcript))
+    amount_of_chunks = math.ceil(len(transcript) / piece_length)
+    vtt_str = "WEBVTT FILE:\n\n"
+    for j in range(len(split_index) - 1):
+        seconds_start = round((duration / amount_of_chunks) * j, 2) + 0.85
+        seconds_end = round((duration / amount_of_chunks) * (j + 1), 2) + 0.85
+        output_start = (
+            str(math.floor(seconds_start / 60)).zfill(2)
+            + ":"
+            + ("%.3f" % (seconds_start % 60)).zfill(6)
+        )
+        output_end = (
+            str(math.floor(seconds_end / 60)).zfill(2)
+            + ":"
+            + ("%.3f" % (seconds_end % 60)).zfill(6)
+        )
+        vtt_str += f"00:{output_start} --> 00:{output_end}\n"
+        vtt_str += f"{transcript[split_index[j] : split_index[j + 1]]}\n\n"
+    return vtt_str
+
+
+def _random_transcript(rng: random.Random, words: int, max_word_length: int) -> str:
+    return " ".join(
+        "".join(
+            rng.choice("abcdefghij") for _ in range(rng.randint(1, max_word_length))
+        )
+        for _ in range(words)
+    )
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_default_output_is_identical_to_legacy(seed: int):
+    rng = random.Random(seed)
+    transcript = _random_transcript(rng, rng.randint(1, 400), rng.choice([8, 20, 90]))
+    duration = rng.uniform(1, 600)
+    assert cues_to_vtt(transcript_to_cues(transcript, duration)) == (
+        _legacy_transcript_to_vtt(transcript, duration)
+    )
+
+
+def test_split_keeps_words_whole():
+    transcript = "the quick brown fox jumps over the lazy dog"
+    chunks = split_transcript(transcript, cue_length=10)
+    assert "".join(chunks) == transcript
+    assert chunks == [
+        "the quick brown",
+        " fox jumps",
+        " over the",
+        " lazy dog",
+    ]
+
+
+def test_empty_transcript_has_no_cues():
+    assert transcript_to_cues("", 10) == []
+    assert cues_to_vtt([]) == "WEBVTT FILE:\n\n"
+
+
+def test_timing_is_configurable():
+    cues = transcript_to_cues(
+        "a b c d e f", 6, cue_length=4, timing=uniform_timing(cue_length=4, offset=0)
+    )
+    assert cues == [Cue(0, 2, "a b c"), Cue(2, 4, " d e"), Cue(4, 6, " f")]
+
+
+def test_word_timings_spread_over_cue():
+    words = word_timings_from_vtt("WEBVTT\n\n00:00.000 --> 00:03.000\nab cd ef\n")
+    assert [w.word for w in words] == ["ab", "cd", "ef"]
+    assert [(round(w.start, 3), round(w.end, 3)) for w in words] == [
+        (0, 1),
+        (1, 2),
+        (2, 3),
+    ]
+
+
+def _words(*timed) -> list:
+    return [WordTiming(w, s, e) for w, s, e in timed]
+
+
+def test_retime_keeps_timing_of_unchanged_words():
+    previous = _words(("the", 0, 1), ("quick", 1, 2), ("brown", 2, 3), ("fox", 5, 6))
+    words = retime_transcript("The quick red fox!", previous, 10)
+    assert words == _words(
+        ("The", 0, 1), ("quick", 1, 2), ("red", 2, 3), ("fox!", 5, 6)
+    )
+
+
+def test_retime_spreads_inserted_words_over_gap():
+    previous = _words(("one", 0, 1), ("two", 1, 2), ("four", 4, 5))
+    words = retime_transcript("one two three four", previous, 10)
+    assert words[2] == WordTiming("three", 2, 4)
+
+
+def test_retime_gives_up_on_rewrites():
+    previous = _words(("one", 0, 1), ("two", 1, 2), ("three", 2, 3))
+    assert retime_transcript("something else entirely", previous, 10) is None
+
+
+def test_falls_back_to_uniform_timing_without_word_timings():
+    transcript = "a completely new transcript"
+    assert transcript_to_cues(
+        transcript, 10, previous_words=_words(("x", 0, 1))
+    ) == transcript_to_cues(transcript, 10)
+
+
+def test_packs_cues_by_chars_time_and_pauses():
+    words = _words(
+        ("aaaa", 0, 1),
+        ("bbbb", 1, 2),
+        ("cccc", 2, 3),
+        ("dddd", 6, 7),
+        ("eeee", 7, 8),
+        ("ffff", 8, 12),
+    )
+    assert pack_cues(words, cue_length=9, max_cue_seconds=4, max_gap_seconds=2) == [
+        Cue(0, 2, "aaaa bbbb"),
+        Cue(2, 3, "cccc"),
+        Cue(6, 8, "dddd eeee"),
+        Cue(8, 12, "ffff"),
+    ]
@@ -0,0 +1,155 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+from io import BytesIO
+import json
+from unittest.mock import Mock, patch
+
+import pytest
+
+from mentor_upload_process.dedupe import (
+    ManifestStore,
+    RedisManifestStore,
+    S3ManifestStore,
+    copy_renditions,
+    dedupe_key,
+    find_upload_manifest,
+    get_manifest_store,
+    record_upload_manifest,
+)
+
+RENDITIONS = [
+    {"type": "video", "tag": "mobile", "url": "videos/m1/q1/t1/mobile.mp4"},
+    {"type": "video", "tag": "web", "url": "videos/m1/q1/t1/web.mp4"},
+]
+
+
+def test_an_incomplete_store_cant_be_created():
+    class ReadOnlyManifestStore(ManifestStore):
+        def get(self, key: str):
+            return None
+
+    with pytest.raises(TypeError):
+        ReadOnlyManifestStore()
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def setex(self, key, ttl, value):
+        self.values[key] = value
+
+
+@pytest.fixture
+def manifest_store():
+    store = RedisManifestStore(_FakeRedis(), "m:", 60)
+    with patch("mentor_upload_process.dedupe.get_manifest_store", return_value=store):
+        yield store
+
+
+@pytest.mark.parametrize(
+    "trim,profile,expected",
+    [
+        (None, "1", "abc/full/1"),
+        ({"start": 1, "end": 2.5}, "1", "abc/1.000-2.500/1"),
+        ({"start": 1, "end": 2.5}, "2", "abc/1.000-2.500/2"),
+    ],
+)
+def test_keys_by_hash_trim_and_profile(trim, profile, expected):
+    assert dedupe_key("abc", trim, profile) == expected
+
+
+def test_is_disabled_by_default(monkeypatch):
+    monkeypatch.delenv("UPLOAD_DEDUPE_STORE", raising=False)
+    get_manifest_store.cache_clear()
+    try:
+        assert get_manifest_store() is None
+        assert find_upload_manifest({"content_hash": "abc"}) is None
+    finally:
+        get_manifest_store.cache_clear()
+
+
+def test_finds_the_manifest_of_an_identical_upload(manifest_store):
+    req = {"content_hash": "abc", "trim": {"start": 1, "end": 5}}
+    record_upload_manifest(
+        req,
+        RENDITIONS + [{"type": "subtitles", "tag": "en", "url": "en.vtt"}],
+        "hi",
+        "vtt",
+    )
+    assert find_upload_manifest(dict(req)) == {
+        "media": RENDITIONS,
+        "transcript": "hi",
+        "subtitles": "vtt",
+    }
+    # a different trim of the same upload produces different renditions
+    assert find_upload_manifest({"content_hash": "abc", "trim": None}) is None
+    assert find_upload_manifest({"trim": {"start": 1, "end": 5}}) is None
+
+
+def test_keeps_the_transcript_when_recording_an_untranscribed_upload(
+    manifest_store,
+):
+    req = {"content_hash": "abc"}
+    record_upload_manifest(req, RENDITIONS, "hi", "vtt")
+    record_upload_manifest(req, RENDITIONS[:1])
+    assert find_upload_manifest(req) == {
+        "media": RENDITIONS[:1],
+        "transcript": "hi",
+        "subtitles": "vtt",
+    }
+
+
+def test_doesnt_record_uploads_without_renditions(manifest_store):
+    record_upload_manifest({"content_hash": "abc"}, [], "hi", "vtt")
+    assert find_upload_manifest({"content_hash": "abc"}) is None
+
+
+def test_redis_failures_count_as_misses():
+    redis = Mock()
+    redis.get.side_effect = ConnectionError("redis down")
+    redis.setex.side_effect = ConnectionError("redis down")
+    store = RedisManifestStore(redis, "m:", 60)
+    store.put("abc", {"media": RENDITIONS})
+    assert store.get("abc") is None
+
+
+def test_stores_manifests_as_json_objects_in_s3():
+    s3 = Mock()
+    s3.exceptions.NoSuchKey = KeyError
+    s3.get_object.return_value = {"Body": BytesIO(b'{"media": []}')}
+    store = S3ManifestStore(s3, "bucket", "/manifests/")
+    store.put("abc/full/1", {"media": []})
+    s3.put_object.assert_called_once_with(
+        Bucket="bucket",
+        Key="manifests/abc/full/1.json",
+        Body=json.dumps({"media": []}).encode("utf-8"),
+        ContentType="application/json",
+    )
+    assert store.get("abc/full/1") == {"media": []}
+    s3.get_object.side_effect = KeyError()
+    assert store.get("abc/full/1") is None
+
+
+def test_copies_renditions_to_the_new_answer():
+    s3 = Mock()
+    media = copy_renditions(s3, "bucket", {"media": RENDITIONS}, "videos/m2/q2/t2/")
+    assert media == [
+        {"type": "video", "tag": "mobile", "url": "videos/m2/q2/t2/mobile.mp4"},
+        {"type": "video", "tag": "web", "url": "videos/m2/q2/t2/web.mp4"},
+    ]
+    assert s3.copy.call_count == 2
+
+
+def test_reuses_nothing_when_renditions_are_gone():
+    s3 = Mock()
+    s3.copy.side_effect = Exception("NoSuchKey")
+    assert copy_renditions(s3, "bucket", {"media": RENDITIONS}, "videos/") is None
+    assert copy_renditions(s3, "bucket", None, "videos/") is None
@@ -0,0 +1,135 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+from unittest.mock import patch, Mock
+
+import pytest
+import requests
+import responses
+
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from mentor_upload_process.graphql import (
+    GraphQLClient,
+    get_graphql_client,
+    operation_name,
+    reset_graphql_client,
+)
+
+ENDPOINT = "http://graphql/graphql"
+BODY = {"query": "mutation UploadStatus($mentorId: ID!) { api { x } }"}
+QUERY = {"query": "query Answer { answer }"}
+
+
+def _connect_error() -> requests.exceptions.ConnectionError:
+    return requests.exceptions.ConnectionError(
+        MaxRetryError(None, ENDPOINT, NewConnectionError(None, "refused"))
+    )
+
+
+@pytest.fixture
+def client() -> GraphQLClient:
+    return GraphQLClient(endpoint=ENDPOINT, max_retries=2)
+
+
+def test_parses_operation_name():
+    assert operation_name(BODY) == "UploadStatus"
+    assert operation_name({"query": "query Answer { answer }"}) == "Answer"
+    assert operation_name({"query": "{ answer }"}) == "anonymous"
+
+
+def test_shares_one_client_per_process():
+    reset_graphql_client()
+    assert get_graphql_client() is get_graphql_client()
+    first = get_graphql_client()
+    reset_graphql_client()
+    assert get_graphql_client() is not first
+
+
+@responses.activate
+@patch("mentor_upload_process.graphql.time.sleep")
+def test_retries_5xx_then_succeeds(mock_sleep: Mock, client: GraphQLClient):
+    responses.add(responses.POST, ENDPOINT, status=503)
+    responses.add(responses.POST, ENDPOINT, json={"data": {"ok": True}}, status=200)
+    assert client.execute(BODY, idempotent=True) == {"data": {"ok": True}}
+    assert len(responses.calls) == 2
+    assert mock_sleep.call_count == 1
+    stats = client.metrics.snapshot()["UploadStatus"]
+    assert (stats.count, stats.errors) == (1, 0)
+
+
+@responses.activate
+@patch("mentor_upload_process.graphql.time.sleep")
+def test_retries_connection_errors_until_exhausted(
+    mock_sleep: Mock, client: GraphQLClient
+):
+    responses.add(responses.POST, ENDPOINT, body=_connect_error())
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.execute(BODY)
+    assert len(responses.calls) == 3
+    assert client.metrics.snapshot()["UploadStatus"].errors == 1
+
+
+@pytest.mark.parametrize(
+    "failure",
+    [
+        {"status": 503},
+        {"body": requests.exceptions.ReadTimeout("slow")},
+        # e.g. reset after the request was sent
+        {"body": requests.exceptions.ConnectionError("reset")},
+    ],
+)
+@responses.activate
+@patch("mentor_upload_process.graphql.time.sleep")
+def test_does_not_resend_mutations_that_may_have_been_applied(
+    mock_sleep: Mock, failure: dict, client: GraphQLClient
+):
+    responses.add(responses.POST, ENDPOINT, **failure)
+    with pytest.raises(requests.exceptions.RequestException):
+        client.execute(BODY)
+    assert len(responses.calls) == 1
+    mock_sleep.assert_not_called()
+
+
+@responses.activate
+@patch("mentor_upload_process.graphql.time.sleep")
+def test_retries_read_timeouts_of_queries(mock_sleep: Mock, client: GraphQLClient):
+    responses.add(responses.POST, ENDPOINT, body=requests.exceptions.ReadTimeout())
+    responses.add(responses.POST, ENDPOINT, json={"data": {"ok": True}}, status=200)
+    assert client.execute(QUERY) == {"data": {"ok": True}}
+    assert len(responses.calls) == 2
+
+
+def test_read_timeout_can_be_overridden(client: GraphQLClient):
+    with patch.object(client.session, "post") as mock_post:
+        mock_post.return_value = Mock(status_code=200, json=lambda: {"data": {}})
+        client.execute(BODY, read_timeout=600)
+    assert mock_post.call_args[1]["timeout"] == (client.timeout[0], 600)
+
+
+@responses.activate
+@patch("mentor_upload_process.graphql.time.sleep")
+def test_does_not_retry_4xx(mock_sleep: Mock, client: GraphQLClient):
+    responses.add(responses.POST, ENDPOINT, status=400)
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.execute(BODY)
+    assert len(responses.calls) == 1
+    mock_sleep.assert_not_called()
+
+
+@responses.activate
+def test_raises_graphql_errors(client: GraphQLClient):
+    responses.add(
+        responses.POST, ENDPOINT, json={"errors": [{"message": "bad"}]}, status=200
+    )
+    with pytest.raises(Exception, match="bad"):
+        client.execute(BODY)
+
+
+def test_backoff_is_jittered_and_capped(client: GraphQLClient):
+    for attempt in range(10):
+        delay = client._backoff(attempt)
+        assert 0 <= delay <= min(client.backoff_max, client.backoff_base * 2**attempt)
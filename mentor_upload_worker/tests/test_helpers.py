@@ -0,0 +1,35 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import jsonschema
+import pytest
+
+from mentor_upload_process.helpers import get_json_validator, validate_json
+
+schema = {
+    "type": "object",
+    "properties": {"name": {"type": "string"}, "count": {"type": "integer"}},
+    "required": ["name"],
+}
+
+
+def test_builds_validator_once_per_schema():
+    assert get_json_validator(schema) is get_json_validator(schema)
+    assert get_json_validator(schema) is not get_json_validator(dict(schema))
+
+
+def test_rejects_invalid_schema():
+    with pytest.raises(jsonschema.exceptions.SchemaError):
+        get_json_validator({"type": "not-a-type"})
+
+
+@pytest.mark.parametrize("fast", [False, True])
+def test_validates_json(fast: bool):
+    validate_json({"name": "a", "count": 1}, schema, fast=fast)
+    with pytest.raises(Exception, match="'name' is a required property"):
+        validate_json({"count": 1}, schema, fast=fast)
+    with pytest.raises(Exception, match="is not of type 'integer'"):
+        validate_json({"name": "a", "count": "1"}, schema, fast=fast)
@@ -0,0 +1,656 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+from dataclasses import replace
+import json
+from os import utime
+from pathlib import Path
+from typing import List, Optional
+from unittest.mock import patch, Mock
+
+import pytest
+import responses
+
+from mentor_upload_process.media_tools import (
+    _profile_and_level,
+    FFmpegProgress,
+    MediaProbe,
+    TrimSegment,
+    can_passthrough,
+    find_duration,
+    find_video_dims,
+    iter_progress,
+    plan_chunks,
+    plan_trim,
+    probe_keyframes,
+    probe_media,
+    run_ffmpeg,
+    use_chunked_encode,
+    video_encode_for_web_and_mobile,
+    video_trim,
+    _probe_media_cached,
+)
+from .utils import Bunch
+
+
+def _mock_media_info(duration_ms=5000, width=1280, height=720) -> Bunch:
+    return Bunch(
+        tracks=[
+            Bunch(track_type="General", duration=duration_ms),
+            Bunch(track_type="Video", duration=duration_ms, width=width, height=height),
+        ]
+    )
+
+
+@pytest.fixture(autouse=True)
+def clear_probe_cache():
+    _probe_media_cached.cache_clear()
+    yield
+    _probe_media_cached.cache_clear()
+
+
+@patch("mentor_upload_process.media_tools.MediaInfo.parse")
+def test_probes_a_file_once_for_all_helpers(mock_parse: Mock, tmpdir):
+    mock_parse.return_value = _mock_media_info()
+    video_file = tmpdir / "video.mp4"
+    video_file.write("fake video")
+    assert find_duration(str(video_file)) == 5.0
+    assert find_video_dims(str(video_file)) == (1280, 720)
+    assert probe_media(str(video_file)).video_dims == (1280, 720)
+    assert mock_parse.call_count == 1
+
+
+@patch("mentor_upload_process.media_tools.MediaInfo.parse")
+def test_probes_a_file_again_when_it_changes(mock_parse: Mock, tmpdir):
+    mock_parse.return_value = _mock_media_info()
+    video_file = tmpdir / "video.mp4"
+    video_file.write("fake video")
+    utime(str(video_file), ns=(1_000_000_000, 1_000_000_000))
+    assert find_duration(str(video_file)) == 5.0
+    mock_parse.return_value = _mock_media_info(duration_ms=2000)
+    video_file.write("fake video, trimmed")
+    assert find_duration(str(video_file)) == 2.0
+    assert mock_parse.call_count == 2
+
+
+@responses.activate
+@patch("mentor_upload_process.media_tools.MediaInfo.parse")
+def test_probes_a_url_once_per_etag(mock_parse: Mock):
+    url = "https://static.mentorpal.org/videos/m1/q1/web.mp4"
+    mock_parse.return_value = _mock_media_info()
+    responses.add(responses.HEAD, url, headers={"ETag": '"v1"'}, status=200)
+    responses.add(responses.HEAD, url, headers={"ETag": '"v1"'}, status=200)
+    responses.add(responses.HEAD, url, headers={"ETag": '"v2"'}, status=200)
+    assert find_duration(url) == 5.0
+    assert find_video_dims(url) == (1280, 720)
+    assert mock_parse.call_count == 1
+    find_duration(url)
+    assert mock_parse.call_count == 2
+
+
+@responses.activate
+@patch("mentor_upload_process.media_tools.MediaInfo.parse")
+def test_does_not_cache_a_url_without_version_headers(mock_parse: Mock):
+    url = "https://static.mentorpal.org/videos/m1/q1/web.mp4"
+    mock_parse.return_value = _mock_media_info()
+    responses.add(responses.HEAD, url, status=200)
+    find_duration(url)
+    find_duration(url)
+    assert mock_parse.call_count == 2
+
+
+def _ffprobe_stdout(
+    codec="h264", keyframes=(0.0, 2.0, 4.0, 6.0), start_time="0.000000"
+) -> bytes:
+    packets = []
+    for k in keyframes:
+        packets.append({"pts_time": f"{k:.6f}", "flags": "K_"})
+        packets.append({"pts_time": f"{k + 0.5:.6f}", "flags": "__"})
+    return json.dumps(
+        {
+            "packets": packets,
+            "streams": [{"codec_name": codec, "pix_fmt": "yuv420p"}],
+            "format": {"start_time": start_time},
+        }
+    ).encode()
+
+
+def _mock_ffprobe(mock_ffprobe_cls: Mock, stdout: bytes) -> Mock:
+    mock_ffprobe_cls.return_value.run.return_value = (stdout, b"")
+    return mock_ffprobe_cls
+
+
+def _mock_ffmpeg(mock_ffmpeg_cls: Mock) -> List[dict]:
+    """
+    Writes a fake file for every output and records the args of each run
+    """
+    runs = []
+
+    def mock_ffmpeg_constructor(inputs: dict, outputs: dict, **kwargs) -> Mock:
+        runs.append({"inputs": inputs, "outputs": outputs})
+        for output_file in outputs.keys():
+            Path(output_file).write_text("fake output")
+        return Mock()
+
+    mock_ffmpeg_cls.side_effect = mock_ffmpeg_constructor
+    return runs
+
+
+@patch("ffmpy.FFprobe")
+def test_probes_keyframes(mock_ffprobe_cls: Mock):
+    _mock_ffprobe(
+        mock_ffprobe_cls,
+        _ffprobe_stdout(keyframes=(0.1, 2.1, 4.1), start_time="0.100000"),
+    )
+    probe = probe_keyframes("video.mp4", until_secs=5)
+    assert probe.codec == "h264"
+    assert probe.pix_fmt == "yuv420p"
+    assert probe.keyframes == pytest.approx((0.0, 2.0, 4.0))
+    assert "%5.000" in mock_ffprobe_cls.call_args.kwargs["global_options"]
+
+
+@pytest.mark.parametrize(
+    "start,end,min_copy_secs,expected",
+    [
+        # cuts only the end: copies up to the last keyframe
+        (
+            0.0,
+            5.0,
+            0.0,
+            [TrimSegment(0.0, 4.0, copy=True), TrimSegment(4.0, 5.0, copy=False)],
+        ),
+        # cuts both ends mid-GOP
+        (
+            1.0,
+            5.0,
+            0.0,
+            [
+                TrimSegment(1.0, 2.0, copy=False),
+                TrimSegment(2.0, 4.0, copy=True),
+                TrimSegment(4.0, 5.0, copy=False),
+            ],
+        ),
+        # both trim points on keyframes: nothing to re-encode
+        (2.0, 6.0, 0.0, [TrimSegment(2.0, 6.0, copy=True)]),
+        (2.0004, 5.9996, 0.0, [TrimSegment(2.0, 6.0, copy=True)]),
+        # no whole GOP inside the trim
+        (2.5, 3.5, 0.0, None),
+        # copies less than min_copy_secs
+        (1.0, 5.0, 3.0, None),
+    ],
+)
+def test_plans_trim_around_keyframes(
+    start: float,
+    end: float,
+    min_copy_secs: float,
+    expected: Optional[List[TrimSegment]],
+):
+    assert plan_trim((0.0, 2.0, 4.0, 6.0), start, end, min_copy_secs) == expected
+
+
+@patch("ffmpy.FFmpeg")
+@patch("ffmpy.FFprobe")
+def test_trims_by_stream_copying_whole_gops(
+    mock_ffprobe_cls: Mock, mock_ffmpeg_cls: Mock, monkeypatch, tmpdir
+):
+    monkeypatch.setenv("TRIM_STREAM_COPY_MIN_SECS", "1")
+    _mock_ffprobe(mock_ffprobe_cls, _ffprobe_stdout())
+    runs = _mock_ffmpeg(mock_ffmpeg_cls)
+    video_file = tmpdir / "video.mp4"
+    video_file.write("fake video")
+    trim_file = tmpdir / "trim" / "trim.mp4"
+    video_trim(str(video_file), str(trim_file), 1.0, 5.0)
+    assert len(runs) == 4
+    segment_args = [list(r["outputs"].values())[0] for r in runs[:3]]
+    assert [a[a.index("-c:v") + 1] for a in segment_args] == [
+        "libx264",
+        "copy",
+        "libx264",
+    ]
+    assert [list(r["inputs"].values())[0] for r in runs[:3]] == [
+        ("-ss", "1.000000"),
+        ("-ss", "2.000000"),
+        ("-ss", "4.000000"),
+    ]
+    concat = runs[3]
+    assert list(concat["outputs"].keys()) == [str(trim_file)]
+    concat_args = concat["outputs"][str(trim_file)]
+    assert concat_args[concat_args.index("-c:v") + 1] == "copy"
+    assert Path(trim_file).exists()
+
+
+@pytest.mark.parametrize(
+    "env,stdout",
+    [
+        # unsupported codec
+        ({}, _ffprobe_stdout(codec="vp8")),
+        # only partial GOPs
+        ({}, _ffprobe_stdout(keyframes=(0.0, 10.0))),
+        # disabled
+        ({"TRIM_STREAM_COPY": "false"}, _ffprobe_stdout()),
+        # failed probe
+        ({}, b"not json"),
+    ],
+)
+@patch("ffmpy.FFmpeg")
+@patch("ffmpy.FFprobe")
+def test_trim_falls_back_to_re_encoding(
+    mock_ffprobe_cls: Mock,
+    mock_ffmpeg_cls: Mock,
+    env: dict,
+    stdout: bytes,
+    monkeypatch,
+    tmpdir,
+):
+    for k, v in env.items():
+        monkeypatch.setenv(k, v)
+    _mock_ffprobe(mock_ffprobe_cls, stdout)
+    runs = _mock_ffmpeg(mock_ffmpeg_cls)
+    video_file = tmpdir / "video.mp4"
+    video_file.write("fake video")
+    trim_file = tmpdir / "trim.mp4"
+    video_trim(str(video_file), str(trim_file), 1.0, 5.0)
+    assert runs == [
+        {
+            "inputs": {str(video_file): None},
+            "outputs": {
+                str(trim_file): (
+                    "-ss",
+                    "1.000",
+                    "-to",
+                    "5.000",
+                    "-c:v",
+                    "libx264",
+                    "-crf",
+                    "30",
+                )
+            },
+        }
+    ]
+
+
+@pytest.mark.parametrize(
+    "start,end,max_chunks,min_chunk_secs,expected",
+    [
+        # cut at the keyframes nearest to the even splits
+        (0.0, 8.0, 2, 0.0, [(0.0, 4.0), (4.0, 8.0)]),
+        (0.0, 9.0, 3, 0.0, [(0.0, 2.0), (2.0, 6.0), (6.0, 9.0)]),
+        (1.0, 7.0, 2, 0.0, [(1.0, 4.0), (4.0, 7.0)]),
+        # fewer chunks than keyframes allow
+        (0.0, 8.0, 2, 5.0, [(0.0, 8.0)]),
+        (0.0, 8.0, 1, 0.0, [(0.0, 8.0)]),
+        # never cuts the same keyframe twice
+        (0.0, 8.0, 8, 0.0, [(0.0, 2.0), (2.0, 4.0), (4.0, 6.0), (6.0, 8.0)]),
+    ],
+)
+def test_plans_chunks_at_keyframes(
+    start: float,
+    end: float,
+    max_chunks: int,
+    min_chunk_secs: float,
+    expected: List[tuple],
+):
+    assert (
+        plan_chunks((0.0, 2.0, 4.0, 6.0), start, end, max_chunks, min_chunk_secs)
+        == expected
+    )
+
+
+@pytest.mark.parametrize(
+    "env,chunked,duration_ms,expected",
+    [
+        ({"CHUNKED_ENCODE_WORKERS": "4"}, None, 600000, True),
+        ({"CHUNKED_ENCODE_WORKERS": "4"}, None, 60000, False),
+        ({"CHUNKED_ENCODE_WORKERS": "4"}, True, 60000, True),
+        ({"CHUNKED_ENCODE_WORKERS": "4"}, False, 600000, False),
+        (
+            {"CHUNKED_ENCODE_WORKERS": "4", "CHUNKED_ENCODE_MIN_SECS": "30"},
+            None,
+            60000,
+            True,
+        ),
+        ({"CHUNKED_ENCODE_WORKERS": "1"}, True, 600000, False),
+    ],
+)
+@patch("mentor_upload_process.media_tools.MediaInfo.parse")
+def test_chooses_chunked_encode(
+    mock_parse: Mock,
+    env: dict,
+    chunked: Optional[bool],
+    duration_ms: int,
+    expected: bool,
+    monkeypatch,
+    tmpdir,
+):
+    for k, v in env.items():
+        monkeypatch.setenv(k, v)
+    mock_parse.return_value = _mock_media_info(duration_ms=duration_ms)
+    video_file = tmpdir / "video.mp4"
+    video_file.write("fake video")
+    assert use_chunked_encode(str(video_file), chunked=chunked) == expected
+
+
+@patch("mentor_upload_process.media_tools.find_video_dims")
+@patch("ffmpy.FFmpeg")
+@patch("ffmpy.FFprobe")
+def test_encodes_chunks_concurrently_and_joins_them(
+    mock_ffprobe_cls: Mock,
+    mock_ffmpeg_cls: Mock,
+    mock_find_video_dims: Mock,
+    monkeypatch,
+    tmpdir,
+):
+    monkeypatch.setenv("CHUNKED_ENCODE_WORKERS", "2")
+    monkeypatch.setenv("CHUNKED_ENCODE_MIN_CHUNK_SECS", "1")
+    mock_find_video_dims.return_value = (1280, 720)
+    _mock_ffprobe(mock_ffprobe_cls, _ffprobe_stdout())
+    runs = _mock_ffmpeg(mock_ffmpeg_cls)
+    video_file = tmpdir / "video.mp4"
+    video_file.write("fake video")
+    web_file = tmpdir / "out" / "web.mp4"
+    mobile_file = tmpdir / "out" / "mobile.mp4"
+    video_encode_for_web_and_mobile(
+        str(video_file),
+        str(web_file),
+        str(mobile_file),
+        trim={"start": 1.0, "end": 7.0},
+        chunked=True,
+    )
+    chunk_runs = sorted(runs[:2], key=lambda r: list(r["inputs"].values())[0])
+    assert [list(r["inputs"].values())[0] for r in chunk_runs] == [
+        ("-ss", "1.000000", "-t", "3.000000"),
+        ("-ss", "4.000000", "-t", "3.000000"),
+    ]
+    join_runs = runs[2:]
+    assert [list(r["outputs"].keys()) for r in join_runs] == [
+        [str(mobile_file)],
+        [str(web_file)],
+    ]
+    for r in join_runs:
+        assert list(r["inputs"].values()) == [
+            ("-f", "concat", "-safe", "0"),
+            ("-ss", "1.000", "-t", "6.000"),
+        ]
+
+
+@patch("mentor_upload_process.media_tools.find_video_dims")
+@patch("ffmpy.FFmpeg")
+@patch("ffmpy.FFprobe")
+def test_chunked_encode_falls_back_to_a_single_encode(
+    mock_ffprobe_cls: Mock,
+    mock_ffmpeg_cls: Mock,
+    mock_find_video_dims: Mock,
+    monkeypatch,
+    tmpdir,
+):
+    monkeypatch.setenv("CHUNKED_ENCODE_WORKERS", "2")
+    mock_find_video_dims.return_value = (1280, 720)
+    _mock_ffprobe(mock_ffprobe_cls, b"not json")
+    runs = _mock_ffmpeg(mock_ffmpeg_cls)
+    video_file = tmpdir / "video.mp4"
+    video_file.write("fake video")
+    web_file = tmpdir / "web.mp4"
+    mobile_file = tmpdir / "mobile.mp4"
+    video_encode_for_web_and_mobile(
+        str(video_file), str(web_file), str(mobile_file), chunked=True
+    )
+    assert len(runs) == 1
+    assert list(runs[0]["outputs"].keys()) == [str(mobile_file), str(web_file)]
+
+
+def _mock_conformant_media_info(
+    width=1280, height=720, channels=1, bit_rate=2_000_000, format_profile="High@L4"
+) -> Bunch:
+    return Bunch(
+        tracks=[
+            Bunch(track_type="General", duration=5000, isstreamable="Yes"),
+            Bunch(
+                track_type="Video",
+                duration=5000,
+                width=width,
+                height=height,
+                format="AVC",
+                color_space="YUV",
+                chroma_subsampling="4:2:0",
+                bit_depth=8,
+                bit_rate=bit_rate,
+                format_profile=format_profile,
+            ),
+            Bunch(track_type="Audio", duration=5000, format="AAC", channel_s=channels),
+        ]
+    )
+
+
+@patch("mentor_upload_process.media_tools.MediaInfo.parse")
+def test_probes_codecs_and_faststart(mock_parse: Mock, tmpdir):
+    mock_parse.return_value = _mock_conformant_media_info(channels=2)
+    video_file = tmpdir / "video.mp4"
+    video_file.write("fake video")
+    assert probe_media(str(video_file)) == MediaProbe(
+        duration=5.0,
+        video_dims=(1280, 720),
+        video_codec="h264",
+        pix_fmt="yuv420p",
+        audio_codec="aac",
+        audio_channels=2,
+        faststart=True,
+        video_bit_rate=2_000_000,
+        video_profile="high",
+        video_level=4.0,
+    )
+
+
+@pytest.mark.parametrize(
+    "format_profile,format_level,expected",
+    [
+        ("High@L4.1", None, ("high", 4.1)),
+        ("Constrained Baseline@L3.1", None, ("constrained baseline", 3.1)),
+        ("Main", "4", ("main", 4.0)),
+        (None, None, ("", 0.0)),
+    ],
+)
+def test_parses_profile_and_level(format_profile, format_level, expected):
+    track = Bunch(format_profile=format_profile, format_level=format_level)
+    assert _profile_and_level(track) == expected
+
+
+_CONFORMANT_PROBE = MediaProbe(
+    duration=5.0,
+    video_dims=(1280, 720),
+    video_codec="h264",
+    pix_fmt="yuv420p",
+    audio_codec="aac",
+    audio_channels=1,
+    video_bit_rate=2_000_000,
+    video_profile="high",
+    video_level=4.1,
+)
+
+
+@pytest.mark.parametrize(
+    "probe,video_filter,expected",
+    [
+        (_CONFORMANT_PROBE, "crop=iw-0:ih-0,scale=1280:720", True),
+        (
+            replace(_CONFORMANT_PROBE, audio_codec="", audio_channels=0),
+            "crop=iw-0:ih-0,scale=1280:720",
+            True,
+        ),
+        # too many bits (e.g. a camera recording) or unknown
+        (
+            replace(_CONFORMANT_PROBE, video_bit_rate=12_000_000),
+            "crop=iw-0:ih-0,scale=1280:720",
+            False,
+        ),
+        (
+            replace(_CONFORMANT_PROBE, video_bit_rate=0),
+            "crop=iw-0:ih-0,scale=1280:720",
+            False,
+        ),
+        # profiles or levels some clients can't decode, or unknown
+        (
+            replace(_CONFORMANT_PROBE, video_profile="high 4:4:4 predictive"),
+            "crop=iw-0:ih-0,scale=1280:720",
+            False,
+        ),
+        (
+            replace(_CONFORMANT_PROBE, video_level=5.1),
+            "crop=iw-0:ih-0,scale=1280:720",
+            False,
+        ),
+        (
+            replace(_CONFORMANT_PROBE, video_profile="", video_level=0.0),
+            "crop=iw-0:ih-0,scale=1280:720",
+            False,
+        ),
+        # scaled or cropped
+        (_CONFORMANT_PROBE, "crop=iw-0:ih-0,scale=854:480", False),
+        (_CONFORMANT_PROBE, "crop=iw-800:ih-180,scale=1280:720", False),
+        # different formats
+        (
+            replace(_CONFORMANT_PROBE, video_codec="vp8"),
+            "crop=iw-0:ih-0,scale=1280:720",
+            False,
+        ),
+        (
+            replace(_CONFORMANT_PROBE, pix_fmt="yuv422p"),
+            "crop=iw-0:ih-0,scale=1280:720",
+            False,
+        ),
+        (
+            replace(_CONFORMANT_PROBE, rotation=90.0),
+            "crop=iw-0:ih-0,scale=1280:720",
+            False,
+        ),
+        (
+            replace(_CONFORMANT_PROBE, audio_channels=2),
+            "crop=iw-0:ih-0,scale=1280:720",
+            False,
+        ),
+        (
+            replace(_CONFORMANT_PROBE, audio_codec="opus"),
+            "crop=iw-0:ih-0,scale=1280:720",
+            False,
+        ),
+    ],
+)
+def test_checks_passthrough_conformance(
+    probe: MediaProbe, video_filter: str, expected: bool
+):
+    assert can_passthrough(probe, video_filter) == expected
+
+
+@patch("ffmpy.FFmpeg")
+@patch("mentor_upload_process.media_tools.MediaInfo.parse")
+def test_remuxes_conformant_renditions(mock_parse: Mock, mock_ffmpeg_cls: Mock, tmpdir):
+    mock_parse.return_value = _mock_conformant_media_info()
+    runs = _mock_ffmpeg(mock_ffmpeg_cls)
+    video_file = tmpdir / "video.mp4"
+    video_file.write("fake video")
+    web_file = tmpdir / "web.mp4"
+    mobile_file = tmpdir / "mobile.mp4"
+    video_encode_for_web_and_mobile(str(video_file), str(web_file), str(mobile_file))
+    # the web rendition is remuxed, only the mobile one gets encoded
+    assert len(runs) == 2
+    remux_args = runs[0]["outputs"][str(web_file)]
+    assert remux_args[remux_args.index("-c") + 1] == "copy"
+    assert "+faststart" in remux_args
+    encode_args = runs[1]["outputs"][str(mobile_file)]
+    assert encode_args[encode_args.index("-c:v") + 1] == "libx264"
+
+
+@patch("ffmpy.FFmpeg")
+@patch("mentor_upload_process.media_tools.MediaInfo.parse")
+def test_does_not_remux_when_disabled(
+    mock_parse: Mock, mock_ffmpeg_cls: Mock, monkeypatch, tmpdir
+):
+    monkeypatch.setenv("TRANSCODE_PASSTHROUGH", "false")
+    mock_parse.return_value = _mock_conformant_media_info()
+    runs = _mock_ffmpeg(mock_ffmpeg_cls)
+    video_file = tmpdir / "video.mp4"
+    video_file.write("fake video")
+    video_encode_for_web_and_mobile(
+        str(video_file), str(tmpdir / "web.mp4"), str(tmpdir / "mobile.mp4")
+    )
+    assert len(runs) == 1
+    assert "-filter_complex" in mock_ffmpeg_cls.call_args.kwargs["global_options"]
+
+
+_PROGRESS_OUTPUT = """frame=30
+fps=30.00
+out_time_us=1000000
+out_time_ms=1000000
+speed=2.5x
+progress=continue
+frame=120
+fps=N/A
+out_time_ms=4000000
+speed=N/A
+progress=end
+"""
+
+
+def test_parses_ffmpeg_progress():
+    assert list(iter_progress(_PROGRESS_OUTPUT.splitlines(), 4.0)) == [
+        FFmpegProgress(out_time=1.0, percent=25.0, fps=30.0, speed=2.5),
+        FFmpegProgress(out_time=4.0, percent=100.0, fps=0.0, speed=0.0, done=True),
+    ]
+    assert list(iter_progress(_PROGRESS_OUTPUT.splitlines(), 0.0))[0].percent is None
+
+
+def _mock_ffmpeg_run_with_progress(stdout=None, **kwargs):
+    if stdout:
+        stdout.write(_PROGRESS_OUTPUT)
+    return (None, None)
+
+
+def test_streams_ffmpeg_progress_while_it_runs():
+    ff = Mock()
+    ff.run.side_effect = _mock_ffmpeg_run_with_progress
+    progress = []
+    run_ffmpeg(ff, 4.0, progress.append)
+    assert [p.percent for p in progress] == [25.0, 100.0]
+    assert progress[-1].done
+
+
+@patch("mentor_upload_process.media_tools.find_video_dims")
+@patch("ffmpy.FFmpeg")
+@patch("ffmpy.FFprobe")
+def test_sums_up_progress_of_chunks(
+    mock_ffprobe_cls: Mock,
+    mock_ffmpeg_cls: Mock,
+    mock_find_video_dims: Mock,
+    monkeypatch,
+    tmpdir,
+):
+    monkeypatch.setenv("CHUNKED_ENCODE_WORKERS", "2")
+    monkeypatch.setenv("CHUNKED_ENCODE_MIN_CHUNK_SECS", "1")
+    mock_find_video_dims.return_value = (1280, 720)
+    _mock_ffprobe(mock_ffprobe_cls, _ffprobe_stdout(keyframes=(0.0, 4.0)))
+
+    def mock_ffmpeg_constructor(inputs: dict, outputs: dict, **kwargs) -> Mock:
+        for output_file in outputs.keys():
+            Path(output_file).write_text("fake output")
+        ff = Mock()
+        ff.run.side_effect = _mock_ffmpeg_run_with_progress
+        return ff
+
+    mock_ffmpeg_cls.side_effect = mock_ffmpeg_constructor
+    video_file = tmpdir / "video.mp4"
+    video_file.write("fake video")
+    progress = []
+    video_encode_for_web_and_mobile(
+        str(video_file),
+        str(tmpdir / "web.mp4"),
+        str(tmpdir / "mobile.mp4"),
+        trim={"start": 0.0, "end": 8.0},
+        chunked=True,
+        on_progress=progress.append,
+    )
+    assert progress[-1] == FFmpegProgress(
+        out_time=8.0, percent=100.0, fps=0.0, speed=0.0, done=True
+    )
+    assert not any(p.done for p in progress[:-1])
@@ -27,23 +27,54 @@ from mentor_upload_process.api import (
     upload_task_status_req_gql,
     UpdateTaskStatusRequest,
     answer_upload_update_gql,
-    fetch_question_name_gql,
+    fetch_question_gql,
+    get_question_cache,
     get_graphql_endpoint,
     AnswerUpdateRequest,
     media_update_gql,
     MediaUpdateRequest,
 )
 from mentor_upload_process.media_tools import (
-    output_args_video_encode_for_mobile,
-    output_args_video_encode_for_web,
+    global_args_progress,
+    global_args_video_encode_for_web_and_mobile,
+    input_args_trim,
+    output_args_video_encode_split,
     output_args_video_to_audio,
 )
+from mentor_upload_process.s3 import get_s3_transfer_config, reset_s3_client
+from mentor_upload_process.status import reset_task_status_reporter
 from .utils import fixture_upload, mock_s3_client
 
 TEST_STATIC_AWS_S3_BUCKET = "mentorpal-origin"
 TEST_STATIC_URL_BASE = "http://static-somedomain.mentorpal.org"
 
 
+@pytest.fixture(autouse=True)
+def s3_client():
+    # the s3 client is a process-wide singleton,
+    # make sure every test gets a fresh (mocked) one
+    reset_s3_client()
+    yield
+    reset_s3_client()
+
+
+@pytest.fixture(autouse=True)
+def sync_task_status(monkeypatch):
+    # report task status synchronously so tests can expect
+    # every status update in order among the other graphql calls
+    monkeypatch.setenv("TASK_STATUS_FLUSH_INTERVAL", "0")
+    reset_task_status_reporter()
+    yield
+    reset_task_status_reporter()
+
+
+@pytest.fixture(autouse=True)
+def question_cache():
+    get_question_cache().clear()
+    yield
+    get_question_cache().clear()
+
+
 @contextmanager
 def _test_env(
     video_file: str,
@@ -192,7 +223,7 @@ def _mock_gql_task_status_update(
 
 
 def _mock_is_idle_question_(question_id: str) -> dict:
-    gql_query = fetch_question_name_gql(question_id)
+    gql_query = fetch_question_gql(question_id)
     responses.add(
         responses.POST,
         get_graphql_endpoint(),
@@ -215,30 +246,28 @@ def _transcode_stage_expect_transcode_calls(
     video_path: str,
     mock_ffmpeg_cls: Mock,
     video_dims: Tuple[int, int],
+    trim: TrimRequest = None,
 ) -> Tuple[str, str, str, str, str]:
     """
-    There are currently 2 transcode calls that need to happen in the transcode stage:
-     - convert the uploaded video to a web-optimized video
-     - convert the uploaded video to a mobile-optimized video
+    There is currently 1 transcode call that needs to happen in the transcode stage:
+     - decode the uploaded video once and encode it to both
+       a web-optimized and a mobile-optimized video
     """
     expected_mobile_video_path = path.join(path.split(video_path)[0], "mobile.mp4")
     expected_web_video_path = path.join(path.split(video_path)[0], "web.mp4")
     mock_ffmpeg_cls.assert_has_calls(
         [
             call(
-                inputs={video_path: None},
-                outputs={
-                    expected_mobile_video_path: output_args_video_encode_for_mobile(
-                        video_path, video_dims=video_dims
-                    )
-                },
-            ),
-            call(
-                inputs={video_path: None},
+                global_options=global_args_video_encode_for_web_and_mobile(
+                    video_path, video_dims=video_dims
+                )
+                + global_args_progress(),
+                inputs={video_path: input_args_trim(trim)},
                 outputs={
-                    expected_web_video_path: output_args_video_encode_for_web(
-                        video_path, video_dims=video_dims
-                    )
+                    expected_mobile_video_path: output_args_video_encode_split(
+                        "mobile"
+                    ),
+                    expected_web_video_path: output_args_video_encode_split("web"),
                 },
             ),
         ],
@@ -252,6 +281,7 @@ def _transcode_stage_expect_transcode_calls(
 def _transcribe_stage_expect_transcode_calls(
     video_path: str,
     mock_ffmpeg_cls: Mock,
+    trim: TrimRequest = None,
 ) -> Tuple[str, str, str, str, str]:
     """
     There is currently 1 transcode call that need to happen in the transcribe process:
@@ -261,7 +291,8 @@ def _transcribe_stage_expect_transcode_calls(
     mock_ffmpeg_cls.assert_has_calls(
         [
             call(
-                inputs={video_path: None},
+                global_options=global_args_progress(),
+                inputs={video_path: input_args_trim(trim)},
                 outputs={expected_audio_path: output_args_video_to_audio()},
             ),
         ],
@@ -272,14 +303,13 @@ def _transcribe_stage_expect_transcode_calls(
 def _mock_ffmpeg(mock_ffmpeg_cls: Mock):
     mock_ffmpeg_inst = Mock()
 
-    def mock_ffmpeg_constructor(inputs: dict, outputs: dict) -> Mock:
+    def mock_ffmpeg_constructor(inputs: dict, outputs: dict, **kwargs) -> Mock:
         """
         when FFMpeg constructor is called,
-        we need to capture the target 'output' file
+        we need to capture the target 'output' files
         and create a fake output there
         """
-        if outputs:
-            output_file = list(outputs.keys())[0]
+        for output_file in (outputs or {}).keys():
             Path(output_file).write_text("fake output")
         return mock_ffmpeg_inst
 
@@ -372,7 +402,9 @@ def test_trim_upload_stage(
             trim_upload_stage,
         )
 
-        trim_upload_stage(req, "fake_task_id")
+        assert trim_upload_stage(req, "fake_task_id")["trim"] == ex.trim
+        # trimming is left to the encoders of the downstream stages
+        mock_ffmpeg_cls.assert_not_called()
 
         _expect_gql(expected_gql)
 
@@ -513,11 +545,15 @@ def test_transcribing_stage(
 
         assert transcribe_stage(
             [output_dict_from_trim_upload_stage], req, "fake_task_id"
-        ) == {"transcript": ex.transcript_fake, "subtitles": ex.subtitles_fake}
+        ) == {
+            "transcript": ex.transcript_fake,
+            "subtitles": ex.subtitles_fake,
+            "transcribed": not is_idle,
+        }
 
         if not is_idle:
             _transcribe_stage_expect_transcode_calls(
-                str(work_dir / ex.video_name), mock_ffmpeg_cls
+                str(work_dir / ex.video_name), mock_ffmpeg_cls, trim=ex.trim
             )
 
         _expect_gql(expected_gql)
@@ -673,6 +709,7 @@ def test_finalization_stage(
                     TEST_STATIC_AWS_S3_BUCKET,
                     f"videos/{mentor}/{question}/{timestamp}/en.vtt",
                     ExtraArgs={"ContentType": "text/vtt"},
+                    Config=get_s3_transfer_config(),
                 ),
             )
 
@@ -793,18 +830,21 @@ def test_trim_existing_video(
                 TEST_STATIC_AWS_S3_BUCKET,
                 f"videos/{ex.mentor}/{ex.question}/{ex.timestamp}/web.mp4",
                 ExtraArgs={"ContentType": "video/mp4"},
+                Config=get_s3_transfer_config(),
             ),
             call(
                 expected_trimmed_mobile_video_path,
                 TEST_STATIC_AWS_S3_BUCKET,
                 f"videos/{ex.mentor}/{ex.question}/{ex.timestamp}/mobile.mp4",
                 ExtraArgs={"ContentType": "video/mp4"},
+                Config=get_s3_transfer_config(),
             ),
             call(
                 expected_vtt_path,
                 TEST_STATIC_AWS_S3_BUCKET,
                 f"videos/{ex.mentor}/{ex.question}/{ex.timestamp}/en.vtt",
                 ExtraArgs={"ContentType": "text/vtt"},
+                Config=get_s3_transfer_config(),
             ),
         ]
 
@@ -837,6 +877,16 @@ class _TestTranscodeStageExample:
                 video_name="video1.mp4",
             )
         ),
+        (
+            _TestTranscodeStageExample(
+                mentor="m1",
+                question="q1",
+                timestamp="20120114T032134Z",
+                trim={"start": 5.3, "end": 8.921},
+                video_dims=(400, 400),
+                video_name="video1.mp4",
+            )
+        ),
     ],
 )
 def test_transcode_stage(
@@ -853,7 +903,6 @@ def test_transcode_stage(
             "mentor": "m1",
             "question": "q1",
             "video_path": "video1.mp4",
-            "trim": None,
         }
         task_id = "t1"
 
@@ -865,6 +914,7 @@ def test_transcode_stage(
         output_dict_from_trim_upload_stage = {
             "video_file": video_file,
             "work_dir": work_dir,
+            "trim": ex.trim,
         }
 
         _mock_ffmpeg(mock_ffmpeg_cls)
@@ -894,6 +944,7 @@ def test_transcode_stage(
             str(work_dir / ex.video_name),
             mock_ffmpeg_cls,
             video_dims=ex.video_dims,
+            trim=ex.trim,
         )
         _expect_gql(expected_gql)
 
@@ -903,18 +954,74 @@ def test_transcode_stage(
                 TEST_STATIC_AWS_S3_BUCKET,
                 f"videos/{ex.mentor}/{ex.question}/{ex.timestamp}/mobile.mp4",
                 ExtraArgs={"ContentType": "video/mp4"},
+                Config=get_s3_transfer_config(),
             ),
             call(
                 expected_web_video_path,
                 TEST_STATIC_AWS_S3_BUCKET,
                 f"videos/{ex.mentor}/{ex.question}/{ex.timestamp}/web.mp4",
                 ExtraArgs={"ContentType": "video/mp4"},
+                Config=get_s3_transfer_config(),
             ),
         ]
 
         mock_s3.upload_file.assert_has_calls(expected_upload_file_calls)
 
 
+@responses.activate
+@patch("ffmpy.FFmpeg")
+@patch("boto3.client")
+def test_transcode_stage_reuses_renditions_of_a_duplicate_upload(
+    mock_boto3_client: Mock,
+    mock_ffmpeg_cls: Mock,
+    monkeypatch,
+    tmpdir,
+):
+    timestamp = "20120114T032134Z"
+    with _test_env("video1.mp4", timestamp, monkeypatch, tmpdir) as work_dir:
+        req = {"mentor": "m1", "question": "q1", "video_path": "video1.mp4"}
+        mock_s3 = mock_s3_client(mock_boto3_client)
+        mock_s3.copy = Mock()
+        manifest = {
+            "media": [
+                {"type": "video", "tag": "mobile", "url": "videos/m0/q0/t/mobile.mp4"},
+                {"type": "video", "tag": "web", "url": "videos/m0/q0/t/web.mp4"},
+            ]
+        }
+        expected_gql = [
+            _mock_gql_task_status_update("m1", "q1", task_id="t1", new_status=s)
+            for s in ("IN_PROGRESS", "DONE")
+        ]
+        from mentor_upload_process.process import transcode_stage
+
+        result = transcode_stage(
+            [
+                {
+                    "video_file": work_dir / "video1.mp4",
+                    "work_dir": work_dir,
+                    "dedupe_manifest": manifest,
+                }
+            ],
+            req,
+            "t1",
+        )
+        assert result["media"] == _transcode_expected_media("m1", "q1", timestamp)
+        mock_ffmpeg_cls.assert_not_called()
+        mock_s3.upload_file.assert_not_called()
+        mock_s3.copy.assert_has_calls(
+            [
+                call(
+                    {"Bucket": TEST_STATIC_AWS_S3_BUCKET, "Key": m["url"]},
+                    TEST_STATIC_AWS_S3_BUCKET,
+                    f"videos/m1/q1/{timestamp}/{path.basename(m['url'])}",
+                    Config=get_s3_transfer_config(),
+                )
+                for m in manifest["media"]
+            ]
+        )
+        _expect_gql(expected_gql)
+
+
 @responses.activate
 def test_raises_if_video_path_not_specified():
     req = {"mentor": "m1", "question": "q1"}
@@ -1113,6 +1220,7 @@ def test_regen_vtt(
                 TEST_STATIC_AWS_S3_BUCKET,
                 f"videos/{ex.mentor}/{ex.question}/{ex.timestamp}/en.vtt",
                 ExtraArgs={"ContentType": "text/vtt"},
+                Config=get_s3_transfer_config(),
             ),
         ]
 
@@ -0,0 +1,38 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+from unittest.mock import patch, Mock
+
+from mentor_upload_process.s3 import (
+    get_s3_client,
+    get_s3_transfer_config,
+    reset_s3_client,
+)
+
+
+@patch("boto3.client")
+def test_s3_client_is_created_once_per_process(mock_boto3_client: Mock, monkeypatch):
+    monkeypatch.setenv("STATIC_AWS_REGION", "us-east-10000")
+    monkeypatch.setenv("STATIC_AWS_ACCESS_KEY_ID", "fake-access-key-id")
+    monkeypatch.setenv("STATIC_AWS_SECRET_ACCESS_KEY", "fake-access-key-secret")
+    monkeypatch.setenv("S3_MAX_POOL_CONNECTIONS", "32")
+    monkeypatch.setenv("S3_MULTIPART_THRESHOLD", "1024")
+    monkeypatch.setenv("S3_MAX_CONCURRENCY", "4")
+    mock_boto3_client.side_effect = lambda *args, **kwargs: Mock()
+    reset_s3_client()
+    try:
+        assert get_s3_client() is get_s3_client()
+        assert mock_boto3_client.call_count == 1
+        assert mock_boto3_client.call_args[1]["config"].max_pool_connections == 32
+        assert get_s3_transfer_config() is get_s3_transfer_config()
+        assert get_s3_transfer_config().multipart_threshold == 1024
+        assert get_s3_transfer_config().max_concurrency == 4
+        # e.g. what happens in a forked child
+        reset_s3_client()
+        get_s3_client()
+        assert mock_boto3_client.call_count == 2
+    finally:
+        reset_s3_client()
@@ -0,0 +1,206 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import json
+import threading
+import time
+from unittest.mock import patch, Mock
+
+import responses
+
+from mentor_upload_process.api import (
+    UpdateTaskStatusRequest,
+    get_graphql_endpoint,
+    upload_task_status_batch_req_gql,
+    upload_task_status_req_gql,
+)
+from mentor_upload_process.media_tools import FFmpegProgress
+from mentor_upload_process.status import (
+    TaskProgressReporter,
+    TaskStatusReporter,
+    flush_task_status,
+    set_task_progress_sink,
+)
+
+
+def _req(task_id: str, status: str, **kwargs) -> UpdateTaskStatusRequest:
+    return UpdateTaskStatusRequest(
+        mentor="m1", question="q1", task_id=task_id, new_status=status, **kwargs
+    )
+
+
+@patch("mentor_upload_process.status.upload_task_status_batch_update")
+def test_collapses_superseded_transitions(mock_batch_update: Mock):
+    reporter = TaskStatusReporter(flush_interval=60)
+    reporter.report(_req("t1", "IN_PROGRESS"))
+    reporter.report(_req("t2", "IN_PROGRESS"))
+    reporter.report(_req("t1", "DONE", transcript="hello"))
+    reporter.report(_req("t1", "FAILED"))
+    reporter.flush()
+    mock_batch_update.assert_called_once_with(
+        [_req("t2", "IN_PROGRESS"), _req("t1", "FAILED", transcript="hello")]
+    )
+
+
+@patch("mentor_upload_process.status.upload_task_status_batch_update")
+def test_flushes_in_batches(mock_batch_update: Mock):
+    reporter = TaskStatusReporter(flush_interval=60, max_batch_size=2)
+    for i in range(5):
+        reporter.report(_req(f"t{i}", "DONE"))
+    reporter.flush()
+    assert [len(c.args[0]) for c in mock_batch_update.call_args_list] == [2, 2, 1]
+
+
+@patch("mentor_upload_process.status.upload_task_status_batch_update")
+def test_flushes_on_interval_without_blocking_report(mock_batch_update: Mock):
+    reporter = TaskStatusReporter(flush_interval=0.01)
+    reporter.report(_req("t1", "DONE"))
+    for _ in range(100):
+        if mock_batch_update.called:
+            break
+        time.sleep(0.01)
+    mock_batch_update.assert_called_once_with([_req("t1", "DONE")])
+
+
+@patch("mentor_upload_process.status.upload_task_status_update")
+def test_reports_synchronously_when_interval_is_zero(mock_update: Mock):
+    reporter = TaskStatusReporter(flush_interval=0)
+    reporter.report(_req("t1", "DONE"))
+    mock_update.assert_called_once_with(_req("t1", "DONE"))
+
+
+@patch("mentor_upload_process.status.upload_task_status_batch_update")
+def test_failed_flush_does_not_raise(mock_batch_update: Mock):
+    mock_batch_update.side_effect = Exception("graphql down")
+    reporter = TaskStatusReporter(flush_interval=60)
+    reporter.report(_req("t1", "DONE"))
+    reporter.flush()
+
+
+@patch("mentor_upload_process.status.upload_task_status_batch_update")
+def test_resends_failed_transitions_until_max_retries(mock_batch_update: Mock):
+    mock_batch_update.side_effect = Exception("graphql down")
+    reporter = TaskStatusReporter(flush_interval=60, max_retries=2)
+    reporter.report(_req("t1", "DONE"))
+    for _ in range(4):
+        reporter.flush()
+    assert mock_batch_update.call_count == 3
+
+
+@patch("mentor_upload_process.status.upload_task_status_batch_update")
+def test_does_not_resend_superseded_transitions(mock_batch_update: Mock):
+    reporter = TaskStatusReporter(flush_interval=60)
+
+    def fail_and_report_newer(batch):
+        if mock_batch_update.call_count == 1:
+            reporter.report(_req("t1", "DONE"))
+            raise Exception("graphql down")
+
+    mock_batch_update.side_effect = fail_and_report_newer
+    reporter.report(_req("t1", "IN_PROGRESS", transcript="hello"))
+    reporter.flush()
+    reporter.flush()
+    assert mock_batch_update.call_args_list[1].args[0] == [
+        _req("t1", "DONE", transcript="hello")
+    ]
+
+
+@responses.activate
+def test_resends_only_the_updates_of_a_batch_that_failed():
+    responses.add(
+        responses.POST,
+        get_graphql_endpoint(),
+        json={
+            "data": {"api": {"u0": True, "u1": None}},
+            "errors": [{"message": "task not found", "path": ["api", "u1"]}],
+        },
+    )
+    responses.add(responses.POST, get_graphql_endpoint(), json={"data": {}})
+    reporter = TaskStatusReporter(flush_interval=60)
+    reporter.report(_req("t1", "DONE"))
+    reporter.report(_req("t2", "FAILED"))
+    reporter.flush()
+    reporter.flush()
+    assert len(responses.calls) == 2
+    body = json.loads(responses.calls[1].request.body)
+    assert body["variables"] == {
+        "mentorId": "m1",
+        "questionId": "q1",
+        "taskId": "t2",
+        "newStatus": "FAILED",
+    }
+
+
+@patch("mentor_upload_process.status.upload_task_status_batch_update")
+def test_flush_gives_up_waiting_after_timeout(mock_batch_update: Mock):
+    graphql_back = threading.Event()
+    mock_batch_update.side_effect = lambda batch: graphql_back.wait(5)
+    reporter = TaskStatusReporter(flush_interval=60)
+    reporter.report(_req("t1", "DONE"))
+    with patch("mentor_upload_process.status._reporter", reporter):
+        started = time.monotonic()
+        flush_task_status(timeout=0.05)
+    assert time.monotonic() - started < 1
+    mock_batch_update.assert_called_once_with([_req("t1", "DONE")])
+    graphql_back.set()
+
+
+@responses.activate
+def test_sends_one_aliased_mutation_per_batch():
+    responses.add(responses.POST, get_graphql_endpoint(), json={"data": {}})
+    reporter = TaskStatusReporter(flush_interval=60)
+    reporter.report(_req("t1", "DONE", transcript="hello"))
+    reporter.report(_req("t2", "FAILED"))
+    reporter.flush()
+    assert len(responses.calls) == 1
+    body = json.loads(responses.calls[0].request.body)
+    assert "u0: uploadTaskStatusUpdate(" in body["query"]
+    assert "u1: uploadTaskStatusUpdate(" in body["query"]
+    assert body["variables"] == {
+        "mentorId0": "m1",
+        "questionId0": "q1",
+        "taskId0": "t1",
+        "newStatus0": "DONE",
+        "transcript0": "hello",
+        "mentorId1": "m1",
+        "questionId1": "q1",
+        "taskId1": "t2",
+        "newStatus1": "FAILED",
+    }
+
+
+def test_batch_of_one_is_a_plain_status_update():
+    req = _req("t1", "DONE")
+    assert upload_task_status_batch_req_gql([req])["variables"] == {
+        f"{k}0": v for k, v in upload_task_status_req_gql(req)["variables"].items()
+    }
+
+
+def test_throttles_task_progress():
+    sent = []
+    set_task_progress_sink(lambda task_id, progress: sent.append((task_id, progress)))
+    try:
+        report = TaskProgressReporter("t1", "transcoding", interval=60)
+        report(FFmpegProgress(out_time=1.0, percent=10.0, fps=30.0, speed=1.5))
+        report(FFmpegProgress(out_time=2.0, percent=20.0, fps=30.0, speed=1.5))
+        report(FFmpegProgress(out_time=10.0, percent=100.0, fps=0, speed=0, done=True))
+    finally:
+        set_task_progress_sink(None)
+    assert [(task_id, p["percent"], p["done"]) for task_id, p in sent] == [
+        ("t1", 10.0, False),
+        ("t1", 100.0, True),
+    ]
+    assert sent[0][1]["stage"] == "transcoding"
+
+
+def test_failed_progress_sink_does_not_raise():
+    set_task_progress_sink(Mock(side_effect=Exception("backend down")))
+    try:
+        TaskProgressReporter("t1", "transcoding")(
+            FFmpegProgress(out_time=1.0, percent=10.0, fps=30.0, speed=1.5)
+        )
+    finally:
+        set_task_progress_sink(None)
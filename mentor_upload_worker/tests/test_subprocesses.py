@@ -0,0 +1,127 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import ffmpy
+import pytest
+
+from mentor_upload_process.subprocesses import (
+    ProcessCancelledError,
+    ProcessLimits,
+    ProcessTimeoutError,
+    kill_task_processes,
+    parse_cpu_list,
+    run_managed,
+    task_processes,
+)
+
+
+def _sh(tmpdir, script: str) -> ffmpy.FFmpeg:
+    # stands in for ffmpeg, ffmpy runs any executable
+    script_file = tmpdir / "script.sh"
+    script_file.write(script)
+    return ffmpy.FFmpeg(executable="sh", global_options=[str(script_file)])
+
+
+def _wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def _is_running(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # a killed child that wasn't reaped yet is a zombie (Z)
+            return f.read().split(")")[-1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+@pytest.mark.parametrize(
+    "cpus,expected",
+    [("", ()), ("0", (0,)), ("0-3,6", (0, 1, 2, 3, 6)), ("2,0-1", (0, 1, 2))],
+)
+def test_parses_cpu_lists(cpus: str, expected: tuple):
+    assert parse_cpu_list(cpus) == expected
+
+
+def test_runs_to_completion(tmpdir):
+    stdout, _ = run_managed(
+        _sh(tmpdir, "echo done"), ProcessLimits(timeout=10), stdout=-1
+    )
+    assert stdout.strip() == b"done"
+
+
+def test_kills_a_process_past_its_timeout(tmpdir):
+    started = time.monotonic()
+    with pytest.raises(ProcessTimeoutError):
+        run_managed(_sh(tmpdir, "sleep 30"), ProcessLimits(timeout=0.2))
+    assert time.monotonic() - started < 5
+
+
+def test_cancelling_a_task_kills_its_process_group(tmpdir):
+    pid_file = tmpdir / "child.pid"
+    ff = _sh(tmpdir, f"sleep 30 &\necho $! > {pid_file}\nwait\n")
+    errors = []
+
+    def run():
+        with task_processes("t1"):
+            try:
+                run_managed(ff, ProcessLimits(timeout=30))
+            except Exception as x:
+                errors.append(x)
+
+    runner = threading.Thread(target=run)
+    runner.start()
+    _wait_for(lambda: pid_file.exists() and pid_file.read().strip())
+    child_pid = int(pid_file.read().strip())
+    assert kill_task_processes("t2") == 0
+    assert kill_task_processes("t1") == 1
+    runner.join(5)
+    assert not runner.is_alive()
+    assert isinstance(errors[0], ProcessCancelledError)
+    _wait_for(lambda: not _is_running(child_pid))
+
+
+def test_applies_nice_to_the_process(tmpdir):
+    ff = _sh(tmpdir, "sleep 0.5")
+    runner = threading.Thread(
+        target=run_managed, args=(ff, ProcessLimits(timeout=10, nice=5))
+    )
+    runner.start()
+    _wait_for(lambda: getattr(ff, "process", None) is not None)
+    _wait_for(
+        lambda: os.getpriority(os.PRIO_PROCESS, ff.process.pid)
+        == os.getpriority(os.PRIO_PROCESS, 0) + 5
+    )
+    runner.join(5)
+
+
+def test_terminate_runs_before_exit_then_exits(tmpdir):
+    flushed = tmpdir / "flushed"
+    # a prefork worker process: SIGTERM's handler is the default
+    worker = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import os, signal, time\n"
+            "from mentor_upload_process.subprocesses import kill_processes_on_terminate\n"
+            f"kill_processes_on_terminate(lambda: open({str(flushed)!r}, 'w').write('yes'))\n"
+            "os.kill(os.getpid(), signal.SIGTERM)\n"
+            "time.sleep(5)\n",
+        ],
+        timeout=30,
+    )
+    assert worker.returncode == -signal.SIGTERM
+    assert flushed.read() == "yes"
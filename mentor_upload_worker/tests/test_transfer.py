@@ -0,0 +1,231 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+import threading
+import time
+from unittest.mock import patch, Mock
+
+import pytest
+import requests
+
+from mentor_upload_process.transfer import (
+    HostConnectionLimiter,
+    iter_url_parts,
+    run_concurrently,
+    stream_url_to_s3,
+)
+
+
+def test_limits_concurrent_transfers_per_host():
+    limiter = HostConnectionLimiter(2)
+    lock = threading.Lock()
+    active = {"a.org": 0, "b.org": 0}
+    peak = {"a.org": 0, "b.org": 0}
+
+    def transfer(url: str):
+        host = url.split("/")[2]
+        with limiter.slot(url):
+            with lock:
+                active[host] += 1
+                peak[host] = max(peak[host], active[host])
+            time.sleep(0.02)
+            with lock:
+                active[host] -= 1
+
+    run_concurrently(
+        transfer,
+        [f"https://{h}/{i}.mp4" for h in ["a.org", "b.org"] for i in range(6)],
+        max_workers=8,
+    )
+    assert peak == {"a.org": 2, "b.org": 2}
+
+
+def _answer(question: str, needs_transfer=True) -> dict:
+    return {
+        "question": {"_id": question},
+        "media": [
+            {
+                "type": "video",
+                "tag": "web",
+                "url": f"https://old.org/{question}/web.mp4",
+                "needsTransfer": needs_transfer,
+            }
+        ],
+    }
+
+
+@patch("mentor_upload_process.process.update_media")
+@patch("mentor_upload_process.process.stream_url_to_s3")
+@patch("mentor_upload_process.process.import_task_update_gql")
+@patch("mentor_upload_process.process.import_mentor_gql")
+def test_transfer_mentor_isolates_failures_per_answer(
+    mock_import_mentor_gql: Mock,
+    mock_import_task_update_gql: Mock,
+    mock_stream_url_to_s3: Mock,
+    mock_update_media: Mock,
+    monkeypatch,
+):
+    monkeypatch.setenv("STATIC_AWS_S3_BUCKET", "mentorpal-origin")
+    mock_import_mentor_gql.return_value = {
+        "answers": [_answer("q1"), _answer("q2"), _answer("q3", needs_transfer=False)]
+    }
+
+    def stream(url, *args, **kwargs):
+        if "q2" in url:
+            raise Exception("download failed")
+
+    mock_stream_url_to_s3.side_effect = stream
+    from mentor_upload_process.process import process_transfer_mentor
+
+    process_transfer_mentor(
+        {"mentor": "m1", "mentorExportJson": {}, "replacedMentorDataChanges": {}},
+        "fake_task_id",
+    )
+    migrate_updates = {
+        c.args[0]
+        .answerMediaMigrateUpdate["question"]: c.args[0]
+        .answerMediaMigrateUpdate
+        for c in mock_import_task_update_gql.call_args_list
+        if c.args[0].answerMediaMigrateUpdate
+    }
+    assert migrate_updates["q1"] == {"question": "q1", "status": "DONE"}
+    assert migrate_updates["q2"] == {
+        "question": "q2",
+        "status": "FAILED",
+        "errorMessage": "download failed",
+    }
+    assert migrate_updates["q3"] == {"question": "q3", "status": "DONE"}
+    mock_stream_url_to_s3.assert_any_call(
+        "https://old.org/q1/web.mp4",
+        "mentorpal-origin",
+        "videos/m1/q1/web.mp4",
+        "video/mp4",
+        limiter=mock_stream_url_to_s3.call_args[1]["limiter"],
+    )
+    assert mock_update_media.call_count == 1
+
+
+class _FakeResponse:
+    def __init__(self, body: bytes, status_code=200, fail_after: int = -1):
+        self.body = body
+        self.status_code = status_code
+        self.headers = {"ETag": '"v1"'}
+        self.fail_after = fail_after
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size: int):
+        for i in range(0, len(self.body), chunk_size):
+            if 0 <= self.fail_after <= i:
+                raise requests.exceptions.ChunkedEncodingError("connection reset")
+            yield self.body[i : i + chunk_size]
+
+
+def _ranged_get(body: bytes, fail_after: int = -1, supports_range=True):
+    calls = []
+
+    def get(url, headers=None, **kwargs):
+        calls.append(dict(headers or {}))
+        offset = int(headers["Range"][6:-1]) if "Range" in headers else 0
+        if offset and not supports_range:
+            return _FakeResponse(body)
+        return _FakeResponse(
+            body[offset:],
+            status_code=206 if offset else 200,
+            # only the first response drops the connection
+            fail_after=fail_after if len(calls) == 1 else -1,
+        )
+
+    return get, calls
+
+
+@patch("mentor_upload_process.transfer.requests.get")
+def test_iter_url_parts_yields_fixed_size_parts(mock_get: Mock):
+    body = bytes(range(256)) * 10
+    mock_get.side_effect, _ = _ranged_get(body)
+    parts = list(iter_url_parts("https://a.org/v.mp4", 1000, 0, chunk_size=64))
+    assert [len(p) for p in parts] == [1000, 1000, 560]
+    assert b"".join(parts) == body
+
+
+@patch("mentor_upload_process.transfer.requests.get")
+def test_iter_url_parts_yields_one_empty_part_for_empty_body(mock_get: Mock):
+    mock_get.side_effect, _ = _ranged_get(b"")
+    assert list(iter_url_parts("https://a.org/v.mp4", 1000, 0)) == [b""]
+
+
+@patch("mentor_upload_process.transfer.requests.get")
+def test_iter_url_parts_resumes_with_ranged_get(mock_get: Mock):
+    body = bytes(range(256)) * 10
+    mock_get.side_effect, calls = _ranged_get(body, fail_after=1280)
+    parts = list(iter_url_parts("https://a.org/v.mp4", 1000, 1, chunk_size=64))
+    assert b"".join(parts) == body
+    assert len(calls) == 2
+    assert calls[1]["Range"] == "bytes=1280-"
+    assert calls[1]["If-Range"] == '"v1"'
+
+
+@patch("mentor_upload_process.transfer.requests.get")
+def test_iter_url_parts_fails_when_server_ignores_range(mock_get: Mock):
+    body = bytes(range(256)) * 10
+    mock_get.side_effect, _ = _ranged_get(body, fail_after=1280, supports_range=False)
+    with pytest.raises(Exception, match="failed to resume"):
+        list(iter_url_parts("https://a.org/v.mp4", 1000, 1, chunk_size=64))
+
+
+@patch("mentor_upload_process.transfer.get_transfer_part_size")
+@patch("mentor_upload_process.transfer.get_s3_client")
+@patch("mentor_upload_process.transfer.requests.get")
+def test_stream_url_to_s3_uploads_parts_and_completes(
+    mock_get: Mock, mock_get_s3_client: Mock, mock_part_size: Mock
+):
+    body = bytes(range(256)) * 10
+    mock_get.side_effect, _ = _ranged_get(body)
+    mock_part_size.return_value = 1000
+    s3 = mock_get_s3_client.return_value
+    s3.create_multipart_upload.return_value = {"UploadId": "u1"}
+    s3.upload_part.side_effect = lambda PartNumber, **kwargs: {"ETag": f"e{PartNumber}"}
+    stream_url_to_s3("https://a.org/v.mp4", "bucket", "videos/v.mp4", "video/mp4")
+    s3.create_multipart_upload.assert_called_once_with(
+        Bucket="bucket", Key="videos/v.mp4", ContentType="video/mp4"
+    )
+    assert b"".join(c.kwargs["Body"] for c in s3.upload_part.call_args_list) == body
+    s3.complete_multipart_upload.assert_called_once_with(
+        Bucket="bucket",
+        Key="videos/v.mp4",
+        UploadId="u1",
+        MultipartUpload={
+            "Parts": [
+                {"ETag": "e1", "PartNumber": 1},
+                {"ETag": "e2", "PartNumber": 2},
+                {"ETag": "e3", "PartNumber": 3},
+            ]
+        },
+    )
+    s3.abort_multipart_upload.assert_not_called()
+
+
+@patch("mentor_upload_process.transfer.get_s3_client")
+@patch("mentor_upload_process.transfer.requests.get")
+def test_stream_url_to_s3_aborts_upload_on_failure(
+    mock_get: Mock, mock_get_s3_client: Mock
+):
+    mock_get.side_effect = requests.exceptions.ConnectionError("refused")
+    s3 = mock_get_s3_client.return_value
+    s3.create_multipart_upload.return_value = {"UploadId": "u1"}
+    with pytest.raises(requests.exceptions.ConnectionError):
+        stream_url_to_s3("https://a.org/v.mp4", "bucket", "videos/v.mp4", "video/mp4")
+    s3.abort_multipart_upload.assert_called_once_with(
+        Bucket="bucket", Key="videos/v.mp4", UploadId="u1"
+    )
+    s3.complete_multipart_upload.assert_not_called()
@@ -0,0 +1,95 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+from io import StringIO
+
+import pytest
+
+from mentor_upload_process.media_tools import trim_vtt_and_transcript_via_timestamps
+from mentor_upload_process.webvtt import (
+    Cue,
+    VttWriter,
+    clip_cues,
+    format_timestamp,
+    iter_cues,
+    parse_timestamp,
+    parse_vtt,
+)
+
+AWS_VTT = """WEBVTT
+
+NOTE generated by transcribe
+
+1
+00:00:00.500 --> 00:00:02.500 align:start
+hello there how
+
+2
+01:00:03.000 --> 01:00:04.000
+are you
+doing"""
+
+
+@pytest.mark.parametrize(
+    "timestamp,seconds",
+    [
+        ("00:01.500", 1.5),
+        ("00:00:01.500", 1.5),
+        ("01:02:03.250", 3723.25),
+        ("10:00:00.000", 36000.0),
+    ],
+)
+def test_parses_and_formats_timestamps(timestamp: str, seconds: float):
+    assert parse_timestamp(timestamp) == seconds
+    assert parse_timestamp(format_timestamp(seconds)) == seconds
+
+
+def test_formats_hours():
+    assert format_timestamp(3723.25) == "01:02:03.250"
+    assert format_timestamp(59.5) == "00:00:59.500"
+
+
+def test_parses_cues_lazily():
+    cues = iter_cues(StringIO(AWS_VTT))
+    assert next(cues) == Cue(0.5, 2.5, "hello there how")
+    assert next(cues) == Cue(3603.0, 3604.0, "are you\ndoing")
+    assert next(cues, None) is None
+
+
+def test_clips_and_shifts_cues():
+    cues = [Cue(0, 2, "a"), Cue(2, 4, "b"), Cue(4, 6, "c"), Cue(6, 8, "d")]
+    assert list(clip_cues(cues, 3, 5)) == [Cue(0, 1, "b"), Cue(1, 2, "c")]
+    assert list(clip_cues(cues, 3, 5, shift=False)) == [
+        Cue(3, 4, "b"),
+        Cue(4, 5, "c"),
+    ]
+
+
+def test_writes_cues():
+    f = StringIO()
+    VttWriter(f).write_all([Cue(1.5, 3661, "a\nb")])
+    assert f.getvalue() == "WEBVTT FILE:\n\n00:00:01.500 --> 01:01:01.000\na\nb\n\n"
+    assert parse_vtt(f.getvalue()) == [Cue(1.5, 3661, "a\nb")]
+
+
+def test_trims_vtt_file_at_both_ends(tmpdir):
+    vtt_file = str(tmpdir / "en.vtt")
+    with open(vtt_file, "w") as f:
+        VttWriter(f).write_all(
+            [
+                Cue(0, 2, "one"),
+                Cue(2, 4, "two"),
+                Cue(3600, 3602, "three"),
+                Cue(3602, 3604, "four"),
+            ]
+        )
+    vtt, transcript = trim_vtt_and_transcript_via_timestamps(vtt_file, 3, 3603)
+    assert transcript == "two three four"
+    assert parse_vtt(vtt) == [
+        Cue(0, 1, "two"),
+        Cue(3597, 3599, "three"),
+        Cue(3599, 3600, "four"),
+    ]
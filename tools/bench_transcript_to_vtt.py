@@ -0,0 +1,93 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+"""
+Benchmark of vtt generation from a transcript,
+the O(words^2) chunking transcript_to_vtt used to do
+vs. mentor_upload_process.captions
+
+usage (from the repo root):
+
+    PYTHONPATH=mentor_upload_worker/src python tools/bench_transcript_to_vtt.py
+
+the legacy implementation is only timed up to --legacy-max-words,
+beyond that it takes minutes
+"""
+import argparse
+import math
+import random
+import time
+
+from mentor_upload_process.captions import cues_to_vtt, transcript_to_cues
+
+
+def legacy_transcript_to_vtt(transcript: str, duration: float) -> str:
+    piece_length = 68
+    word_indexes = [i for i, ltr in enumerate(transcript) if ltr == " "]
+    split_index = [0]
+    for k in range(1, len(word_indexes)):
+        for el in range(1, len(word_indexes)):
+            if word_indexes[el] > piece_length * k:
+                split_index.append(word_indexes[el])
+                break
+    split_index.append(len(transcript))
+    amount_of_chunks = math.ceil(len(transcript) / piece_length)
+    vtt_str = "WEBVTT FILE:\n\n"
+    for j in range(len(split_index) - 1):
+        seconds_start = round((duration / amount_of_chunks) * j, 2) + 0.85
+        seconds_end = round((duration / amount_of_chunks) * (j + 1), 2) + 0.85
+        output_start = (
+            str(math.floor(seconds_start / 60)).zfill(2)
+            + ":"
+            + ("%.3f" % (seconds_start % 60)).zfill(6)
+        )
+        output_end = (
+            str(math.floor(seconds_end / 60)).zfill(2)
+            + ":"
+            + ("%.3f" % (seconds_end % 60)).zfill(6)
+        )
+        vtt_str += f"00:{output_start} --> 00:{output_end}\n"
+        vtt_str += f"{transcript[split_index[j] : split_index[j + 1]]}\n\n"
+    return vtt_str
+
+
+def random_transcript(words: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    vocabulary = [
+        "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(n))
+        for n in [rng.randint(1, 12) for _ in range(2000)]
+    ]
+    return " ".join(rng.choice(vocabulary) for _ in range(words))
+
+
+def _time(fn) -> float:
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--words", type=int, nargs="+", default=[1000, 5000, 10000, 50000, 100000]
+    )
+    parser.add_argument("--legacy-max-words", type=int, default=10000)
+    args = parser.parse_args()
+    print(f"{'words':>8}{'legacy':>12}{'captions':>12}")
+    for words in args.words:
+        transcript = random_transcript(words)
+        # ~2.5 words per second of speech
+        duration = words / 2.5
+        new = _time(lambda: cues_to_vtt(transcript_to_cues(transcript, duration)))
+        if words <= args.legacy_max_words:
+            legacy = f"{_time(lambda: legacy_transcript_to_vtt(transcript, duration)):>11.3f}s"
+        else:
+            legacy = f"{'skipped':>12}"
+        print(f"{words:>8}{legacy}{new:>11.3f}s")
+
+
+if __name__ == "__main__":
+    main()
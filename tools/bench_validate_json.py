@@ -0,0 +1,70 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+"""
+Micro-benchmark of per-call json validation cost,
+jsonschema.validate (what validate_json used to call)
+vs. the cached validators in mentor_upload_process.helpers
+
+usage (from the repo root):
+
+    PYTHONPATH=mentor_upload_worker/src python tools/bench_validate_json.py [answers] [calls]
+"""
+import sys
+import timeit
+
+from jsonschema import validate
+
+from mentor_upload_process.api import import_mentor_gql_response_schema
+from mentor_upload_process.helpers import validate_json
+
+
+def _media(tag: str) -> dict:
+    return {
+        "url": f"videos/m/q/{tag}.mp4",
+        "type": "video",
+        "tag": tag,
+        "needsTransfer": True,
+    }
+
+
+def import_mentor_response(answers: int) -> dict:
+    return {
+        "data": {
+            "api": {
+                "mentorImport": {
+                    "answers": [
+                        {
+                            "hasUntransferredMedia": True,
+                            "question": {"_id": f"q{i}"},
+                            "webMedia": _media("web"),
+                            "mobileMedia": _media("mobile"),
+                            "vttMedia": None,
+                        }
+                        for i in range(answers)
+                    ]
+                }
+            }
+        }
+    }
+
+
+def main(answers: int = 100, calls: int = 50) -> None:
+    data = import_mentor_response(answers)
+    schema = import_mentor_gql_response_schema
+    cases = {
+        "jsonschema.validate": lambda: validate(instance=data, schema=schema),
+        "validate_json (cached)": lambda: validate_json(data, schema),
+        "validate_json (cached, fast)": lambda: validate_json(data, schema, fast=True),
+    }
+    print(f"import_mentor_gql_response_schema, {answers} answers, {calls} calls")
+    for name, fn in cases.items():
+        best = min(timeit.repeat(fn, number=calls, repeat=3)) / calls
+        print(f"{name:<32}{best * 1e6:>10.1f} us/call")
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:3]])
@@ -0,0 +1,173 @@
+#
+# This software is Copyright ©️ 2020 The University of Southern California. All Rights Reserved.
+# Permission to use, copy, modify, and distribute this software and its documentation for educational, research and non-profit purposes, without fee, and without a written agreement is hereby granted, provided that the above copyright notice and subject to the full license file found in the root of this software deliverable. Permission to make commercial use of this software may be obtained by contacting:  USC Stevens Center for Innovation University of Southern California 1150 S. Olive Street, Suite 2300, Los Angeles, CA 90115, USA Email: accounting@stevens.usc.edu
+#
+# The full terms of this copyright and license should always be found in the root directory of this software deliverable as "license.txt" and if these terms are not found with this software, please contact the USC Stevens Center for the full license.
+#
+"""
+Load test of concurrent slow uploads against a running upload api:
+every client trickles a video to POST /upload/answer over --seconds,
+while a probe pings /upload/ping to see if the api still answers.
+
+The form's body is deliberately invalid, so the api reads the whole upload
+(the slow part, which holds a sync worker) and answers 400
+without calling graphql, s3 or celery.
+Uploads are larger than what the kernel buffers for a connection
+the api hasn't read yet (the client's send buffer is kept small),
+otherwise over loopback they'd arrive as fast as the api reads them.
+
+usage (from the repo root, against e.g. a local gunicorn):
+
+    python tools/load_test_slow_uploads.py http://127.0.0.1:5000 --uploads 1,4,16,64
+"""
+import argparse
+from http.client import HTTPConnection
+import socket
+import statistics
+import threading
+import time
+from typing import List, Optional
+from urllib.parse import urlparse
+
+BOUNDARY = "load-test-boundary"
+
+
+def _multipart(size: int) -> bytes:
+    return (
+        (
+            f"--{BOUNDARY}\r\n"
+            'Content-Disposition: form-data; name="body"\r\n\r\n'
+            "{}\r\n"
+            f"--{BOUNDARY}\r\n"
+            'Content-Disposition: form-data; name="video"; filename="video.mp4"\r\n'
+            "Content-Type: video/mp4\r\n\r\n"
+        ).encode("utf-8")
+        + bytes(size)
+        + f"\r\n--{BOUNDARY}--\r\n".encode("utf-8")
+    )
+
+
+class Result:
+    def __init__(self):
+        self.status: Optional[int] = None
+        # seconds from sending the last byte to the response
+        self.wait: Optional[float] = None
+        self.error: Optional[str] = None
+
+
+def slow_upload(
+    host: str, port: int, body: bytes, seconds: float, timeout: float
+) -> Result:
+    result = Result()
+    chunks = 20
+    chunk_size = -(-len(body) // chunks)
+    try:
+        conn = HTTPConnection(host, port, timeout=timeout)
+        conn.connect()
+        conn.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 16 * 1024)
+        conn.putrequest("POST", "/upload/answer")
+        conn.putheader("Content-Type", f"multipart/form-data; boundary={BOUNDARY}")
+        conn.putheader("Content-Length", str(len(body)))
+        conn.endheaders()
+        for i in range(0, len(body), chunk_size):
+            conn.send(body[i : i + chunk_size])
+            time.sleep(seconds / chunks)
+        sent = time.monotonic()
+        res = conn.getresponse()
+        res.read()
+        result.status = res.status
+        result.wait = time.monotonic() - sent
+        conn.close()
+    except Exception as x:
+        result.error = type(x).__name__
+    return result
+
+
+def probe(host: str, port: int, stop: threading.Event, timeout: float) -> List:
+    """
+    Pings the api until stopped,
+    the latency of every ping or None when it failed
+    """
+    latencies: List[Optional[float]] = []
+    while not stop.is_set():
+        start = time.monotonic()
+        try:
+            conn = HTTPConnection(host, port, timeout=timeout)
+            conn.request("GET", "/upload/ping")
+            conn.getresponse().read()
+            conn.close()
+            latencies.append(time.monotonic() - start)
+        except Exception:
+            latencies.append(None)
+        stop.wait(0.25)
+    return latencies
+
+
+def run(url: str, uploads: int, size: int, seconds: float, timeout: float) -> None:
+    parsed = urlparse(url)
+    host, port = parsed.hostname, parsed.port or 80
+    body = _multipart(size)
+    results: List[Result] = []
+    pings: List = []
+    stop = threading.Event()
+    prober = threading.Thread(
+        target=lambda: pings.extend(probe(host, port, stop, timeout))
+    )
+    clients = [
+        threading.Thread(
+            target=lambda: results.append(
+                slow_upload(host, port, body, seconds, timeout)
+            )
+        )
+        for _ in range(uploads)
+    ]
+    start = time.monotonic()
+    prober.start()
+    for c in clients:
+        c.start()
+    for c in clients:
+        c.join()
+    elapsed = time.monotonic() - start
+    stop.set()
+    prober.join()
+    served = [r for r in results if r.status is not None]
+    waits = [r.wait for r in served]
+    ok_pings = [p for p in pings if p is not None]
+    print(
+        f"{uploads:>8}"
+        f"{len(served):>8}"
+        f"{len(results) - len(served):>8}"
+        f"{statistics.median(waits) if waits else 0:>12.2f}"
+        f"{max(waits) if waits else 0:>10.2f}"
+        f"{elapsed:>10.1f}"
+        f"{statistics.median(ok_pings) if ok_pings else 0:>12.3f}"
+        f"{max(ok_pings) if ok_pings else 0:>10.3f}"
+        f"{len(pings) - len(ok_pings):>8}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("url", help="base url of the api")
+    parser.add_argument(
+        "--uploads", default="1,4,16,64", help="concurrent uploads, comma separated"
+    )
+    parser.add_argument(
+        "--size", type=int, default=4 * 1024 * 1024, help="bytes/upload"
+    )
+    parser.add_argument(
+        "--seconds", type=float, default=5, help="seconds to send each upload"
+    )
+    parser.add_argument("--timeout", type=float, default=60, help="socket timeout")
+    args = parser.parse_args()
+    print(
+        f"{'uploads':>8}{'served':>8}{'failed':>8}"
+        f"{'wait p50 s':>12}{'max s':>10}{'total s':>10}"
+        f"{'ping p50 s':>12}{'max s':>10}{'failed':>8}"
+    )
+    for uploads in (int(u) for u in args.uploads.split(",")):
+        run(args.url, uploads, args.size, args.seconds, args.timeout)
+
+
+if __name__ == "__main__":
+    main()